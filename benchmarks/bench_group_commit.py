@@ -0,0 +1,58 @@
+'''Inserts per second of add_expense with and without group commit.
+
+Run from the repository root:
+
+    python benchmarks/bench_group_commit.py --inserts 2000 --concurrency 50
+'''
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+
+
+async def run(inserts, concurrency, **options):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Async_Database_Manager(os.path.join(tmp, "bench.db"), readers=1, **options)
+        remaining = iter(range(inserts))
+
+        # every worker is a chat sending messages one after the other
+        async def chat(chat_id):
+            for i in remaining:
+                await db.add_expense(chat_id, f"item {i}", i % 100, "bench")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(chat(chat_id) for chat_id in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        await db.close()
+        return inserts / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.005, help="group commit interval in seconds")
+    parser.add_argument("--batch", type=int, default=100, help="group commit size")
+    args = parser.parse_args()
+
+    before = asyncio.run(run(args.inserts, args.concurrency))
+    after = asyncio.run(run(args.inserts, args.concurrency, group_commit=True,
+                            commit_interval=args.interval, commit_batch=args.batch))
+
+    print(f"{args.inserts} inserts from {args.concurrency} concurrent chats")
+    print(f"  commit per insert: {before:10.0f} inserts/sec")
+    print(f"  group commit:      {after:10.0f} inserts/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
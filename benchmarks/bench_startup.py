@@ -0,0 +1,52 @@
+'''Cold start time of the bot, traced with python -X importtime.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --runs 5 --top 15
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+
+
+def trace(module):
+    '''[(self us, cumulative us, depth, name)] of every import made by `import module`'''
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=src_path, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(own), int(cumulative), depth, name.strip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module imported from src/bot")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [trace(args.module) for _ in range(args.runs)]
+    totals = [next(cumulative for _, cumulative, _, name in run if name == args.module) / 1000 for run in runs]
+    print(f"import {args.module}: median {statistics.median(totals):.1f}ms, "
+          f"min {min(totals):.1f}ms, max {max(totals):.1f}ms over {args.runs} runs")
+
+    fastest = runs[totals.index(min(totals))]
+    print("\nslowest direct imports of the fastest run (cumulative ms):")
+    children = sorted((entry for entry in fastest if entry[2] == 1), key=lambda entry: entry[1], reverse=True)
+    for own, cumulative, _, name in children[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
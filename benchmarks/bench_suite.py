@@ -0,0 +1,264 @@
+'''Query and handler latency of the bot on databases of 10k, 1M and 10M expenses.
+
+Every size is seeded once with services.randomData (the same seed always gives
+the same database) and kept in --data-dir for the next runs. Each case is run
+--iterations times and reported as p50/p99 latency and operations per second.
+
+Run from the repository root:
+
+    python benchmarks/bench_suite.py --sizes 10k,1m --save before
+    python benchmarks/bench_suite.py --sizes 10k,1m --compare before
+
+--save writes the results to benchmarks/baselines/<name>.json, --compare prints
+how much slower or faster every case is than a saved baseline.
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from bot_logic.telegramBot import MoneyMate
+from services.asyncDatabase import Async_Database_Manager
+from services.databaseManager import Database_Manager, period_bounds
+import services.randomData as simulation
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+class Fake_Message():
+    '''Just enough of telegram.Message for the handlers, replies are counted instead of sent'''
+
+    def __init__(self, text):
+        self.text = text
+        self.replies = 0
+
+    async def reply_text(self, text=None, **kwargs):
+        self.replies += 1
+        return self
+
+    async def edit_text(self, text=None, **kwargs):
+        return self
+
+
+class Fake_Chat():
+
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class Fake_Update():
+
+    def __init__(self, chat_id, text):
+        self.effective_chat = Fake_Chat(chat_id)
+        self.message = Fake_Message(text)
+
+
+class Fake_Context():
+
+    def __init__(self, *args):
+        self.args = list(args)
+
+
+def seed(path, rows, chats, seed_value):
+    '''A database of rows random expenses spread over chats, with a budget per category'''
+    db = Database_Manager(path)
+    try:
+        for chat_id in range(1, chats + 1):
+            simulation.random_spents(db, chat_id, rows // chats, seed=seed_value + chat_id)
+            for category, (_, median, _, _) in simulation.CATEGORIES.items():
+                db.set_budget(chat_id, category, median * 40)
+    finally:
+        db.close()
+
+
+def seeded(data_dir, label, chats, seed_value):
+    path = os.path.join(data_dir, f"seed_{label}_{chats}_{seed_value}.db")
+    if not os.path.exists(path):
+        print(f"seeding {label} expenses into {path}...", flush=True)
+        start = time.perf_counter()
+        seed(path + ".tmp", SIZES[label], chats, seed_value)
+        os.replace(path + ".tmp", path)
+        print(f"  seeded in {time.perf_counter() - start:.1f}s", flush=True)
+    return path
+
+
+def summary(timings):
+    '''p50/p99 in milliseconds and operations per second of a list of durations in seconds'''
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return {"p50_ms": statistics.median(timings) * 1000, "p99_ms": p99 * 1000,
+            "ops": len(timings) / sum(timings) if sum(timings) else float("inf")}
+
+
+def months(rng, count):
+    '''count random (year, month) pairs inside the seeded date range'''
+    today = date.today()
+    first = 2023 * 12
+    last = today.year * 12 + today.month - 1
+    return [divmod(rng.randint(first, last), 12) for _ in range(count)]
+
+
+def query_cases(db, chat_id, rng, iterations):
+    '''{name: (setup, call)} of the Database_Manager calls, every call gets its own random arguments.
+
+    setup(i) runs before call(i) and isn't timed, it's None for the calls that need none.
+    '''
+    categories = list(simulation.CATEGORIES)
+    periods = [(year, month + 1) for year, month in months(rng, iterations)]
+    # the first letters of the seeded items, as typed into /search
+    prefixes = [item[:3] for category in simulation.CATEGORIES.values() for item in category[3]]
+
+    return {
+        "month expenses": (None, lambda i: db.get_expenses_by_month_year(chat_id, *periods[i])),
+        "first page": (None, lambda i: db.get_expenses_page(chat_id, *period_bounds(*periods[i]))),
+        "month totals": (None, lambda i: db.get_period_totals(chat_id, *period_bounds(*periods[i]))),
+        "year totals": (None, lambda i: db.get_period_totals(chat_id, *period_bounds(periods[i][0]), "month")),
+        "category sum": (None, lambda i: db.get_total_spents(chat_id, categories[i % len(categories)])),
+        "month total": (None, lambda i: db.get_month_total(chat_id, categories[i % len(categories)], *periods[i])),
+        "budget check": (None, lambda i: db.get_budgets_status(chat_id, categories, *periods[i])),
+        "search": (None, lambda i: db.search_expenses(chat_id, [prefixes[i % len(prefixes)]])),
+        "undo": (lambda i: db.add_expense(chat_id, "bench", 1, "misc"), lambda i: db.delete_last_expense(chat_id)),
+    }
+
+
+def run_queries(path, chats, iterations, rng):
+    db = Database_Manager(path)
+    results = {}
+    try:
+        for name, (setup, call) in query_cases(db, rng.randint(1, chats), rng, iterations).items():
+            timings = []
+            for i in range(iterations):
+                if setup:
+                    setup(i)
+                start = time.perf_counter()
+                call(i)
+                timings.append(time.perf_counter() - start)
+            results[f"query: {name}"] = summary(timings)
+    finally:
+        db.close()
+    return results
+
+
+async def run_handlers(path, chats, iterations, rng):
+    db = Async_Database_Manager(path, readers=4)
+    money_mate = MoneyMate(db)
+    # a message splits its fields on spaces and commas, so only the one word categories are used
+    categories = [category for category in simulation.CATEGORIES if " " not in category]
+    periods = [(str(month + 1), str(year)) for year, month in months(rng, iterations)]
+    chat_id = rng.randint(1, chats)
+
+    cases = {
+        "add_spending": lambda i: money_mate.add_spending(
+            Fake_Update(chat_id, f"Bench {i}, {i % 50 + 1}, {categories[i % len(categories)]}"), Fake_Context()),
+        "add_spending receipt": lambda i: money_mate.add_spending(
+            Fake_Update(chat_id, "\n".join(f"Bench {i} {line}, 2, {categories[line]}" for line in range(5))),
+            Fake_Context()),
+        "spent month": lambda i: money_mate.spent(Fake_Update(chat_id, "/spent"), Fake_Context(*periods[i])),
+        "total month": lambda i: money_mate.total(Fake_Update(chat_id, "/total"), Fake_Context(*periods[i])),
+        "total year": lambda i: money_mate.total(Fake_Update(chat_id, "/total"), Fake_Context(periods[i][1])),
+        "budgets": lambda i: money_mate.budgets(Fake_Update(chat_id, "/budgets"), Fake_Context()),
+        "undo": lambda i: money_mate.undo(Fake_Update(chat_id, "/undo"), Fake_Context()),
+    }
+
+    results = {}
+    try:
+        for name, case in cases.items():
+            timings = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                await case(i)
+                timings.append(time.perf_counter() - start)
+            results[f"handler: {name}"] = summary(timings)
+    finally:
+        await db.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    print(f"\ncompared with the baseline of {baseline['meta']['date']} (ratio of p50 / p99, >1 is slower):")
+    regressions = 0
+    for label, cases in results.items():
+        for name, now in cases.items():
+            before = baseline["results"].get(label, {}).get(name)
+            if before is None:
+                continue
+            p50 = now["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+            p99 = now["p99_ms"] / before["p99_ms"] if before["p99_ms"] else float("inf")
+            flag = "  <-- slower" if p50 > tolerance else ""
+            regressions += bool(flag)
+            print(f"  {label:>5} {name:28} {p50:6.2f}x {p99:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,1m", help=f"comma separated, of {', '.join(SIZES)}")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=10, help="chats the seeded expenses are spread over")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "moneymate-bench"),
+                        help="where the seeded databases are kept between runs")
+    parser.add_argument("--save", metavar="NAME", help="save the results as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with benchmarks/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="p50 ratio reported as a regression")
+    args = parser.parse_args()
+
+    labels = [label.strip().lower() for label in args.sizes.split(",")]
+    unknown = [label for label in labels if label not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes {unknown}, use {', '.join(SIZES)}")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {}
+    for label in labels:
+        rng = random.Random(args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            # the writes of the run go to a copy, the seeded database is reused as it is
+            path = os.path.join(tmp, "bench.db")
+            shutil.copy(seeded(args.data_dir, label, args.chats, args.seed), path)
+            results[label] = run_queries(path, args.chats, args.iterations, rng)
+            results[label].update(asyncio.run(run_handlers(path, args.chats, args.iterations, rng)))
+
+        print(f"\n{label} expenses, {args.iterations} iterations:")
+        print(f"  {'case':36} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>10}")
+        for name, stats in results[label].items():
+            print(f"  {name:36} {stats['p50_ms']:9.3f} {stats['p99_ms']:9.3f} {stats['ops']:10.0f}")
+
+    regressions = 0
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json")) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        baseline = {
+            "meta": {"date": date.today().isoformat(), "python": platform.python_version(),
+                     "sqlite": sqlite3.sqlite_version, "machine": platform.machine(),
+                     "iterations": args.iterations, "chats": args.chats, "seed": args.seed},
+            "results": results,
+        }
+        with open(os.path.join(BASELINES, f"{args.save}.json"), "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nsaved the baseline {args.save}")
+
+    # a failing exit code, so a regression can stop a script running the suite
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
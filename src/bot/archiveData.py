@@ -0,0 +1,44 @@
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+from services.databaseManager import Database_Manager
+from services.instanceLock import database_lock
+
+load_dotenv()
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    handlers=[logging.StreamHandler()] # To console
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move the expenses of closed years to the archive database")
+    parser.add_argument("--database", default=os.getenv("database_name"), help="defaults to database_name in .env")
+    parser.add_argument("--before", help="ISO date, the expenses dated before it are archived. "
+                                         "Defaults to the first day of this year")
+    args = parser.parse_args()
+
+    if not args.database:
+        parser.error("no database, set database_name in .env or use --database")
+
+    # the bot caches what it read, it has to be stopped while the database is changed under it
+    try:
+        lock = database_lock(args.database).acquire()
+    except RuntimeError as e:
+        raise SystemExit(f"{e}, stop the bot first")
+    model = Database_Manager(db_name=args.database)
+    try:
+        moved = model.archive_closed_years(args.before)
+    finally:
+        model.close()
+        lock.release()
+
+    if moved is None:
+        raise SystemExit("The archival failed, nothing was moved")
+    logger.info(f"Done, {moved:,} expenses moved to {model.archive_name}")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,65 @@
+import asyncio
 import logging
-import pandas as pd
-import numpy as np
+import os
+import tempfile
+import time
 from datetime import date
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 import services.auxFunctions as aux
-#from services.googleSheets import WorkSheet
+import services.bulkExport as exporter
+import services.bulkImport as importer
+from services.charts import Charts
+from services.databaseManager import JOURNAL_DAYS
+from services.messageFormatter import MESSAGE_LIMIT, Expenses_Formatter
+from services.metrics import METRICS
+from services.reports import Reports
 
 logger = logging.getLogger(__name__)
 
+# expenses listed in each page of /spent
+PAGE_SIZE = 20
+
+# most expenses /simulate can add in one go, they hold the only writer meanwhile. simulate.py loads more
+MAX_SIMULATED = 100_000
+
+# seconds between progress messages of an import, telegram limits how often a message can be edited
+PROGRESS_INTERVAL = 2
+
+# biggest document a bot can send, larger exports have to be made with exportData.py
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+# most changes /undo or /redo revert in one go
+MAX_UNDO_STEPS = 50
+
+# slowest sql statements listed by /stats
+STATS_STATEMENTS = 10
+
 class MoneyMate():
 
-    def __init__(self, db_manager):
-        # creates the object database manager
+    def __init__(self, db_manager, admins=(), charts_dir=None):
+        # the async database manager, every call to it has to be awaited
         self.model= db_manager
-        #self.worksheet = WorkSheet()
+        self.reports = Reports(db_manager)
+        # the charts are only valid for the database they were drawn from, main keeps them next to it
+        self.charts = Charts(db_manager, charts_dir or os.path.join(tempfile.gettempdir(), "moneymate-charts"))
+        # made by the first /forecast, it follows the writes from then on
+        self.forecaster = None
+        # chats allowed to use the admin commands, like /stats
+        self.admins = set(admins)
 
-    async def clear(self):
-        self.model.clear_expenses()
+    async def clear(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.model.clear_all_expenses(update.effective_chat.id)
+        await update.message.reply_text("All expenses deleted")
+        return
 
     async def add_spending(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         
+        if "\n" in update.message.text.strip():
+            # a pasted receipt, one expense per line
+            return await self.add_spendings(update, context)
+
         data = update.message.text.split(" ")
         # get spent like this [spent, amount, category], or error number
         spent = aux.get_spent(data)
@@ -33,8 +72,11 @@ class MoneyMate():
             await update.message.reply_text(f"🚫 Invalid format 🚫\nAmount must be a number")
             return None
 
-        budget = self.model.get_budget(spent.category) # get the budget
-        spents = self.model.get_total_spents(spent.category) # get all the spents
+        today = date.today()
+        chat_id = update.effective_chat.id # every chat keeps its own expenses and budgets
+        budget = await self.model.get_budget(chat_id, spent.category) # get the budget
+        # budgets are monthly, so only this month's spents count against it
+        spents = await self.model.get_month_total(chat_id, spent.category, today.year, today.month)
         
         budget = aux.check_budget(budget, spents, spent.amount)
         # it returns an error code or the category budget (if budget exists)
@@ -43,12 +85,12 @@ class MoneyMate():
             await update.message.reply_text(text="🚫 You went over the budget 🚫")
             return
             
-        self.model.add_expense(spent.item, spent.amount, spent.category)
-        
-        # self.worksheet.sheet_add(spent)
+        if not await self.model.add_expense(chat_id, spent.item, spent.amount, spent.category):
+            await update.message.reply_text(text="🚫 The expense couldn't be saved, try again 🚫")
+            return
         
         await update.message.reply_text(
-            text=f"💸  Spent  💸\n\n \t\t📅  {date.today()}\n \t\t📦  {spent.item.capitalize()}\n \t\t💰  ${spent.amount:,.2f}\n \t\t📝  {spent.category.capitalize()}\n\n ✅  Added successfully  ✅")
+            text=f"💸  Spent  💸\n\n \t\t📅  {today}\n \t\t📦  {spent.item.capitalize()}\n \t\t💰  ${spent.amount:,.2f}\n \t\t📝  {spent.category.capitalize()}\n\n ✅  Added successfully  ✅")
         
         if budget == 1:
                 await update.message.reply_text(text="There isn't a budget set for this category")  
@@ -58,6 +100,49 @@ class MoneyMate():
             
         return
 
+    async def add_spendings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''Adds every line of the message as an expense, all of them or none'''
+        spents, errors = aux.get_spents(update.message.text)
+
+        if errors:
+            lines = "\n".join(
+                f"Line {number}: {'amount must be a number' if error == 1 else 'use product, spent, category'}"
+                for number, error in errors)
+            await update.message.reply_text(f"🚫 Invalid format 🚫\nNothing was added\n\n{lines}")
+            return None
+
+        # what every category gets from this message, checked against its budget all at once
+        totals = {}
+        for spent in spents:
+            totals[spent.category] = totals.get(spent.category, 0) + spent.amount
+
+        today = date.today()
+        chat_id = update.effective_chat.id
+        status = await self.model.get_budgets_status(chat_id, totals, today.year, today.month)
+        remaining = {}
+        for category, amount in totals.items():
+            budget, spents_total = status.get(category, (None, 0))
+            if aux.check_budget(budget, spents_total, amount) == 0:
+                await update.message.reply_text(text=f"🚫 You went over the budget for {category} 🚫\nNothing was added")
+                return
+            if budget is not None:
+                remaining[category] = budget - spents_total - amount
+
+        added = await self.model.add_expenses(
+            chat_id, [(spent.item, spent.amount, spent.category, today.isoformat()) for spent in spents])
+        if not added:
+            await update.message.reply_text(text="🚫 The expenses couldn't be saved, try again 🚫")
+            return
+
+        lines = "\n".join(
+            f" \t\t📦  {spent.item.capitalize()}  ${spent.amount:,.2f}  📝 {spent.category.capitalize()}" for spent in spents)
+        text = f"💸  {len(spents)} Spents  💸\n\n \t\t📅  {today}\n{lines}\n\n \t\t💰  Total ${sum(totals.values()):,.2f}\n\n"
+        for category, amount in remaining.items():
+            text += f"Your remaining budget for {category} is ${amount:,.2f}\n"
+
+        await update.message.reply_text(text=text + "\n ✅  Added successfully  ✅")
+        return
+
     async def unknown(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             text="Sorry, I didn't understand that command.")
@@ -65,46 +150,214 @@ class MoneyMate():
 
     async def spent(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
-        Calculate balance for given time period.
-        Supports querying by: month, year, specific date, or month-year combination.
+        List the expenses of a time period, a page at a time.
+        Supports querying by: today, month, year, specific date, or month-year combination.
         """
-        months = {
-            str(i): month for i, month in enumerate([
-                "January", "February", "March", "April", "May", "June",
-                "July", "August", "September", "October", "November", "December"
-            ], 1)
-        }
         try:
-            day, month, year = aux.parse_date_args(tuple(context.args)) # returns day, month, year
+            start, end, title = aux.get_period(tuple(context.args))
+        except ValueError as e:
+            await update.message.reply_text(str(e))
+            return
 
-            if day and month and year:
-                spent = self.model.get_expenses_by_day_month_year(year, month, day)
-                title = f"Spent on {day}/{month}/{year}"
-            else:
-                spent = self.model.get_expenses_today()
-                title = "Spent today"
+        text, buttons = await self._spent_page(update.effective_chat.id, start, end, title)
+        await update.message.reply_text(text=text, reply_markup=buttons)
+        return
 
-            spent = pd.DataFrame(spent, columns=['id', 'item', 'amount', 'category', 'date'])
-            
-            spents = pd.DataFrame.to_json(spent)
+    async def spent_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''The previous/next buttons of /spent, their callback data carries the page cursor'''
+        query = update.callback_query
+        await query.answer()
 
-            await update.message.reply_text(
-                text=spents)
+        start, end, direction, cursor = aux.parse_page_callback(query.data)
+        # the buttons only page through the expenses of the chat they were sent to
+        chat_id = update.effective_chat.id
+        if direction == "n":
+            text, buttons = await self._spent_page(chat_id, start, end, aux.period_title(start, end), after=cursor)
+        else:
+            text, buttons = await self._spent_page(chat_id, start, end, aux.period_title(start, end), before=cursor)
+        await query.edit_message_text(text=text, reply_markup=buttons)
+        return
+
+    async def _spent_page(self, chat_id, start, end, title, after=None, before=None):
+        rows, has_previous, has_next = await self.model.get_expenses_page(
+            chat_id, start, end, after=after, before=before, limit=PAGE_SIZE)
+
+        formatter = Expenses_Formatter(f"Spent {title}")
+        # the formatter shortens long items, so a page always fits a single message
+        formatter.add(rows)
+        if rows:
+            text = formatter.close(footer=f"💰 ${formatter.total:,.2f} in the {formatter.count} expenses of this page")[-1]
+        else:
+            text = formatter.close()[-1]
+
+        buttons = []
+        if rows and has_previous:
+            buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=aux.page_callback(
+                start, end, "p", (rows[0][4], rows[0][0]))))
+        if rows and has_next:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=aux.page_callback(
+                start, end, "n", (rows[-1][4], rows[-1][0]))))
+        return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/search words [#category] [day] [month] [year], the expenses whose items match, best match first'''
+        try:
+            search = aux.parse_search(context.args)
+        except ValueError as e:
+            await update.message.reply_text(str(e))
             return
 
+        text, buttons = await self._search_page(update.effective_chat.id, *search, offset=0)
+        # sent as a reply to the /search, the page buttons read the search back from it
+        await update.message.reply_text(text=text, reply_markup=buttons, do_quote=True)
+        return
+
+    async def search_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''The previous/next buttons of /search, "search:<offset>" on the reply to the /search message'''
+        query = update.callback_query
+        await query.answer()
+
+        asked = query.message.reply_to_message
+        if asked is None or not asked.text:
+            await query.edit_message_text(text="The search was deleted, send /search again")
+            return
+        try:
+            search = aux.parse_search(asked.text.split()[1:])
+        except ValueError as e:
+            await query.edit_message_text(text=str(e))
+            return
+
+        offset = int(query.data.split(":")[1])
+        text, buttons = await self._search_page(update.effective_chat.id, *search, offset=offset)
+        await query.edit_message_text(text=text, reply_markup=buttons)
+        return
+
+    async def _search_page(self, chat_id, words, category, start, end, title, offset):
+        rows, has_next = await self.model.search_expenses(
+            chat_id, words, category, start, end, offset=offset, limit=PAGE_SIZE)
+
+        # ranked by relevance, so the page is numbered instead of using a date cursor
+        formatter = Expenses_Formatter(f"Search {title}")
+        formatter.add(rows)
+        if rows:
+            text = formatter.close(footer=f"🔎 Matches {offset + 1}-{offset + len(rows)}")[-1]
+        else:
+            text = formatter.close(footer="🔎 Nothing found")[-1]
+
+        buttons = []
+        if offset:
+            buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search:{max(0, offset - PAGE_SIZE)}"))
+        if has_next:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"search:{offset + PAGE_SIZE}"))
+        return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    async def total(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/total [day] [month] [year], what was spent in a period by category and by day'''
+        try:
+            start, end, title = aux.get_period(tuple(context.args))
         except ValueError as e:
             await update.message.reply_text(str(e))
             return
-        except Exception as e:
+
+        await update.message.reply_text(text=await self.reports.total(update.effective_chat.id, start, end, title))
+        return
+
+    async def forecast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/forecast, where every category ends the month at the current pace and when its budget runs out'''
+        # numpy is only needed here, so it isn't imported when the bot starts
+        from services.forecast import Forecaster, render_forecast
+        if self.forecaster is None:
+            self.forecaster = Forecaster(self.model)
+
+        today = date.today()
+        forecasts = await self.forecaster.forecast(update.effective_chat.id, today)
+        await update.message.reply_text(text=render_forecast(forecasts, today))
+        return
+
+    async def chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/chart [day] [month] [year], a picture of the spending of a period by category and over time, this month by default'''
+        today = date.today()
+        try:
+            start, end, title = aux.get_period(tuple(context.args or (str(today.month), str(today.year))))
+            chart = await self.charts.chart(update.effective_chat.id, start, end)
+        except ValueError as e:
             await update.message.reply_text(str(e))
-            #await update.message.reply_text("An error occurred while calculating your balance.")
+            return
+        if chart is None:
+            await update.message.reply_text(f"No expenses {title} to chart")
             return
 
-    async def delete_spending(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        self.model.delete_last_expense()
-        await update.message.reply_text("Last expense deleted")
+        path, file_id = chart
+        caption = f"📊  Spent {title}"
+        if file_id is not None:
+            try:
+                # already on telegram's servers, nothing is uploaded
+                await update.message.reply_photo(photo=file_id, caption=caption)
+                return
+            except BadRequest as e:
+                logger.warning(f"Sending the chart {path} by its file_id failed, uploading it again: {e}")
+                self.charts.sent(path, None)
+
+        with open(path, "rb") as f:
+            message = await update.message.reply_photo(photo=f, caption=caption)
+        self.charts.sent(path, message.photo[-1].file_id)
         return
 
+    def _steps(self, context):
+        '''The number of changes asked to /undo or /redo, 1 by default'''
+        if not context.args:
+            return 1
+        steps = int(context.args[0])
+        if not 1 <= steps <= MAX_UNDO_STEPS:
+            raise ValueError
+        return steps
+
+    async def undo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/undo [steps], reverts the last changes of the chat: expenses, budgets, clears or restores'''
+        try:
+            steps = self._steps(context)
+        except ValueError:
+            await update.message.reply_text(f"Format: /undo [steps], between 1 and {MAX_UNDO_STEPS}")
+            return
+
+        undone = await self.model.undo(update.effective_chat.id, steps)
+        if not undone:
+            await update.message.reply_text("Nothing to undo")
+            return
+        await update.message.reply_text(f"↩️ Undone: {', '.join(undone)}")
+
+    async def redo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/redo [steps], applies again what /undo reverted, until something new is changed'''
+        try:
+            steps = self._steps(context)
+        except ValueError:
+            await update.message.reply_text(f"Format: /redo [steps], between 1 and {MAX_UNDO_STEPS}")
+            return
+
+        redone = await self.model.redo(update.effective_chat.id, steps)
+        if not redone:
+            await update.message.reply_text("Nothing to redo")
+            return
+        await update.message.reply_text(f"↪️ Redone: {', '.join(redone)}")
+
+    async def restore(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/restore day month year [HH:MM], brings the expenses and budgets back to how they were then'''
+        try:
+            moment = aux.parse_moment(context.args)
+        except ValueError as e:
+            await update.message.reply_text(str(e))
+            return
+
+        result = await self.model.restore_expenses(update.effective_chat.id, moment)
+        if result is None:
+            await update.message.reply_text(
+                f"The expenses couldn't be restored, the changes of the last {JOURNAL_DAYS} days can be")
+            return
+        removed, added = result
+        await update.message.reply_text(
+            f"⏪ Restored to {moment:%d/%m/%Y %H:%M}: {removed} expenses removed, {added} brought back.\n"
+            f"Use /undo to go back")
+
     async def category_budget(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         '/budget [category] [budget]'
 
@@ -114,7 +367,7 @@ class MoneyMate():
             category, budget = message
 
             if (int(budget) >= 0):
-                self.model.set_budget(category, int(budget))
+                await self.model.set_budget(update.effective_chat.id, category, int(budget))
 
                 await update.message.reply_text(f"Budget correctly allocated  📊\n\nOn this month you only can spend ${budget} in {category}")
             else:
@@ -123,13 +376,158 @@ class MoneyMate():
             await update.message.reply_text("Format not valid for a budget, try /budget [category] [budget]")
 
     async def categories(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        categories = self.model.get_categories(self.model)
+        categories = await self.model.get_categories(update.effective_chat.id)
 
-        await update.message.reply_text(text=f"{categories.__str__}")
+        await update.message.reply_text(text=f"{categories}")
         return
 
     async def budgets(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        budgets_list = self.model.get_budgets()
+        budgets_list = await self.model.get_budgets(update.effective_chat.id)
 
         await update.message.reply_text(text=f"{budgets_list}")
-        return
\ No newline at end of file
+        return
+
+    async def import_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/import as the caption of a csv or json lines document, or replying to one'''
+        message = update.message
+        document = message.document
+        if document is None and message.reply_to_message:
+            document = message.reply_to_message.document
+
+        if document is None:
+            await message.reply_text(
+                "Send a .csv (with an item,amount,category,date header) or a .jsonl file with /import as its caption")
+            return
+
+        file_format = importer.guess_format(document.file_name or "")
+        if file_format is None:
+            await message.reply_text("🚫 Only .csv and .jsonl files can be imported 🚫")
+            return
+
+        status = await message.reply_text("📥 Importing...")
+        progress, edits = self._progress_editor(status, "📥 Importing... {:,} expenses so far")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # the file is streamed from disk, never loaded whole in memory
+            path = os.path.join(tmp, "import")
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            try:
+                added = await self.model.run_in_writer(
+                    importer.import_expenses, update.effective_chat.id, path, file_format, importer.CHUNK_SIZE, progress)
+                text = f"✅ Imported {added:,} expenses"
+            except (ValueError, UnicodeDecodeError) as e:
+                text = f"🚫 Import failed, nothing was added 🚫\n{e}"
+
+        await asyncio.gather(*(asyncio.wrap_future(edit) for edit in edits), return_exceptions=True)
+        await status.edit_text(text)
+        return
+
+    async def export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/export [day] [month] [year] [csv|jsonl|parquet], the expenses of a period, all of them by default, as a file'''
+        args = list(context.args)
+        file_format = args.pop().lower() if args and args[-1].lower() in exporter.FORMATS else "csv"
+        try:
+            start, end, title = aux.get_period(tuple(args)) if args else (*exporter.ALL_TIME, "of all time")
+        except ValueError as e:
+            await update.message.reply_text(str(e))
+            return
+
+        status = await update.message.reply_text("📤 Exporting...")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"expenses.{file_format}")
+            try:
+                writer = await asyncio.to_thread(exporter.Expenses_Writer, path, file_format)
+            except ValueError as e:
+                await status.edit_text(f"🚫 {e}")
+                return
+            try:
+                # one batch at a time from a reader connection, written off the event loop
+                async for batch in self.model.stream(
+                        'iter_expenses_between', update.effective_chat.id, start, end, exporter.BATCH_SIZE):
+                    await asyncio.to_thread(writer.write, batch)
+            finally:
+                await asyncio.to_thread(writer.close)
+
+            if not writer.written:
+                await status.edit_text(f"No expenses {title} to export")
+                return
+            if os.path.getsize(path) > MAX_DOCUMENT_SIZE:
+                await status.edit_text("🚫 The export is too big to be sent, try a shorter period or parquet 🚫")
+                return
+            name = f"expenses_{start}_{end}" if args else "expenses"
+            with open(path, "rb") as document:
+                await update.message.reply_document(document=document, filename=f"{name}.{file_format}")
+
+        await status.edit_text(f"✅ Exported {writer.written:,} expenses {title}")
+        return
+
+    async def random_spents(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/simulate [rows] [seed], fills the database with random expenses, only for the admins'''
+        if update.effective_chat.id not in self.admins:
+            return await self.unknown(update, context)
+        try:
+            rows = int(context.args[0]) if context.args else 1000
+            seed = int(context.args[1]) if len(context.args) > 1 else 42
+        except ValueError:
+            await update.message.reply_text("Format not valid, try /simulate [rows] [seed]")
+            return
+        if not 1 <= rows <= MAX_SIMULATED:
+            await update.message.reply_text(
+                f"Rows must be between 1 and {MAX_SIMULATED:,}, use simulate.py from the terminal for more")
+            return
+
+        # numpy is only needed here, so it isn't imported when the bot starts
+        import services.randomData as simulation
+
+        status = await update.message.reply_text(f"🎲 Simulating {rows:,} expenses...")
+        progress, edits = self._progress_editor(status, "🎲 Simulating... {:,} expenses so far")
+
+        added = await self.model.run_in_writer(
+            simulation.random_spents, update.effective_chat.id, rows, seed, simulation.CHUNK_SIZE, progress)
+
+        await asyncio.gather(*(asyncio.wrap_future(edit) for edit in edits), return_exceptions=True)
+        await status.edit_text(f"✅ Simulated {added:,} expenses (seed {seed})")
+        return
+
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        '''/stats, latency of the handlers and the slowest sql statements, only for the admins'''
+        if update.effective_chat.id not in self.admins:
+            return await self.unknown(update, context)
+
+        text = "📈  Stats  📈\n\nHandlers (calls, p50, p99, errors):"
+        handlers = METRICS.snapshot("handler")
+        for name, (count, _, p50, p99, errors) in sorted(handlers.items(), key=lambda item: -item[1][0]):
+            text += f"\n {name}  {count}  {p50 * 1000:g}ms  {p99 * 1000:g}ms  {errors}"
+
+        text += "\n\nSlowest sql by total time (calls, total, p99, errors):"
+        statements = sorted(METRICS.snapshot("sql").items(), key=lambda item: -item[1][1])
+        for statement, (count, total, _, p99, errors) in statements[:STATS_STATEMENTS]:
+            text += f"\n {statement[:60]}  {count}  {total * 1000:,.1f}ms  {p99 * 1000:g}ms  {errors}"
+
+        if hasattr(self.model, "stats"):
+            # the read-through cache, when it's on
+            counts = self.model.stats().values()
+            hits, misses = sum(hit for hit, _ in counts), sum(miss for _, miss in counts)
+            text += f"\n\nCache: {hits} hits, {misses} misses"
+
+        await update.message.reply_text(text=text[:MESSAGE_LIMIT])
+        return
+
+    def _progress_editor(self, status, text):
+        '''A progress callback for jobs running on the database writer thread.
+
+        It edits the status message with text.format(done) at most every
+        PROGRESS_INTERVAL seconds, the pending edits are collected in the returned list.
+        '''
+        loop = asyncio.get_running_loop()
+        edits = []
+        last_edit = time.monotonic()
+
+        def progress(done):
+            nonlocal last_edit
+            if time.monotonic() - last_edit >= PROGRESS_INTERVAL:
+                last_edit = time.monotonic()
+                edits.append(asyncio.run_coroutine_threadsafe(status.edit_text(text.format(done)), loop))
+
+        return progress, edits
@@ -0,0 +1,49 @@
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+from services.databaseManager import Database_Manager
+import services.bulkExport as exporter
+
+load_dotenv()
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    handlers=[logging.StreamHandler()] # To console
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the expenses of a chat to a csv, json lines or parquet file")
+    parser.add_argument("file", help="where the expenses are written")
+    parser.add_argument("--format", choices=exporter.FORMATS, help="taken from the extension by default")
+    parser.add_argument("--database", default=os.getenv("database_name"), help="defaults to database_name in .env")
+    parser.add_argument("--chat-id", type=int, default=int(os.getenv("legacy_chat_id", "0")),
+                        help="telegram chat the expenses belong to, defaults to legacy_chat_id in .env or 0")
+    parser.add_argument("--start", default=exporter.ALL_TIME[0], help="first ISO date exported")
+    parser.add_argument("--end", default=exporter.ALL_TIME[1], help="ISO date after the last one exported")
+    parser.add_argument("--batch-size", type=int, default=exporter.BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or args.file.rsplit(".", 1)[-1].lower()
+    if file_format not in exporter.FORMATS:
+        parser.error("can't tell the format from the file name, use --format")
+    if not args.database:
+        parser.error("no database, set database_name in .env or use --database")
+
+    # only reads, it can run next to the bot
+    model = Database_Manager(db_name=args.database, read_only=True)
+    try:
+        exported = exporter.export_expenses(
+            model, args.chat_id, args.file, file_format, args.start, args.end, args.batch_size,
+            progress=lambda written: logger.info(f"{written:,} expenses exported so far"))
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        model.close()
+
+    logger.info(f"Done, {exported:,} expenses exported to {args.file}")
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,57 @@
-from telegram.ext import CommandHandler, MessageHandler, filters
+from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, filters
+from services.metrics import timed
 # this helps to know what the bot is doing, and if there are any errors
 
 def registerHandlers(application, money_mate):
+    # every callback is timed, its latency and errors are kept in services.metrics
 
-    create_df = CommandHandler('simulate', money_mate.random_spents)
-    clear_df = CommandHandler('restart', money_mate.clear)
-    spendings_handler = CommandHandler('add', money_mate.add_spending)
-    spent = CommandHandler('spent', money_mate.spent)
-    delete_handler = CommandHandler('undo', money_mate.delete_spending)
-    budget_handler = CommandHandler('budget', money_mate.category_budget)
-    budgets_handler = CommandHandler('budgets', money_mate.budgets)
-    categ_handler = CommandHandler('categories', money_mate.categories)
+    create_df = CommandHandler('simulate', timed('/simulate', money_mate.random_spents))
+    clear_df = CommandHandler('restart', timed('/restart', money_mate.clear))
+    spendings_handler = CommandHandler('add', timed('/add', money_mate.add_spending))
+    spent = CommandHandler('spent', timed('/spent', money_mate.spent))
+    total_handler = CommandHandler('total', timed('/total', money_mate.total))
+    chart_handler = CommandHandler('chart', timed('/chart', money_mate.chart))
+    spent_page = CallbackQueryHandler(timed('spent page', money_mate.spent_page), pattern=r'^spent:')
+    search_handler = CommandHandler('search', timed('/search', money_mate.search))
+    search_page = CallbackQueryHandler(timed('search page', money_mate.search_page), pattern=r'^search:')
+    undo_handler = CommandHandler('undo', timed('/undo', money_mate.undo))
+    redo_handler = CommandHandler('redo', timed('/redo', money_mate.redo))
+    restore_handler = CommandHandler('restore', timed('/restore', money_mate.restore))
+    budget_handler = CommandHandler('budget', timed('/budget', money_mate.category_budget))
+    budgets_handler = CommandHandler('budgets', timed('/budgets', money_mate.budgets))
+    forecast_handler = CommandHandler('forecast', timed('/forecast', money_mate.forecast))
+    categ_handler = CommandHandler('categories', timed('/categories', money_mate.categories))
+    stats_handler = CommandHandler('stats', timed('/stats', money_mate.stats))
+    export_handler = CommandHandler('export', timed('/export', money_mate.export))
+    import_handler = CommandHandler('import', timed('/import', money_mate.import_file))
+    # documents sent with /import as their caption
+    import_document_handler = MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r'^/import'), timed('/import', money_mate.import_file))
     # this should be at the end of the file, it tells the bot what to do when an unknown comoney_mateand is sent
     # so this is triggered when the user sends a comoney_mateand that the bot doesn't know
-    add_spending_handler = MessageHandler(filters.TEXT, money_mate.add_spending)
-    unknown_command_handler = MessageHandler(filters.COMMAND, money_mate.unknown)
+    add_spending_handler = MessageHandler(filters.TEXT, timed('text', money_mate.add_spending))
+    unknown_command_handler = MessageHandler(filters.COMMAND, timed('unknown', money_mate.unknown))
     
     application.add_handler(create_df)
     application.add_handler(clear_df)
     application.add_handler(spendings_handler)
     application.add_handler(spent)
-    application.add_handler(delete_handler)
+    application.add_handler(spent_page)
+    application.add_handler(search_handler)
+    application.add_handler(search_page)
+    application.add_handler(total_handler)
+    application.add_handler(chart_handler)
+    application.add_handler(undo_handler)
+    application.add_handler(redo_handler)
+    application.add_handler(restore_handler)
     application.add_handler(budget_handler)
     application.add_handler(budgets_handler)
+    application.add_handler(forecast_handler)
     application.add_handler(categ_handler)
+    application.add_handler(stats_handler)
+    application.add_handler(export_handler)
+    application.add_handler(import_handler)
+    application.add_handler(import_document_handler)
     application.add_handler(unknown_command_handler)
     application.add_handler(add_spending_handler)
 
@@ -0,0 +1,54 @@
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+from services.databaseManager import Database_Manager
+from services.instanceLock import database_lock
+import services.bulkImport as importer
+
+load_dotenv()
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    handlers=[logging.StreamHandler()] # To console
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import expenses from a csv or json lines file")
+    parser.add_argument("file", help="csv with an item,amount,category,date header or json lines with the same keys")
+    parser.add_argument("--format", choices=importer.FORMATS, help="guessed from the extension by default")
+    parser.add_argument("--database", default=os.getenv("database_name"), help="defaults to database_name in .env")
+    parser.add_argument("--chat-id", type=int, default=int(os.getenv("legacy_chat_id", "0")),
+                        help="telegram chat the expenses belong to, defaults to legacy_chat_id in .env or 0")
+    parser.add_argument("--chunk-size", type=int, default=importer.CHUNK_SIZE)
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="drop the indexes during the import and build them once at the end")
+    args = parser.parse_args()
+
+    file_format = args.format or importer.guess_format(args.file)
+    if file_format is None:
+        parser.error("can't guess the format from the file name, use --format")
+    if not args.database:
+        parser.error("no database, set database_name in .env or use --database")
+
+    # the bot caches what it read, it has to be stopped while the database is changed under it
+    try:
+        lock = database_lock(args.database).acquire()
+    except RuntimeError as e:
+        raise SystemExit(f"{e}, stop the bot first")
+    model = Database_Manager(db_name=args.database, legacy_chat_id=args.chat_id)
+    try:
+        added = importer.import_expenses(
+            model, args.chat_id, args.file, file_format, args.chunk_size,
+            progress=lambda added: logger.info(f"{added:,} expenses imported so far"),
+            rebuild_indexes=args.rebuild_indexes)
+    finally:
+        model.close()
+        lock.release()
+
+    logger.info(f"Done, {added:,} expenses imported into {args.database}")
+
+if __name__ == "__main__":
+    main()
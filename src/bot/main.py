@@ -1,7 +1,16 @@
+import asyncio
 import logging
 from telegram.ext import ApplicationBuilder
 from bot_logic.telegramBot import MoneyMate
-from services.databaseManager import Database_Manager
+from services.asyncDatabase import Async_Database_Manager
+from services.shardedDatabase import Sharded_Database_Manager
+from services.cachedDatabase import Cached_Database_Manager
+from services.googleSheets import WorkSheet
+from services.sheetsSync import Sheets_Sync
+from services.metrics import Metrics_Exporter
+from services.instanceLock import Instance_Lock, database_lock
+from services.updateProcessor import Chat_Update_Processor
+from services.webhook import Webhook_Server, run_webhook
 from handlers import registerHandlers
 from dotenv import load_dotenv
 import os
@@ -10,6 +19,45 @@ load_dotenv()
 
 bot_token = os.getenv("telegram_bot_api")
 db_name = os.getenv("database_name")
+# read-only connections used by the handlers, writes always go through a single connection
+db_readers = int(os.getenv("database_readers", "4"))
+# batch the expense inserts of concurrent messages into one commit (and use WAL journaling)
+db_group_commit = os.getenv("database_group_commit", "0") == "1"
+# chat that owns the expenses saved before they were kept per chat, used when upgrading an old database
+legacy_chat_id = int(os.getenv("legacy_chat_id", "0"))
+# "chat" keeps every chat in its own database file, a number spreads the chats over that many files
+db_shards = os.getenv("database_shards", "")
+db_shard_dir = os.getenv("database_shard_dir", os.path.splitext(db_name or "money")[0] + "_shards")
+# shard files kept open at once, the least recently used one is closed when another is needed
+db_open_shards = int(os.getenv("database_open_shards", "32"))
+# budgets, categories and monthly totals kept in memory until a write changes them, 0 turns the cache off
+db_cache_size = int(os.getenv("database_cache_size", "1024"))
+# copy every new expense to a google sheet in the background, with the service account json and the sheet name
+sheets_credentials = os.getenv("sheets_credentials")
+sheets_spreadsheet = os.getenv("sheets_spreadsheet", "All time spendings")
+# move the expenses of the years before this one to the archive database when the bot starts
+archive_on_start = os.getenv("archive_closed_years", "0") == "1"
+# where the /chart pictures are kept between requests, they belong to this database
+charts_dir = os.getenv("charts_dir", os.path.splitext(db_name or "money")[0] + "_charts")
+# chat ids allowed to use /stats and /simulate, separated by commas
+admin_chat_ids = [int(chat_id) for chat_id in os.getenv("admin_chat_ids", "").split(",") if chat_id.strip()]
+# prometheus text file the handler and sql latencies are written to, every metrics_interval seconds
+metrics_file = os.getenv("metrics_file")
+metrics_interval = float(os.getenv("metrics_interval", "15"))
+# public https url telegram posts the updates to, the bot polls for them without it
+webhook_url = os.getenv("webhook_url")
+# where the webhook is served locally, usually behind a reverse proxy or load balancer doing the https
+webhook_listen = os.getenv("webhook_listen", "0.0.0.0")
+webhook_port = int(os.getenv("webhook_port", "8443"))
+webhook_path = os.getenv("webhook_path", "/telegram")
+# telegram sends it in a header with every update, requests without it are refused
+webhook_secret = os.getenv("webhook_secret")
+# updates waiting for the bot before telegram is asked to retry
+webhook_queue_size = int(os.getenv("webhook_queue_size", "256"))
+# updates of different chats handled at once, the updates of a chat are always handled one by one in order
+concurrent_updates = max(int(os.getenv("concurrent_updates", "8")), 1)
+# updates of one chat waiting their turn, the next ones are dropped and the webhook asks telegram to retry them
+chat_queue_size = int(os.getenv("chat_queue_size", "16"))
 
 
 # Configure logging (good practice to have it in your main entry point)
@@ -22,15 +70,81 @@ logger = logging.getLogger(__name__)
 
 def main():
     
-    model = Database_Manager(db_name=db_name)
+    if db_shards and sheets_credentials:
+        logger.warning("The google sheets sync needs a single database, it's off while database_shards is set")
+    sync_sheets = bool(sheets_credentials) and not db_shards
+    if db_shards and archive_on_start:
+        logger.warning("The archival of closed years needs a single database, it's off while database_shards is set")
+    archive = archive_on_start and not db_shards
+
+    # the caches and the order of every chat's updates are kept in this process, a second bot
+    # on the same database, polling or behind the same webhook url, isn't allowed to start,
+    # nor are the scripts writing to it while the bot runs
+    try:
+        lock = (Instance_Lock(db_shard_dir + ".lock") if db_shards else database_lock(db_name)).acquire()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+    if db_shards:
+        model = Sharded_Database_Manager(
+            db_shard_dir, shards=None if db_shards == "chat" else int(db_shards), max_open=db_open_shards,
+            readers=db_readers, group_commit=db_group_commit)
+    else:
+        model = Async_Database_Manager(db_name=db_name, readers=db_readers, group_commit=db_group_commit,
+                                       legacy_chat_id=legacy_chat_id, outbox=sync_sheets)
+    if db_cache_size:
+        model = Cached_Database_Manager(model, size=db_cache_size)
     
-    money_mate = MoneyMate(model)
+    money_mate = MoneyMate(model, admins=admin_chat_ids, charts_dir=charts_dir)
+    sheets = Sheets_Sync(model, WorkSheet(sheets_credentials, sheets_spreadsheet)) if sync_sheets else None
+    exporter = Metrics_Exporter(metrics_file, metrics_interval) if metrics_file else None
+
+    async def archive_closed_years():
+        moved = await model.archive_closed_years()
+        if moved is not None:
+            logger.info(f"Archived {moved} expenses of closed years")
+
+    async def start_sync(application):
+        if sheets:
+            sheets.start()
+        if exporter:
+            exporter.start()
+        if archive:
+            # in the background, the bot answers meanwhile and the writes queue behind it
+            application.create_task(archive_closed_years())
+
+    async def finish_updates(application):
+        # the handlers still running need the bot, which the application shuts down next
+        await processor.join()
+
+    async def close_database(application):
+        if sheets:
+            await sheets.stop()
+        await model.close()
+        if exporter:
+            await exporter.stop()
+        lock.release()
     
         # create the bot application (object)
-    application = ApplicationBuilder().token(bot_token).build()
+    processor = Chat_Update_Processor(workers=concurrent_updates, chat_queue_size=chat_queue_size)
+    # polled and posted updates wait here for the processor to accept them, it never waits so
+    # a flooding chat doesn't hold up the others, it only drops that chat's extra updates
+    update_queue = asyncio.Queue(concurrent_updates)
+    application = (ApplicationBuilder().token(bot_token).update_queue(update_queue).concurrent_updates(processor)
+                   .post_init(start_sync).post_stop(finish_updates).post_shutdown(close_database).build())
     
     registerHandlers(application, money_mate)
     
+    if webhook_url:
+        # a single worker passes the updates on in order, they are handled like the polled ones
+        server = Webhook_Server(application.bot, application.update_queue.put, host=webhook_listen, port=webhook_port,
+                                path=webhook_path, secret_token=webhook_secret, workers=1,
+                                queue_size=webhook_queue_size, full=processor.full)
+        logger.info(f"Starting bot webhook at {webhook_url}...")
+        # runs the bot until ctrl+c is pressed
+        asyncio.run(run_webhook(application, server, webhook_url, webhook_secret))
+        return
+
     logger.info("Starting bot polling...")
     # runs the bot until ctrl+c is pressed
     application.run_polling()
@@ -0,0 +1,247 @@
+import asyncio
+import functools
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from .databaseManager import Database_Manager
+
+logger = logging.getLogger(__name__)
+
+# Methods of Database_Manager that only read, they can run in parallel on the reader connections
+READ_METHODS = {
+    'get_budgets',
+    'get_budget',
+    'get_budgets_status',
+    'get_total_spents',
+    'get_month_total',
+    'get_all_expenses',
+    'get_category_expenses',
+    'get_categories',
+    'get_expenses_today',
+    'get_expenses_by_year',
+    'get_expenses_by_month_year',
+    'get_expenses_by_day_month_year',
+    'get_expenses_between',
+    'get_expenses_page',
+    'get_period_totals',
+    'get_daily_totals',
+    'search_expenses',
+    'get_data_version',
+    'get_outbox',
+}
+
+# Generator methods of Database_Manager, read through Async_Database_Manager.stream
+STREAM_METHODS = {
+    'iter_expenses_between',
+}
+
+# Methods that change the database, sqlite only allows one writer so they all go through one thread
+WRITE_METHODS = {
+    'add_expense',
+    'add_expenses',
+    'insert_expenses',
+    'set_budget',
+    'delete_last_expense',
+    'clear_all_expenses',
+    'clear_all_budgets',
+    'undo',
+    'redo',
+    'restore_expenses',
+    'archive_closed_years',
+    'ack_outbox',
+}
+
+# Writes that change neither expenses nor budgets, the write listeners aren't told about them
+UNTRACKED_WRITES = {
+    'ack_outbox',
+    'archive_closed_years',
+}
+
+
+class Async_Database_Manager:
+    '''Awaitable facade over Database_Manager.
+
+    The blocking sqlite calls run on a dedicated executor instead of the event loop:
+    one writer thread owning the read/write connection, and a pool of read-only
+    connections shared by the reader threads. Every method of Database_Manager
+    listed in READ_METHODS or WRITE_METHODS is available as a coroutine.
+
+    With group_commit the database is switched to WAL and add_expense calls are
+    queued, then written together in one transaction every commit_interval
+    seconds or as soon as commit_batch of them are waiting. Each caller still
+    awaits until the transaction holding its own expense is committed.
+    '''
+
+    def __init__(self, db_name, readers=4, group_commit=False, commit_interval=0.005, commit_batch=100,
+                 legacy_chat_id=0, outbox=None):
+        if readers < 1:
+            raise ValueError("At least one reader connection is needed")
+
+        self.db_name = db_name
+        self.group_commit = group_commit
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self._pending = [] # (row, future) waiting for the next group commit
+        self._flush_handle = None
+        self._commits = set() # running group commits, so they aren't garbage collected
+        self._listeners = []
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+        # The writer is created on its own thread, so the schema exists before the readers connect
+        self._writer = self._writer_executor.submit(
+            Database_Manager, db_name, wal=group_commit, legacy_chat_id=legacy_chat_id, outbox=outbox).result()
+
+        # Readers are handed out to whichever reader thread picks up the job
+        self._readers = queue.SimpleQueue()
+        for _ in range(readers):
+            self._readers.put(Database_Manager(db_name, check_same_thread=False, read_only=True))
+        self._readers_count = readers
+        # once the writer has an archive, every reader attaches it before its next query
+        self._archived = self._writer.archived
+
+        logger.info(f"Async database ready with 1 writer and {readers} reader connections")
+
+    def __getattr__(self, name):
+        if name in READ_METHODS:
+            return functools.partial(self.run_read, name)
+        if name in WRITE_METHODS:
+            return functools.partial(self.run_write, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    async def run_read(self, name, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._reader_executor, functools.partial(self._read, name, *args, **kwargs))
+
+    async def run_write(self, name, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # expenses already queued are committed first, so writes keep the order they were made in
+        self._flush()
+        result = await loop.run_in_executor(
+            self._writer_executor, functools.partial(getattr(self._writer, name), *args, **kwargs))
+        if name == 'archive_closed_years':
+            self._archived = self._writer.archived
+        if name not in UNTRACKED_WRITES:
+            self._notify(name, args, result)
+        return result
+
+    def add_listener(self, listener):
+        '''Calls listener(name, args, result) after every write, name is the Database_Manager method or
+        the function given to run_in_writer. Caches use it to drop what a write made stale.'''
+        self._listeners.append(listener)
+
+    def _notify(self, name, args, result):
+        for listener in self._listeners:
+            try:
+                listener(name, args, result)
+            except Exception:
+                logger.exception(f"Write listener failed after {name}")
+
+    async def stream(self, name, *args, **kwargs):
+        '''Async iterator over what a generator in STREAM_METHODS yields.
+
+        The reader connection is kept for the whole iteration, and every step runs on
+        the reader threads, so the rows are never all loaded at once. The generators
+        don't keep a statement open between steps, which would block the writer.
+        '''
+        if name not in STREAM_METHODS:
+            raise AttributeError(f"'{name}' can't be streamed")
+
+        loop = asyncio.get_running_loop()
+        reader = await loop.run_in_executor(self._reader_executor, self._checkout)
+        generator = getattr(reader, name)(*args, **kwargs)
+        done = object()
+        try:
+            while (batch := await loop.run_in_executor(self._reader_executor, next, generator, done)) is not done:
+                yield batch
+        finally:
+            await loop.run_in_executor(self._reader_executor, generator.close)
+            self._readers.put(reader)
+
+    async def run_in_writer(self, function, *args):
+        '''Runs function(database_manager, *args) on the writer thread, for jobs made of many statements'''
+        loop = asyncio.get_running_loop()
+        self._flush()
+        result = await loop.run_in_executor(
+            self._writer_executor, functools.partial(function, self._writer, *args))
+        self._notify(function.__name__, args, result)
+        return result
+
+    async def add_expense(self, chat_id, item, amount, category, expense_date=None):
+        if not self.group_commit:
+            return await self.run_write('add_expense', chat_id, item, amount, category, expense_date)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # expenses of every chat share the group commit
+        self._pending.append(
+            ((chat_id, item, amount, category, (expense_date or date.today()).isoformat()), future))
+
+        if len(self._pending) >= self.commit_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.commit_interval, self._flush)
+
+        return await future
+
+    def _flush(self):
+        '''Sends every queued expense to the writer thread as one transaction'''
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        commit = loop.run_in_executor(
+            self._writer_executor, self._writer.insert_expenses, [row for row, _ in batch])
+        task = asyncio.ensure_future(self._group_commit(commit, batch))
+        self._commits.add(task)
+        task.add_done_callback(self._commits.discard)
+
+    async def _group_commit(self, commit, batch):
+        try:
+            result = await commit
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._notify('insert_expenses', ([row for row, _ in batch],), result)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(result)
+
+    def _checkout(self):
+        reader = self._readers.get()
+        if self._archived:
+            try:
+                reader.attach_archive()
+            except BaseException:
+                self._readers.put(reader)
+                raise
+        return reader
+
+    def _read(self, name, *args, **kwargs):
+        reader = self._checkout()
+        try:
+            return getattr(reader, name)(*args, **kwargs)
+        finally:
+            self._readers.put(reader)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        self._flush()
+        if self._commits:
+            await asyncio.gather(*self._commits, return_exceptions=True)
+        await loop.run_in_executor(self._writer_executor, self._writer.close)
+        self._writer_executor.shutdown(wait=True)
+        self._reader_executor.shutdown(wait=True)
+
+        for _ in range(self._readers_count):
+            self._readers.get_nowait().close()
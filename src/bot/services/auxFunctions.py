@@ -1,8 +1,10 @@
-import pandas as pd
+from datetime import date, datetime, time
+from typing import List, Optional, Tuple
+from .expense import Expense
+from .databaseManager import period_bounds
 
-from datetime import date
-from typing import Optional, Tuple
-#from .expense import Expense
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
 
 def parse_date_args(args) -> Tuple[Optional[int], Optional[int], Optional[int]]:
     """Parse command arguments into day, month, year."""
@@ -43,6 +45,85 @@ def parse_date_args(args) -> Tuple[Optional[int], Optional[int], Optional[int]]:
 
     raise ValueError("Invalid number of arguments")
            
+def parse_moment(args) -> datetime:
+    '''The datetime of "day month year [HH:MM]" command arguments, the end of the day without a time'''
+    args = list(args)
+    clock = args.pop() if args and ":" in args[-1] else None
+    day, month, year = parse_date_args(args)
+    if day is None:
+        raise ValueError("Format: day (1-31) month (1-12) year [HH:MM]")
+    try:
+        moment = time.fromisoformat(clock.zfill(5)) if clock else time(23, 59, 59)
+    except ValueError:
+        raise ValueError("The time must be HH:MM")
+    return datetime.combine(date(year, month, day), moment)
+
+def period_title(start, end) -> str:
+    '''"on 26/5/2024", "in May 2024" or "in 2024" for the [start, end) range of a day, month or year'''
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    if (last - first).days == 1:
+        return f"on {first.day}/{first.month}/{first.year}"
+    if first.month == 1 and last == first.replace(year=first.year + 1):
+        return f"in {first.year}"
+    return f"in {MONTHS[first.month - 1]} {first.year}"
+
+def get_period(args) -> Tuple[str, str, str]:
+    '''The [start, end) ISO dates and a title ("in May 2024") for the period asked in a command, today by default'''
+    day, month, year = parse_date_args(args)
+
+    if not year:
+        today = date.today()
+        start, end = period_bounds(today.year, today.month, today.day)
+        return start, end, "today"
+
+    start, end = period_bounds(year, month, day)
+    return start, end, period_title(start, end)
+
+def page_callback(start, end, direction, cursor) -> str:
+    '''Callback data of a /spent page button, "spent:20240501:20240601:n:20240517:42" fits the 64 bytes limit'''
+    compact = lambda iso: iso.replace("-", "")
+    cursor_date, cursor_id = cursor
+    return f"spent:{compact(start)}:{compact(end)}:{direction}:{compact(cursor_date)}:{cursor_id}"
+
+def parse_page_callback(data):
+    '''start, end, direction ("n" or "p") and the (date, id) cursor of a page_callback'''
+    expand = lambda compact: f"{compact[:4]}-{compact[4:6]}-{compact[6:]}"
+    _, start, end, direction, cursor_date, cursor_id = data.split(":")
+    return expand(start), expand(end), direction, (expand(cursor_date), int(cursor_id))
+
+def parse_search(args) -> Tuple[List[str], Optional[str], Optional[str], Optional[str], str]:
+    '''The words, category, [start, end) ISO dates and a title of "words [#category] [day] [month] [year]" arguments.
+
+    Underscores in a #category stand for spaces, the dates are None without a period.
+    '''
+    args = list(args)
+    trailing = 0
+    while trailing < min(3, len(args)) and args[-1 - trailing].isdigit():
+        trailing += 1
+    # the trailing numbers are a period only if they read as one, "iphone 15" looks for the 15
+    period = None
+    for count in range(trailing, 0, -1):
+        try:
+            period = get_period(tuple(args[-count:]))
+        except ValueError:
+            continue
+        del args[-count:]
+        break
+    categories = [arg[1:].replace("_", " ") for arg in args if arg.startswith("#") and len(arg) > 1]
+    words = [arg for arg in args if not arg.startswith("#")]
+    if not words or len(categories) > 1:
+        raise ValueError("Format: /search words [#category] [day] [month] [year]")
+
+    title = f"“{' '.join(words)}”"
+    category = categories[0] if categories else None
+    if category:
+        title += f" in {category.capitalize()}"
+    start = end = None
+    if period:
+        start, end, period = period
+        title += f" {period}"
+    return words, category, start, end, title
+
 def check_budget(budget, spents, spent_amount) -> int:
     
     if budget == None:
@@ -56,6 +137,9 @@ def check_budget(budget, spents, spent_amount) -> int:
 
 def get_spent(spent):
     '''Creates an expense object and checks if the expense format is correct'''
+    if spent and spent[0].startswith("/"): # drop the /add command
+        spent = spent[1:]
+
     if ("," in "".join(spent)):
         item = []
         for i in spent:
@@ -65,15 +149,34 @@ def get_spent(spent):
                 item.append(i.replace(",", ""))
                 spent = spent[spent.index(i)+1:]
                 break
-        spent.insert(0, " ".join(item))
+        # the separators after the item, "25, food" or "25 , food"
+        spent = [word.strip(",") for word in spent if word.strip(",")]
+        spent.insert(0, " ".join(item).strip())
     
     if len(spent) != 3:
         return 0
 
     try:
-        int(spent[1])
+        amount = float(spent[1])
     except ValueError:  # Check if amount is a number
         return 1
 
-    #return Expense(item=spent[0], amount=int(spent[1]), category=spent[2])
-    return spent
+    return Expense(item=spent[0], amount=amount, category=spent[2])
+
+def get_spents(message) -> Tuple[List[Expense], List[Tuple[int, int]]]:
+    '''Parses a message with one expense per line, like a pasted receipt.
+
+    Every line is validated before anything is saved, it returns the expenses and
+    the (line number, error code) of the lines that couldn't be parsed.
+    '''
+    expenses = []
+    errors = []
+    for number, line in enumerate(message.splitlines(), 1):
+        if not line.strip():
+            continue
+        spent = get_spent(line.split())
+        if isinstance(spent, Expense):
+            expenses.append(spent)
+        else:
+            errors.append((number, spent))
+    return expenses, errors
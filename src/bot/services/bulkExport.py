@@ -0,0 +1,90 @@
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# the columns of an exported expense, item,amount,category,date can be imported back as they are
+COLUMNS = ("id", "item", "amount", "category", "date")
+
+# the whole history, for exports without a period
+ALL_TIME = ("0001-01-01", "9999-12-31")
+
+
+class Expenses_Writer():
+    '''Writes batches of (id, item, amount, category, ISO date) rows to a csv, json lines or parquet file.
+
+    Each batch is written as soon as it's given, so only one is ever held in memory;
+    a parquet file gets a row group per batch. pyarrow is only imported for parquet,
+    a ValueError tells it's missing.
+    '''
+
+    def __init__(self, path, file_format):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown format {file_format}, use one of {', '.join(FORMATS)}")
+        self.path = path
+        self.file_format = file_format
+        self.written = 0
+        self._file = None
+        self._writer = None
+
+        if file_format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ValueError("Parquet exports need pyarrow, install it or export to csv")
+            self._arrow = pyarrow
+            self._schema = pyarrow.schema([("id", pyarrow.int64()), ("item", pyarrow.string()),
+                                           ("amount", pyarrow.float64()), ("category", pyarrow.string()),
+                                           ("date", pyarrow.string())])
+            self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            if file_format == "csv":
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        if self.file_format == "csv":
+            self._writer.writerows(rows)
+        elif self.file_format == "jsonl":
+            self._file.writelines(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows)
+        else:
+            columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+            self._writer.write_table(self._arrow.Table.from_arrays(
+                [self._arrow.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+                schema=self._schema))
+        self.written += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_expenses(db_manager, chat_id, path, file_format, start=ALL_TIME[0], end=ALL_TIME[1],
+                    batch_size=BATCH_SIZE, progress=None):
+    '''Streams the expenses of a chat dated in [start, end) to a file, batch by batch.
+
+    progress is called with the number of expenses written so far after each batch.
+    Returns the number of expenses exported.
+    '''
+    with Expenses_Writer(path, file_format) as writer:
+        for batch in db_manager.iter_expenses_between(chat_id, start, end, batch_size):
+            writer.write(batch)
+            if progress:
+                progress(writer.written)
+
+    logger.info(f"Exported {writer.written} expenses of chat {chat_id} to {path}")
+    return writer.written
@@ -0,0 +1,85 @@
+import csv
+import json
+import logging
+from datetime import date
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+
+def guess_format(file_name):
+    '''csv or jsonl from the file extension, None if it's neither'''
+    extension = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+    if extension == "csv":
+        return "csv"
+    if extension in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    return None
+
+
+def parse_expense(record, line):
+    '''Turns a csv row or json object into an (item, amount, category, ISO date) row'''
+    for field in ("item", "amount", "category"):
+        if record.get(field) is None:
+            raise ValueError(f"Line {line}: missing {field}")
+
+    item = str(record["item"]).strip()
+    category = str(record["category"]).strip()
+    try:
+        amount = float(record["amount"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Line {line}: amount must be a number")
+    if not item or not category:
+        raise ValueError(f"Line {line}: item and category can't be empty")
+
+    expense_date = record.get("date") or date.today().isoformat()
+    try:
+        # dates may come with a time, only the day is kept
+        expense_date = date.fromisoformat(str(expense_date)[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Line {line}: date must be YYYY-MM-DD")
+
+    return item, amount, category, expense_date
+
+
+def read_expenses(stream, file_format):
+    '''Lazily yields the expenses of a csv (with a header) or json lines text stream'''
+    if file_format == "csv":
+        # the header is line 1
+        for line, record in enumerate(csv.DictReader(stream), 2):
+            yield parse_expense(record, line)
+    elif file_format == "jsonl":
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError:
+                raise ValueError(f"Line {line}: not valid json")
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line}: expected a json object")
+            yield parse_expense(record, line)
+    else:
+        raise ValueError(f"Unknown format {file_format}, use one of {', '.join(FORMATS)}")
+
+
+def import_expenses(db_manager, chat_id, path, file_format, chunk_size=CHUNK_SIZE, progress=None, rebuild_indexes=False):
+    '''Streams a file into the expenses of a chat chunk by chunk, all in one transaction.
+
+    Only one chunk is held in memory at a time. progress is called with the number
+    of expenses inserted so far after each chunk. Returns the number of expenses added.
+    '''
+    added = 0
+    with open(path, newline="", encoding="utf-8-sig") as stream:
+        expenses = read_expenses(stream, file_format)
+        with db_manager.bulk_load(chat_id, rebuild_indexes=rebuild_indexes) as insert:
+            while chunk := list(islice(expenses, chunk_size)):
+                added += insert(chunk)
+                if progress:
+                    progress(added)
+
+    logger.info(f"Imported {added} expenses of chat {chat_id} from {path}")
+    return added
@@ -0,0 +1,89 @@
+import functools
+import logging
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cached reads and the data of a chat they depend on
+CACHED_METHODS = {
+    'get_budget': ('budgets',),
+    'get_budgets': ('budgets',),
+    'get_budgets_status': ('budgets', 'expenses'),
+    'get_categories': ('expenses',),
+    'get_month_total': ('expenses',),
+    'get_total_spents': ('expenses',),
+}
+
+# Writes and the data of their chat they change, any other write (imports, simulations...) can change all of it
+WRITES = {
+    'add_expense': ('expenses',),
+    'add_expenses': ('expenses',),
+    'delete_last_expense': ('expenses',),
+    'clear_all_expenses': ('expenses',),
+    'set_budget': ('budgets',),
+    'clear_all_budgets': ('budgets',),
+}
+
+
+class Cached_Database_Manager:
+    '''Read-through cache in front of Async_Database_Manager (or Sharded_Database_Manager).
+
+    The methods in CACHED_METHODS are answered from memory while the data they read
+    is unchanged. Every chat has a version counter for its budgets and one for its
+    expenses, only ever increased by its writes, and a cached answer is stored under
+    the versions it was read at, so it's never served once a counter it depends on
+    has moved. Adding expenses keeps the budgets cached and the other way around.
+    Any other method goes straight to the database manager.
+    '''
+
+    def __init__(self, db_manager, size=1024):
+        self.model = db_manager
+        self.size = size
+        self.hits = Counter() # method: answers served from memory
+        self.misses = Counter() # method: answers read from the database
+        self._entries = OrderedDict()
+        self._versions = {} # (chat_id, data): version
+        db_manager.add_listener(self.on_write)
+
+    def __getattr__(self, name):
+        if name in CACHED_METHODS:
+            return functools.partial(self._read, name)
+        return getattr(self.model, name)
+
+    def version(self, chat_id, data):
+        return self._versions.get((chat_id, data), 0)
+
+    async def _read(self, name, chat_id, *args):
+        versions = tuple(self.version(chat_id, data) for data in CACHED_METHODS[name])
+        key = (name, chat_id, tuple(tuple(arg) if isinstance(arg, (list, dict, set)) else arg for arg in args))
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self.hits[name] += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses[name] += 1
+        result = await getattr(self.model, name)(chat_id, *args)
+        # a write made while reading bumped the versions, what was read may already be stale
+        if versions == tuple(self.version(chat_id, data) for data in CACHED_METHODS[name]):
+            self._entries[key] = (versions, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return result
+
+    def bump(self, chat_id, *data):
+        for name in data:
+            self._versions[(chat_id, name)] = self.version(chat_id, name) + 1
+
+    def on_write(self, name, args, result):
+        '''Listener for Async_Database_Manager.add_listener'''
+        if name == 'insert_expenses':
+            for chat_id in {row[0] for row in args[0]}:
+                self.bump(chat_id, 'expenses')
+        else:
+            self.bump(args[0], *WRITES.get(name, ('budgets', 'expenses')))
+
+    def stats(self):
+        '''Hit and miss counts by method, for monitoring'''
+        return {name: (self.hits[name], self.misses[name]) for name in CACHED_METHODS}
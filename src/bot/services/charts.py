@@ -0,0 +1,144 @@
+import asyncio
+import glob
+import logging
+import os
+import tempfile
+from datetime import date
+
+from .auxFunctions import MONTHS, period_title
+
+logger = logging.getLogger(__name__)
+
+
+def render_chart(rows, start, end, path):
+    '''Draws the rows of Database_Manager.get_period_totals as a png, by category and over time.
+
+    matplotlib is only imported here, a ValueError tells it's missing. Only the
+    Figure api is used, without pyplot's global state, so charts can be drawn
+    on any thread.
+    '''
+    try:
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise ValueError("Charts need matplotlib, install it to use /chart")
+
+    categories = sorted(((key, amount) for kind, key, amount, _ in rows if kind == 'category'),
+                        key=lambda category: category[1])
+    buckets = [(kind, key, amount) for kind, key, amount, _ in rows if kind in ('day', 'month')]
+    total, count = next((amount, expenses) for kind, _, amount, expenses in rows if kind == 'total')
+
+    figure = Figure(figsize=(8, 8), dpi=100, layout="constrained")
+    by_category, over_time = figure.subplots(2, 1)
+    figure.suptitle(f"Spent {period_title(start, end)}: ${total:,.2f} in {count} expenses")
+
+    by_category.barh([category.capitalize() for category, _ in categories], [amount for _, amount in categories],
+                     color="tab:blue")
+    by_category.set_title("By category")
+    by_category.set_xlabel("$")
+
+    # days are labelled by their number, months by their name
+    labels = [MONTHS[int(key[5:7]) - 1][:3] if kind == 'month' else str(int(key[8:])) for kind, key, _ in buckets]
+    over_time.bar(labels, [amount for _, _, amount in buckets], color="tab:orange")
+    over_time.set_title(f"By {buckets[0][0] if buckets else 'day'}")
+    over_time.set_ylabel("$")
+    over_time.tick_params(axis="x", labelsize=8)
+
+    figure.savefig(path, format="png")
+
+
+class Charts():
+    '''/chart pictures rendered from the aggregated totals of a period and cached on disk.
+
+    A chart is kept under (chat, period, data version), the version being the
+    chat's newest journal entry: every change of its expenses moves it and it's
+    stored in the database, so a chart on disk is reused across restarts for as
+    long as nothing changed. The telegram file_id of a chart is kept next to it
+    once sent, and sent instead of the file, so a repeated request neither
+    renders nor uploads. Only the newest version of a period is kept, and at most
+    size charts, the least recently used are deleted first.
+    '''
+
+    def __init__(self, db_manager, directory, size=500):
+        self.model = db_manager
+        self.directory = directory
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, chat_id, start, end, version):
+        return os.path.join(self.directory, f"{chat_id}_{start}_{end}_{version}.png")
+
+    async def chart(self, chat_id, start, end):
+        '''(path, file_id) of the chart of a period, file_id is None until it's sent. None without expenses'''
+        version = await self.model.get_data_version(chat_id)
+        if version is None:
+            raise ValueError("🚫 The chart couldn't be made, try again 🚫")
+
+        path = self.path(chat_id, start, end, version)
+        try:
+            os.utime(path) # the least recently used charts are deleted first
+            self.hits += 1
+            return path, self.file_id(path)
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        # a year has too many days to draw, it's split by month instead
+        bucket = "month" if (date.fromisoformat(end) - date.fromisoformat(start)).days > 31 else "day"
+        rows = await self.model.get_period_totals(chat_id, start, end, bucket)
+        if not any(kind == 'total' and expenses for kind, _, _, expenses in rows):
+            return None
+        await asyncio.to_thread(self._render, rows, start, end, path)
+        return path, None
+
+    def _render(self, rows, start, end, path):
+        os.makedirs(self.directory, exist_ok=True)
+        # drawn to a file of its own first, so a chart is never read half written, and never pruned meanwhile
+        descriptor, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(descriptor)
+        try:
+            render_chart(rows, start, end, temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self._prune(path)
+
+    def _prune(self, path):
+        '''Deletes the older versions of the chart at path, then the least recently used charts over size'''
+        period = path.rsplit("_", 1)[0]
+        charts = []
+        for chart in glob.glob(os.path.join(self.directory, "*.png")):
+            if chart != path and chart.rsplit("_", 1)[0] == period:
+                self._remove(chart)
+            else:
+                charts.append(chart)
+        if len(charts) > self.size:
+            charts.sort(key=lambda chart: os.stat(chart).st_mtime if os.path.exists(chart) else 0)
+            for chart in charts[:len(charts) - self.size]:
+                self._remove(chart)
+
+    def _remove(self, chart):
+        for name in (chart, f"{chart}.id"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass # deleted by a request running at the same time
+
+    def file_id(self, path):
+        try:
+            with open(f"{path}.id") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def sent(self, path, file_id):
+        '''Keeps the file_id telegram gave the chart at path, None forgets it'''
+        if file_id is None:
+            try:
+                os.remove(f"{path}.id")
+            except FileNotFoundError:
+                pass
+            return
+        with open(f"{path}.id", "w") as f:
+            f.write(file_id)
@@ -1,18 +1,99 @@
+import json
 import sqlite3
-from datetime import date
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 import logging
 import os
+from pathlib import Path
+
+from .metrics import Timed_Connection
 
 # It's good practice to get the logger for the current module
 logger = logging.getLogger(__name__)
 
+# Bumped every time a migration is added to Database_Manager.migrate, stored in PRAGMA user_version
+SCHEMA_VERSION = 6
+
+# secondary indexes of the expenses table, a bulk load can drop them and build them once at the end.
+# They lead on the chat, so a chat's queries only touch its own range of the index
+EXPENSE_INDEXES = {
+    'idx_expenses_chat_date': "CREATE INDEX IF NOT EXISTS idx_expenses_chat_date ON expenses (chat_id, date)",
+    # sorted by id within a chat, as the rowid ends every index entry, so a chat's last expense is one lookup
+    'idx_expenses_chat': "CREATE INDEX IF NOT EXISTS idx_expenses_chat ON expenses (chat_id)",
+}
+
+# the columns of an expense row returned by the queries, chat_id is left out as it's always the one asked for
+EXPENSE_COLUMNS = "id, item, amount, category, date"
+
+# triggers keeping the rollups in sync with expenses, skipped by bulk loads
+# queues every new expense for the google sheets sync, only created when the sync is on
+OUTBOX_TRIGGER = 'expenses_sheet_outbox'
+
+ROLLUP_TRIGGERS = ('expenses_rollup_insert', 'expenses_rollup_delete', 'expenses_rollup_update')
+
+# triggers keeping the full-text index of the items in sync with expenses, skipped by bulk loads and archivals
+SEARCH_TRIGGERS = ('expenses_search_insert', 'expenses_search_delete', 'expenses_search_update')
+
+# the token a chat is indexed under in expenses_search, "chat42" or "chatn42" for -42, as sql of a chat_id column
+SEARCH_CHAT = "'chat' || replace({}, '-', 'n')"
+
+# expenses of both the live table and the archive of closed years, for the queries that can reach any date
+ALL_EXPENSES = """(SELECT id, item, amount, category, date, chat_id FROM main.expenses
+    UNION ALL SELECT id, item, amount, category, date, chat_id FROM archive.expenses)"""
+
+# journal entries of a chat between two snapshots of it, a point in time is rebuilt from the
+# snapshot before it by replaying at most this many entries (or the chat's size, if bigger)
+SNAPSHOT_INTERVAL = 1000
+
+# days of journal kept, older entries are dropped up to a snapshot when the next one is taken.
+# Nothing before that snapshot can be undone or restored anymore
+JOURNAL_DAYS = 90
+
+
+def search_match(chat_id, words):
+    '''The fts5 query of the expenses of a chat with item words starting with every one of words.
+
+    Every word is quoted, so what a user types is never read as fts5 syntax.
+    None if no word has anything to search for.
+    '''
+    terms = " ".join('"' + word.replace('"', '""') + '"*' for word in words if any(c.isalnum() for c in word))
+    if not terms:
+        return None
+    return f"chat : chat{str(chat_id).replace('-', 'n')} AND item : ({terms})"
+
+
+def period_bounds(year, month=None, day=None):
+    '''Returns the half-open range [start, end) of ISO dates covering a year, a month or a single day'''
+    if day is not None:
+        start = date(year, month, day)
+        end = start + timedelta(days=1)
+    elif month is not None:
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    else:
+        start = date(year, 1, 1)
+        end = date(year + 1, 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
 class Database_Manager:
-    def __init__(self, db_name):
+    def __init__(self, db_name, check_same_thread=True, read_only=False, wal=False, legacy_chat_id=0,
+                 outbox=None):
         # Log the initial relative path
-        logger.info(f"Initializing database connection with relative path: {db_name}")
+        logger.debug("Initializing database connection with relative path: %s", db_name)
         # Resolve the relative path to an absolute path for clarity and robustness
         self.db_name = os.path.abspath(db_name)
-        logger.info(f"Absolute database path resolved to: {self.db_name}")
+        # chat that owns the expenses and budgets saved before they were stored per chat
+        self.legacy_chat_id = legacy_chat_id
+        # queue new expenses in sheet_outbox, for services.sheetsSync to send them to google sheets. Only the
+        # bot sets it, None (the scripts) leaves the queueing on or off as the bot left it in the database
+        self.outbox = outbox
+        self.read_only = read_only
+        # closed years are moved to a database of their own next to this one, attached as "archive"
+        self.archive_name = f"{os.path.splitext(self.db_name)[0]}.archive.db"
+        self.archived = False
+        self.all_expenses = "expenses" # what the period queries read, ALL_EXPENSES once the archive is attached
+        logger.debug("Absolute database path resolved to: %s", self.db_name)
 
         # Ensure the directory for the database file exists
         db_dir = os.path.dirname(self.db_name)
@@ -27,10 +108,24 @@ class Database_Manager:
 
         # Connect to the database. This will create the file if it doesn't exist in the specified path.
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            if read_only:
+                # Reader connections never create or migrate the schema, the writer owns it
+                self.conn = sqlite3.connect(f"{Path(self.db_name).as_uri()}?mode=ro", uri=True,
+                                            check_same_thread=check_same_thread, factory=Timed_Connection)
+            else:
+                # every statement and commit is timed in services.metrics
+                self.conn = sqlite3.connect(self.db_name, check_same_thread=check_same_thread,
+                                            factory=Timed_Connection)
             self.cursor = self.conn.cursor()
-            logger.info(f"Successfully connected to database: {self.db_name}")
-            self.create_tables() # Call to create tables
+            logger.debug("Successfully connected to database: %s", self.db_name)
+            if wal and not read_only:
+                # readers no longer block the writer and a commit appends to the log instead of
+                # rewriting pages, the mode is stored in the file so every connection gets it
+                self.cursor.execute("PRAGMA journal_mode=WAL")
+            # before the tables, so the migrations see the archived expenses too
+            self.attach_archive()
+            if not read_only:
+                self.create_tables() # Call to create tables
         except sqlite3.Error as e:
             logger.error(f"Error connecting to or initializing database {self.db_name}: {e}")
             # Clean up connection if it was partially opened before re-raising
@@ -39,32 +134,29 @@ class Database_Manager:
             raise # Re-raise the exception as this is critical
 
     def create_tables(self):
-        logger.info("Attempting to create tables...")
+        logger.debug("Attempting to create tables...")
         try:
             # Create expenses table if it doesn't exist
-            logger.info("Executing: CREATE TABLE IF NOT EXISTS expenses (...)")
-            self.cursor.execute(f'''
-                CREATE TABLE IF NOT EXISTS expenses (
-                    id INTEGER PRIMARY KEY,
-                    item TEXT,
-                    amount REAL,
-                    category TEXT,
-                    date TIMESTAMP
-                )''')
-            logger.info("CREATE TABLE IF NOT EXISTS expenses - command executed.")
+            logger.debug("Executing: CREATE TABLE IF NOT EXISTS expenses (...)")
+            self.create_expenses_table()
+            logger.debug("CREATE TABLE IF NOT EXISTS expenses - command executed.")
 
             # Create table for budgets
-            logger.info("Executing: CREATE TABLE IF NOT EXISTS budgets (...)")
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS budgets (
-                    category TEXT PRIMARY KEY,
-                    amount REAL
-                )''')
-            logger.info("CREATE TABLE IF NOT EXISTS budgets - command executed.")
+            logger.debug("Executing: CREATE TABLE IF NOT EXISTS budgets (...)")
+            self.create_budgets_table()
+            logger.debug("CREATE TABLE IF NOT EXISTS budgets - command executed.")
 
-            logger.info("Committing table creation transaction...")
+            self.create_journal()
+
+            self.migrate()
+            # after the migrations, as older tables may lack the columns they use
+            self.create_expenses_indexes()
+            self.create_outbox()
+            self.create_search()
+
+            logger.debug("Committing table creation transaction...")
             self.conn.commit()
-            logger.info("Table creation transaction committed successfully.")
+            logger.debug("Table creation transaction committed successfully.")
         except sqlite3.Error as e:
             logger.error(f"SQLite error during table creation: {e}")
             logger.info("Attempting to rollback transaction due to error...")
@@ -76,199 +168,1155 @@ class Database_Manager:
                 logger.error(f"SQLite error during rollback: {rb_e}")
             raise # Re-raise the original error to signal failure
 
-    def add_expense(self, item, amount, category):
+    def create_expenses_table(self, name="expenses"):
+        # dates are stored as ISO 'YYYY-MM-DD' text, so they sort lexicographically and the
+        # (chat_id, date) index answers every period query of a chat with a range lookup.
+        # AUTOINCREMENT never hands out an id twice, so the journal can bring back a deleted
+        # expense under its own id
+        self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item TEXT,
+                amount REAL,
+                category TEXT,
+                date TEXT,
+                chat_id INTEGER NOT NULL
+            )''')
+
+    def create_budgets_table(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS budgets (
+                chat_id INTEGER NOT NULL,
+                category TEXT,
+                amount REAL,
+                PRIMARY KEY (chat_id, category)
+            )''')
+
+    def create_expenses_indexes(self):
+        for create_index in EXPENSE_INDEXES.values():
+            self.cursor.execute(create_index)
+        self.create_rollups()
+
+    def create_rollups(self):
+        # spending per chat, category and month ('YYYY-MM'), kept up to date by triggers on expenses
+        # so every insert or delete updates it in the same transaction
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                chat_id INTEGER NOT NULL,
+                category TEXT,
+                month TEXT,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, category, month)
+            ) WITHOUT ROWID''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses
+            BEGIN
+                INSERT INTO monthly_totals (chat_id, category, month, total, count)
+                VALUES (NEW.chat_id, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+                ON CONFLICT (chat_id, category, month) DO UPDATE SET total = total + excluded.total, count = count + 1;
+            END''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses
+            BEGIN
+                UPDATE monthly_totals SET total = total - OLD.amount, count = count - 1
+                WHERE chat_id = OLD.chat_id AND category = OLD.category AND month = substr(OLD.date, 1, 7);
+                DELETE FROM monthly_totals
+                WHERE chat_id = OLD.chat_id AND category = OLD.category AND month = substr(OLD.date, 1, 7)
+                AND count <= 0;
+            END''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF amount, category, date, chat_id ON expenses
+            BEGIN
+                UPDATE monthly_totals SET total = total - OLD.amount, count = count - 1
+                WHERE chat_id = OLD.chat_id AND category = OLD.category AND month = substr(OLD.date, 1, 7);
+                DELETE FROM monthly_totals
+                WHERE chat_id = OLD.chat_id AND category = OLD.category AND month = substr(OLD.date, 1, 7)
+                AND count <= 0;
+                INSERT INTO monthly_totals (chat_id, category, month, total, count)
+                VALUES (NEW.chat_id, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+                ON CONFLICT (chat_id, category, month) DO UPDATE SET total = total + excluded.total, count = count + 1;
+            END''')
+
+    def create_outbox(self, sync=None):
+        # expenses waiting to be sent to google sheets, queued by a trigger so they are saved in the
+        # same transaction as the expense itself and nothing is lost if the bot stops before sending them
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sheet_outbox (
+                id INTEGER PRIMARY KEY,
+                expense_id INTEGER NOT NULL
+            )''')
+        sync = self.outbox if sync is None else sync
+        if sync:
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {OUTBOX_TRIGGER} AFTER INSERT ON expenses
+                BEGIN
+                    INSERT INTO sheet_outbox (expense_id) VALUES (NEW.id);
+                END''')
+        elif sync is not None:
+            # nothing drains the outbox, it would only grow
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {OUTBOX_TRIGGER}")
+
+    def queues_outbox(self):
+        '''Whether new expenses are queued for google sheets, the bot creates the trigger when the sync is on'''
+        return self.cursor.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'trigger' AND name = ?",
+                                   (OUTBOX_TRIGGER,)).fetchone() is not None
+
+    @contextmanager
+    def outbox_paused(self):
+        '''Expenses inserted meanwhile aren't queued for google sheets, for the ones the journal brings back.
+
+        They were queued when they were first added, sending them again would copy them twice.
+        '''
+        syncing = self.queues_outbox()
+        if syncing:
+            self.cursor.execute(f"DROP TRIGGER {OUTBOX_TRIGGER}")
+        yield
+        if syncing:
+            self.create_outbox(sync=True)
+
+    def create_search(self):
+        # full-text index of the items. The chat is a token of its own, so a search intersects its
+        # words with its chat's rows instead of filtering the matches of every chat; the date makes
+        # the lookup of an archived expense a primary key search. Archived expenses stay indexed
+        # under their id, as the archival skips the triggers
+        self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS expenses_search USING fts5(
+                item, chat, date UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses
+            BEGIN
+                INSERT INTO expenses_search (rowid, item, chat, date)
+                VALUES (NEW.id, NEW.item, {SEARCH_CHAT.format('NEW.chat_id')}, NEW.date);
+            END''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses
+            BEGIN
+                DELETE FROM expenses_search WHERE rowid = OLD.id;
+            END''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE OF id, item, date, chat_id ON expenses
+            BEGIN
+                UPDATE expenses_search SET rowid = NEW.id, item = NEW.item,
+                chat = {SEARCH_CHAT.format('NEW.chat_id')}, date = NEW.date WHERE rowid = OLD.id;
+            END''')
+
+    def rebuild_search(self):
+        '''Indexes the items of every expense again, the caller commits'''
+        self.cursor.execute("DELETE FROM expenses_search")
+        self.cursor.execute(
+            f"INSERT INTO expenses_search (rowid, item, chat, date) "
+            f"SELECT id, item, {SEARCH_CHAT.format('chat_id')}, date FROM {self.all_expenses}")
+
+    def create_journal(self):
+        # append-only log of every change to the expenses and budgets of a chat, until compact_journal drops
+        # its oldest entries. An entry keeps the rows it removed (added = 0) and added (added = 1) in
+        # journal_rows and its budget changes as {category: [before, after]}, None meaning no budget, so it
+        # can be replayed or reverted. A bulk load doesn't copy the rows it added, they are the expenses of
+        # its chat with ids from added_from to added_to, until it's first undone
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                parent INTEGER,
+                action TEXT NOT NULL,
+                budgets TEXT,
+                created TEXT NOT NULL,
+                added_from INTEGER,
+                added_to INTEGER
+            )''')
+        # a chat's entries by seq (the rowid ends the index entry) and by time
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_journal_chat ON journal (chat_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_journal_chat_created ON journal (chat_id, created)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_rows (
+                seq INTEGER NOT NULL,
+                added INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                item TEXT,
+                amount REAL,
+                category TEXT,
+                date TEXT,
+                PRIMARY KEY (seq, added, id)
+            ) WITHOUT ROWID''')
+        # head is the newest entry of the chat still in effect, undoing it moves back to its parent.
+        # The undo entries that can be redone are a stack, journal_redo, of redo_depth entries
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_state (
+                chat_id INTEGER PRIMARY KEY,
+                head INTEGER,
+                redo_depth INTEGER NOT NULL DEFAULT 0,
+                since_snapshot INTEGER NOT NULL DEFAULT 0
+            )''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_redo (
+                chat_id INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, depth)
+            ) WITHOUT ROWID''')
+        # the whole state of a chat after its entry seq, the point replays start from
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_snapshots (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                budgets TEXT NOT NULL,
+                created TEXT NOT NULL
+            )''')
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_snapshots_chat ON journal_snapshots (chat_id, seq)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS snapshot_rows (
+                snapshot_id INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                item TEXT,
+                amount REAL,
+                category TEXT,
+                date TEXT,
+                PRIMARY KEY (snapshot_id, id)
+            ) WITHOUT ROWID''')
+
+    def rebuild_rollups(self):
+        '''Recomputes monthly_totals from the expenses table, the caller commits'''
+        self.cursor.execute("DELETE FROM monthly_totals")
+        self.cursor.execute(f'''
+            INSERT INTO monthly_totals (chat_id, category, month, total, count)
+            SELECT chat_id, category, substr(date, 1, 7), SUM(amount), COUNT(*)
+            FROM {self.all_expenses} GROUP BY chat_id, category, substr(date, 1, 7)''')
+
+    def attach_archive(self):
+        '''Attaches the archive of closed years if it exists, does nothing once it's attached'''
+        if self.archived or not os.path.exists(self.archive_name):
+            return self.archived
+        if self.read_only:
+            self.cursor.execute("ATTACH DATABASE ? AS archive", (f"{Path(self.archive_name).as_uri()}?mode=ro",))
+        else:
+            self.cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_name,))
+            # clustered on what the period queries look up, so the archive needs no index of its own
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archive.expenses (
+                    chat_id INTEGER NOT NULL,
+                    date TEXT,
+                    id INTEGER NOT NULL,
+                    item TEXT,
+                    amount REAL,
+                    category TEXT,
+                    PRIMARY KEY (chat_id, date, id)
+                ) WITHOUT ROWID''')
+        self.archived = True
+        self.all_expenses = ALL_EXPENSES
+        logger.info(f"Attached the archive {self.archive_name}")
+        return True
+
+    def archive_closed_years(self, before=None):
+        '''Moves every expense dated before the ISO date before, this year's first day by default, to the archive.
+
+        The live table and its indexes only keep the open year, the period queries read
+        both. The rollups and the search index aren't touched, as the totals and items
+        of a chat stay the same. Returns
+        the number of expenses moved, None on errors.
+        '''
+        before = before or date(date.today().year, 1, 1).isoformat()
         try:
-            self.cursor.execute("INSERT INTO expenses (item, amount, category, date) VALUES (?, ?, ?, ?)",
-                                (item, amount, category, date.today()))
+            if not self.archived:
+                # created on the first run, ATTACH can't run inside a transaction
+                sqlite3.connect(self.archive_name).close()
+                self.attach_archive()
+
+            # a single transaction over both files. In WAL mode each file commits on its own, so a
+            # crash can leave rows in both; the next run ignores the copies it already has
+            self.cursor.execute("BEGIN")
+            for trigger in (*ROLLUP_TRIGGERS, *SEARCH_TRIGGERS):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            self.cursor.execute(
+                """INSERT OR IGNORE INTO archive.expenses (chat_id, date, id, item, amount, category)
+                   SELECT chat_id, date, id, item, amount, category FROM main.expenses WHERE date < ?""", (before,))
+            self.cursor.execute("DELETE FROM main.expenses WHERE date < ?", (before,))
+            moved = self.cursor.rowcount
+            self.create_rollups()
+            self.create_search()
             self.conn.commit()
-            logger.info(f"Added expense: {item}, {amount}, {category}")
+            logger.info(f"Archived {moved} expenses dated before {before}")
+            return moved
+        except sqlite3.Error as e:
+            logger.error(f"Error archiving the expenses before {before}: {e}")
+            self.conn.rollback()
+            return None
+
+    def _remove_archived(self, chat_id, seq, added):
+        '''Deletes from the archive the expenses of a chat listed in the rows (seq, added) of the journal'''
+        if not self.archived:
+            return
+        listed = "(chat_id, date, id) IN (SELECT ?, date, id FROM journal_rows WHERE seq = ? AND added = ?)"
+        # no trigger watches the archive, its rollups are taken away here
+        self.cursor.execute(
+            f"""INSERT INTO monthly_totals (chat_id, category, month, total, count)
+                SELECT chat_id, category, substr(date, 1, 7), -SUM(amount), -COUNT(*) FROM archive.expenses
+                WHERE {listed} GROUP BY chat_id, category, substr(date, 1, 7)
+                ON CONFLICT (chat_id, category, month) DO UPDATE
+                SET total = total + excluded.total, count = count + excluded.count""", (chat_id, seq, added))
+        self.cursor.execute(f"DELETE FROM expenses_search WHERE rowid IN (SELECT id FROM archive.expenses WHERE {listed})",
+                            (chat_id, seq, added))
+        self.cursor.execute(f"DELETE FROM archive.expenses WHERE {listed}", (chat_id, seq, added))
+        self.cursor.execute("DELETE FROM monthly_totals WHERE chat_id = ? AND count <= 0", (chat_id,))
+
+    @contextmanager
+    def bulk_load(self, chat_id, rebuild_indexes=False, outbox=True):
+        '''Loads many expenses of a chat in a single transaction.
+
+        Yields a function inserting a chunk of (item, amount, category, ISO date) rows.
+        The rollup and search triggers are dropped meanwhile and the rollups and search
+        index of the new rows are added once at the end; with rebuild_indexes the secondary indexes are dropped
+        too and built again after the last chunk, which pays off when loading into an
+        empty or small table. With outbox the new expenses are queued for google sheets
+        at the end too, when the sync is on. The load is a single journal entry, undone at once. Nothing is kept if
+        anything fails.
+        '''
+        self.cursor.execute("BEGIN")
+        try:
+            seq = self.record(chat_id, "import")
+            syncing = self.queues_outbox()
+            # the highest id ever given, archived expenses can be above the ones left in the live table.
+            # Every id after it is one of the new rows, so the range of the journal entry holds only them
+            last_id = self.cursor.execute(
+                """SELECT MAX(COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = 'expenses'), 0),
+                              COALESCE((SELECT MAX(id) FROM main.expenses), 0))""").fetchone()[0]
+            for trigger in (*ROLLUP_TRIGGERS, OUTBOX_TRIGGER, *SEARCH_TRIGGERS):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            if rebuild_indexes:
+                for index in EXPENSE_INDEXES:
+                    self.cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+            added = 0
+
+            def insert(expenses):
+                nonlocal added
+                self.cursor.executemany(
+                    "INSERT INTO expenses (chat_id, item, amount, category, date) VALUES (?, ?, ?, ?, ?)",
+                    ((chat_id, *expense) for expense in expenses))
+                added += self.cursor.rowcount
+                return self.cursor.rowcount
+
+            yield insert
+
+            for create_index in EXPENSE_INDEXES.values():
+                self.cursor.execute(create_index)
+            # new rows always get ids above the previous maximum
+            self.cursor.execute('''
+                INSERT INTO monthly_totals (chat_id, category, month, total, count)
+                SELECT chat_id, category, substr(date, 1, 7), SUM(amount), COUNT(*)
+                FROM expenses WHERE id > ? GROUP BY chat_id, category, substr(date, 1, 7)
+                ON CONFLICT (chat_id, category, month) DO UPDATE
+                SET total = total + excluded.total, count = count + excluded.count''', (last_id,))
+            self.cursor.execute(
+                f"INSERT INTO expenses_search (rowid, item, chat, date) "
+                f"SELECT id, item, {SEARCH_CHAT.format('chat_id')}, date FROM expenses WHERE id > ?", (last_id,))
+            if outbox and syncing:
+                self.cursor.execute("INSERT INTO sheet_outbox (expense_id) SELECT id FROM expenses WHERE id > ? ORDER BY id",
+                                    (last_id,))
+            self.create_rollups()
+            self.create_outbox(sync=syncing)
+            self.create_search()
+            if added:
+                # the new rows aren't copied to the journal, they are read from the table when needed
+                self.cursor.execute("UPDATE journal SET added_from = ?, added_to = (SELECT MAX(id) FROM expenses) "
+                                    "WHERE seq = ?", (last_id + 1, seq))
+            self.conn.commit()
+            logger.info(f"Bulk load committed, {added} expenses added")
+        except BaseException:
+            self.conn.rollback()
+            logger.error("Bulk load failed, rolled back")
+            raise
+
+    def migrate(self):
+        '''Brings databases created by older versions of the bot up to SCHEMA_VERSION'''
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 1:
+            # Older databases stored date.today() in a TIMESTAMP column and were queried through
+            # strftime(), normalize the values to plain ISO dates so the range queries match them
+            logger.info("Migrating database to version 1: normalizing expense dates")
+            self.cursor.execute(
+                "UPDATE expenses SET date = date(date) WHERE date IS NOT NULL AND date <> date(date)")
+
+        if version < 3:
+            # every chat gets its own ledger, what was saved before belongs to legacy_chat_id
+            logger.info(f"Migrating database to version 3: expenses and budgets of chat {self.legacy_chat_id}")
+            expense_columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(expenses)")]
+            if 'chat_id' not in expense_columns:
+                self.cursor.execute("ALTER TABLE expenses ADD COLUMN chat_id INTEGER NOT NULL DEFAULT 0")
+                self.cursor.execute("UPDATE expenses SET chat_id = ?", (self.legacy_chat_id,))
+
+            budget_columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(budgets)")]
+            if 'chat_id' not in budget_columns:
+                # the primary key changes, so the table is rebuilt
+                self.cursor.execute("ALTER TABLE budgets RENAME TO budgets_old")
+                self.create_budgets_table()
+                self.cursor.execute("INSERT INTO budgets (chat_id, category, amount) "
+                                    "SELECT ?, category, amount FROM budgets_old", (self.legacy_chat_id,))
+                self.cursor.execute("DROP TABLE budgets_old")
+
+            # the date index, rollups and their triggers are created again keyed by chat
+            self.cursor.execute("DROP INDEX IF EXISTS idx_expenses_date")
+            for trigger in ROLLUP_TRIGGERS:
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            self.cursor.execute("DROP TABLE IF EXISTS monthly_totals")
+            self.create_expenses_indexes()
+            self.rebuild_rollups()
+
+        if version < 4:
+            sql = self.cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'expenses'").fetchone()[0]
+            if 'AUTOINCREMENT' not in sql:
+                # ids are never reused from now on, the table is copied into one declared with AUTOINCREMENT.
+                # Dropping the old table drops its indexes and triggers without firing them, the rollups stay right
+                logger.info("Migrating database to version 4: expense ids that are never reused")
+                self.create_expenses_table("expenses_new")
+                self.cursor.execute("INSERT INTO expenses_new (id, item, amount, category, date, chat_id) "
+                                    "SELECT id, item, amount, category, date, chat_id FROM expenses")
+                self.cursor.execute("DROP TABLE expenses")
+                self.cursor.execute("ALTER TABLE expenses_new RENAME TO expenses")
+                self.create_expenses_indexes()
+
+            # what was saved before the journal is the starting point of every chat's replays
+            chats = self.cursor.execute(
+                "SELECT DISTINCT chat_id FROM expenses UNION SELECT chat_id FROM budgets").fetchall()
+            for (chat_id,) in chats:
+                self.snapshot(chat_id, seq=0)
+
+        if version < 5:
+            # items are searched through a full-text index from now on, built from what's saved
+            logger.info("Migrating database to version 5: full-text search of the items")
+            self.create_search()
+            self.rebuild_search()
+
+        if version < 6:
+            # bulk loads keep the range of their ids instead of a copy of their rows
+            logger.info("Migrating database to version 6: bulk loads journaled as id ranges")
+            journal_columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(journal)")]
+            for column in ("added_from", "added_to"):
+                if column not in journal_columns:
+                    self.cursor.execute(f"ALTER TABLE journal ADD COLUMN {column} INTEGER")
+
+        self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        logger.info(f"Database migrated from version {version} to {SCHEMA_VERSION}")
+
+    def add_expense(self, chat_id, item, amount, category, expense_date=None):
+        expense_date = expense_date or date.today()
+        try:
+            # journaled before the change, as a snapshot taken by record must not see it
+            seq = self.record(chat_id, "add")
+            self.cursor.execute("INSERT INTO expenses (chat_id, item, amount, category, date) VALUES (?, ?, ?, ?, ?)",
+                                (chat_id, item, amount, category, expense_date.isoformat()))
+            self.keep_rows(seq, 1, "FROM expenses WHERE id = ?", (self.cursor.lastrowid,))
+            self.conn.commit()
+            logger.debug("Added expense: %s, %s, %s", item, amount, category)
             return True
         except sqlite3.Error as e:
             logger.error(f"Error adding expense: {e}")
+            self.conn.rollback()
+            return False
+
+    def add_expenses(self, chat_id, expenses):
+        '''Inserts many (item, amount, category, ISO date) rows of a chat in a single transaction'''
+        return self.insert_expenses([(chat_id, *expense) for expense in expenses])
+
+    def insert_expenses(self, expenses):
+        '''Inserts (chat_id, item, amount, category, ISO date) rows of any chats in a single transaction'''
+        expenses = list(expenses)
+        try:
+            # one journal entry per chat, so each chat undoes its own rows
+            entries = {chat_id: self.record(chat_id, "add") for chat_id in dict.fromkeys(row[0] for row in expenses)}
+            last_id = self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+            self.cursor.executemany(
+                "INSERT INTO expenses (chat_id, item, amount, category, date) VALUES (?, ?, ?, ?, ?)", expenses)
+            added = self.cursor.rowcount
+            for chat_id, seq in entries.items():
+                self.keep_rows(seq, 1, "FROM expenses WHERE chat_id = ? AND id > ?", (chat_id, last_id))
+            self.conn.commit()
+            logger.debug("Added %s expenses", added)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error adding expenses: {e}")
+            self.conn.rollback()
             return False
 
-    def set_budget(self, category, amount):
+    def set_budget(self, chat_id, category, amount):
         try:
-            self.cursor.execute("INSERT OR REPLACE INTO budgets (category, amount) VALUES (?, ?)",
-                                (category, amount))
+            before = self.cursor.execute("SELECT amount FROM budgets WHERE chat_id = ? AND category = ?",
+                                         (chat_id, category)).fetchone()
+            self.record(chat_id, "budget", {category: [before[0] if before else None, amount]})
+            self.put_budget(chat_id, category, amount)
             self.conn.commit()
-            logger.info(f"Set budget for {category}: {amount}")
+            logger.debug("Set budget for %s: %s", category, amount)
             return True
         except sqlite3.Error as e:
             logger.error(f"Error setting budget for {category}: {e}")
+            self.conn.rollback()
             return False
 
-    def get_budgets(self):
+    def put_budget(self, chat_id, category, amount):
+        '''Sets or, for None, removes a budget without journaling it, the caller commits'''
+        if amount is None:
+            self.cursor.execute("DELETE FROM budgets WHERE chat_id = ? AND category = ?", (chat_id, category))
+        else:
+            self.cursor.execute("INSERT OR REPLACE INTO budgets (chat_id, category, amount) VALUES (?, ?, ?)",
+                                (chat_id, category, amount))
+
+    def get_budgets(self, chat_id):
+        '''[(category, amount)] of the budgets of a chat, None if it has none'''
         try:
             self.cursor.execute(
-                "SELECT * FROM budgets")
-            result = self.cursor.fetchone()
+                "SELECT category, amount FROM budgets WHERE chat_id = ? ORDER BY category", (chat_id,))
+            result = self.cursor.fetchall()
             return result if result else None
         except sqlite3.Error as e:
             logger.error(f"Error getting budgets: {e}")
             return None
         
-    def get_budget(self, category):
+    def get_budget(self, chat_id, category):
         try:
             self.cursor.execute(
-                "SELECT amount FROM budgets WHERE category = ?", (category,))
+                "SELECT amount FROM budgets WHERE chat_id = ? AND category = ?", (chat_id, category))
             result = self.cursor.fetchone()
-            logger.info(f"get_budget for '{category}': Result is {result}")
+            logger.debug("get_budget for '%s': Result is %s", category, result)
             return result[0] if result else None
         except sqlite3.Error as e:
             logger.error(f"Error getting budget for {category}: {e}")
             return None
 
-    def get_total_spents(self, category): # Renamed from get_total_spents for clarity
+    def get_budgets_status(self, chat_id, categories, year, month):
+        '''Budget and spent this month for every category in one query, {category: (budget, spent)}'''
+        categories = list(categories)
+        month_str = f"{year}-{str(month).zfill(2)}"
         try:
             self.cursor.execute(
-                "SELECT SUM(amount) FROM expenses WHERE category = ?", (category,))
+                """SELECT c.category, b.amount, COALESCE(m.total, 0)
+                    FROM (SELECT DISTINCT value AS category FROM json_each(:categories)) c
+                    LEFT JOIN budgets b ON b.chat_id = :chat_id AND b.category = c.category
+                    LEFT JOIN monthly_totals m
+                    ON m.chat_id = :chat_id AND m.category = c.category AND m.month = :month""",
+                {"categories": json.dumps(categories), "chat_id": chat_id, "month": month_str})
+            return {category: (budget, spent) for category, budget, spent in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Error getting budgets status for {categories}: {e}")
+            return {}
+
+    def get_total_spents(self, chat_id, category): # Renamed from get_total_spents for clarity
+        try:
+            # adds up the monthly rollups of the category instead of every expense ever recorded
+            self.cursor.execute(
+                "SELECT SUM(total) FROM monthly_totals WHERE chat_id = ? AND category = ?", (chat_id, category))
             result = self.cursor.fetchone()
             return result[0] if result and result[0] is not None else 0
         except sqlite3.Error as e:
             logger.error(f"Error getting total spent for {category}: {e}")
             return 0
 
+    def get_month_total(self, chat_id, category, year, month):
+        '''What was spent in a category during a month, a primary key lookup on the rollups'''
+        month_str = f"{year}-{str(month).zfill(2)}"
+        try:
+            self.cursor.execute(
+                "SELECT total FROM monthly_totals WHERE chat_id = ? AND category = ? AND month = ?",
+                (chat_id, category, month_str))
+            result = self.cursor.fetchone()
+            return result[0] if result else 0
+        except sqlite3.Error as e:
+            logger.error(f"Error getting total spent for {category} in {month_str}: {e}")
+            return 0
+
 
-    def get_all_expenses(self):
+    def get_all_expenses(self, chat_id):
         try:
-            self.cursor.execute("SELECT * FROM expenses ORDER BY date DESC")
+            self.cursor.execute(
+                f"SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ? ORDER BY date DESC",
+                (chat_id,))
             return self.cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Error getting all expenses: {e}")
             return []
 
-    def get_category_expenses(self, category):
+    def get_category_expenses(self, chat_id, category):
         try:
             self.cursor.execute(
-                "SELECT * FROM expenses WHERE category = ? ORDER BY date DESC", (category,))
+                f"SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ? AND category = ? "
+                "ORDER BY date DESC",
+                (chat_id, category))
             return self.cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Error getting expenses for category {category}: {e}")
             return []
 
-    def get_categories(self):
+    def get_categories(self, chat_id):
         try:
             # This gets categories present in expenses, might want distinct categories from budgets too
             self.cursor.execute(
-                "SELECT DISTINCT category FROM expenses") # Added DISTINCT
+                "SELECT DISTINCT category FROM monthly_totals WHERE chat_id = ?", (chat_id,))
             return [row[0] for row in self.cursor.fetchall()] # Return a list of strings
         except sqlite3.Error as e:
             logger.error(f"Error getting categories from expenses: {e}")
             return []
 
-    # Renamed from get_sp for clarity
-    def get_expenses_today(self):
-        today_str = date.today().isoformat() # YYYY-MM-DD
+    def get_expenses_between(self, chat_id, start, end):
+        '''Expenses of a chat dated in the half-open range [start, end), both ISO dates'''
         try:
-            # Ensure date in table is stored as YYYY-MM-DD string or compatible for this comparison
-            # If 'date' column is TIMESTAMP and stores full datetime, use strftime on the column
             self.cursor.execute(
-                "SELECT * FROM expenses WHERE date(date) = ?", (today_str,))
+                f"SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ? AND date >= ? AND date < ? "
+                "ORDER BY date, id",
+                (chat_id, start, end)
+            )
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Error getting expenses for today ({today_str}): {e}")
+            logger.error(f"Error getting expenses between {start} and {end}: {e}")
             return []
 
-    def get_expenses_by_year(self, year):
+    def get_expenses_page(self, chat_id, start, end, after=None, before=None, limit=20):
+        '''A page of the expenses in [start, end) ordered by (date, id), using keyset pagination.
+
+        after or before are the (date, id) of the last or first row of the page shown
+        before, so each page is an index range lookup however deep it is. Returns the
+        rows and whether there are previous and next pages.
+        '''
+        period = f"SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ? AND date >= ? AND date < ?"
+        try:
+            if before is not None:
+                self.cursor.execute(
+                    f"""{period} AND (date, id) < (?, ?)
+                       ORDER BY date DESC, id DESC LIMIT ?""", (chat_id, start, end, *before, limit + 1))
+                rows = self.cursor.fetchall()
+                return rows[:limit][::-1], len(rows) > limit, True
+
+            if after is not None:
+                self.cursor.execute(
+                    f"""{period} AND (date, id) > (?, ?)
+                       ORDER BY date, id LIMIT ?""", (chat_id, start, end, *after, limit + 1))
+            else:
+                self.cursor.execute(f"{period} ORDER BY date, id LIMIT ?", (chat_id, start, end, limit + 1))
+            rows = self.cursor.fetchall()
+            return rows[:limit], after is not None, len(rows) > limit
+        except sqlite3.Error as e:
+            logger.error(f"Error getting a page of expenses between {start} and {end}: {e}")
+            return [], False, False
+
+    def get_period_totals(self, chat_id, start, end, bucket="day"):
+        '''Totals of [start, end) by category, by day (or "month") and overall, in one aggregated query.
+
+        Returns (kind, key, total, count) rows where kind is 'category', 'day' or
+        'month', and 'total' for the last row.
+        '''
+        length = 7 if bucket == "month" else 10 # length of 'YYYY-MM' or 'YYYY-MM-DD'
         try:
             self.cursor.execute(
-                "SELECT * FROM expenses WHERE strftime('%Y', date) = ?",
-                (str(year),)
-            )
+                f"""SELECT 'category', category, SUM(amount), COUNT(*) FROM {self.all_expenses}
+                   WHERE chat_id = :chat_id AND date >= :start AND date < :end GROUP BY category
+                   UNION ALL
+                   SELECT :bucket, substr(date, 1, :length), SUM(amount), COUNT(*) FROM {self.all_expenses}
+                   WHERE chat_id = :chat_id AND date >= :start AND date < :end GROUP BY substr(date, 1, :length)
+                   UNION ALL
+                   SELECT 'total', NULL, COALESCE(SUM(amount), 0), COUNT(*) FROM {self.all_expenses}
+                   WHERE chat_id = :chat_id AND date >= :start AND date < :end""",
+                {"chat_id": chat_id, "start": start, "end": end, "bucket": bucket, "length": length})
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Error getting expenses for year {year}: {e}")
+            logger.error(f"Error getting the totals between {start} and {end}: {e}")
             return []
 
-    def get_expenses_by_month_year(self, year, month):
-        month_str = str(month).zfill(2)
-        year_month_str = f"{year}-{month_str}"
+    def get_daily_totals(self, chat_id, start, end):
+        '''(ISO date, category, total) of every day and category with expenses in [start, end)'''
         try:
             self.cursor.execute(
-                "SELECT * FROM expenses WHERE strftime('%Y-%m', date) = ?",
-                (year_month_str,)
-            )
+                f"""SELECT date, category, SUM(amount) FROM {self.all_expenses}
+                   WHERE chat_id = ? AND date >= ? AND date < ? GROUP BY date, category""",
+                (chat_id, start, end))
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Error getting expenses for {year_month_str}: {e}")
+            logger.error(f"Error getting the daily totals between {start} and {end}: {e}")
             return []
 
-    def get_expenses_by_day_month_year(self, year, month, day):
-        month_str = str(month).zfill(2)
-        day_str = str(day).zfill(2)
-        date_str = f"{year}-{month_str}-{day_str}"
+    def search_expenses(self, chat_id, words, category=None, start=None, end=None, offset=0, limit=20):
+        '''A page of the expenses of a chat with item words starting with every one of words, best match first.
+
+        Matches are ranked by bm25 and then newest first, category and the ISO dates of
+        [start, end) narrow them down. Returns the rows and whether there's a next page.
+        '''
+        match = search_match(chat_id, words)
+        if match is None:
+            return [], False
+        if self.archived:
+            # the expenses that aren't live are looked up in the archive by its primary key
+            columns = ("s.rowid, COALESCE(e.item, a.item), COALESCE(e.amount, a.amount), "
+                       "COALESCE(e.category, a.category), s.date")
+            source = '''expenses_search s LEFT JOIN main.expenses e ON e.id = s.rowid
+                LEFT JOIN archive.expenses a ON e.id IS NULL AND a.chat_id = :chat_id AND a.date = s.date
+                AND a.id = s.rowid'''
+            filters = "(e.id IS NOT NULL OR a.id IS NOT NULL)"
+            category_column = "COALESCE(e.category, a.category)"
+        else:
+            columns = "e.id, e.item, e.amount, e.category, e.date"
+            source = "expenses_search s JOIN main.expenses e ON e.id = s.rowid"
+            filters = "e.chat_id = :chat_id"
+            category_column = "e.category"
+        if category is not None:
+            filters += f" AND {category_column} = :category COLLATE NOCASE"
         try:
             self.cursor.execute(
-                "SELECT * FROM expenses WHERE date(date) = ?", # Using date() function for comparison
-                (date_str,)
-            )
-            return self.cursor.fetchall()
+                f'''SELECT {columns} FROM {source}
+                   WHERE expenses_search MATCH :match AND s.date >= :start AND s.date < :end AND {filters}
+                   ORDER BY bm25(expenses_search, 1.0, 0.0), s.date DESC, s.rowid DESC LIMIT :limit OFFSET :offset''',
+                {"match": match, "chat_id": chat_id, "category": category, "start": start or "0001-01-01",
+                 "end": end or "9999-12-31", "limit": limit + 1, "offset": offset})
+            rows = self.cursor.fetchall()
+            return rows[:limit], len(rows) > limit
         except sqlite3.Error as e:
-            logger.error(f"Error getting expenses for {date_str}: {e}")
-            return []
+            logger.error(f"Error searching the expenses for {words}: {e}")
+            return [], False
+
+    def iter_expenses_between(self, chat_id, start, end, batch_size=500):
+        '''Like get_expenses_between but yields the rows in batches, without loading them all.
 
-    def delete_last_expense(self): # Renamed from del_last
+        Every batch is a page of its own query, so nothing is left open between them: a
+        statement kept open would hold the read lock and, without WAL, block every writer
+        for as long as the caller takes with each batch. Rows written meanwhile are read
+        if they come after the last batch.
+        '''
+        after = None
+        while True:
+            rows, _, more = self.get_expenses_page(chat_id, start, end, after=after, limit=batch_size)
+            if rows:
+                yield rows
+            if not more:
+                return
+            after = rows[-1][4], rows[-1][0]
+
+    # Renamed from get_sp for clarity
+    def get_expenses_today(self, chat_id):
+        today = date.today()
+        return self.get_expenses_between(chat_id, *period_bounds(today.year, today.month, today.day))
+
+    def get_expenses_by_year(self, chat_id, year):
+        return self.get_expenses_between(chat_id, *period_bounds(year))
+
+    def get_expenses_by_month_year(self, chat_id, year, month):
+        return self.get_expenses_between(chat_id, *period_bounds(year, month))
+
+    def get_expenses_by_day_month_year(self, chat_id, year, month, day):
+        return self.get_expenses_between(chat_id, *period_bounds(year, month, day))
+
+    def delete_last_expense(self, chat_id): # Renamed from del_last
+        '''Deletes the newest expense of a chat and returns its row, None if there were none'''
         try:
-            # Check if there are any expenses first
-            self.cursor.execute("SELECT id FROM expenses ORDER BY id DESC LIMIT 1")
+            # Check if there are any expenses first. Only the live table is read: what is added after
+            # an archival always lands there, so the newest expense is never archived
+            self.cursor.execute(
+                f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE chat_id = ? ORDER BY id DESC LIMIT 1", (chat_id,))
             last_expense = self.cursor.fetchone()
             if last_expense:
+                self.keep_rows(self.record(chat_id, "delete"), 0, "FROM expenses WHERE id = ?", (last_expense[0],))
                 self.cursor.execute("DELETE FROM expenses WHERE id = ?", (last_expense[0],))
                 self.conn.commit()
-                logger.info(f"Deleted last expense with id: {last_expense[0]}")
-                return True
+                logger.debug("Deleted last expense with id: %s", last_expense[0])
+                return last_expense
             else:
-                logger.info("No expenses to delete.")
-                return False
+                logger.debug("No expenses to delete.")
+                return None
         except sqlite3.Error as e:
             logger.error(f"Error deleting last expense: {e}")
-            return False
+            self.conn.rollback()
+            return None
 
-    def clear_all_expenses(self): # Renamed from clear_expenses
-        logger.warning("Attempting to clear all expenses by dropping and recreating the 'expenses' table.")
+    def clear_all_expenses(self, chat_id): # Renamed from clear_expenses
+        logger.warning(f"Attempting to clear all expenses of chat {chat_id}.")
         try:
-            self.cursor.execute("DROP TABLE IF EXISTS expenses")
-            logger.info("'expenses' table dropped.")
-            # Recreate the table
-            self.cursor.execute('''
-                CREATE TABLE expenses (
-                    id INTEGER PRIMARY KEY,
-                    item TEXT,
-                    amount REAL,
-                    category TEXT,
-                    date TIMESTAMP
-                )''')
+            # the rows are kept in the journal, so the clear can be undone
+            self.keep_rows(self.record(chat_id, "clear"), 0, f"FROM {self.all_expenses} WHERE chat_id = ?", (chat_id,))
+            # other chats share the table, so only this chat's rows are deleted, the triggers empty its rollups
+            self.cursor.execute("DELETE FROM expenses WHERE chat_id = ?", (chat_id,))
+            cleared = self.cursor.rowcount
+            if self.archived:
+                self.cursor.execute(
+                    "DELETE FROM expenses_search WHERE rowid IN (SELECT id FROM archive.expenses WHERE chat_id = ?)",
+                    (chat_id,))
+                self.cursor.execute("DELETE FROM archive.expenses WHERE chat_id = ?", (chat_id,))
+                cleared += self.cursor.rowcount
+                # nothing of the chat is left, neither are its rollups
+                self.cursor.execute("DELETE FROM monthly_totals WHERE chat_id = ?", (chat_id,))
             self.conn.commit()
-            logger.info("'expenses' table recreated successfully after clearing.")
+            logger.info(f"Cleared {cleared} expenses of chat {chat_id}.")
             return True
         except sqlite3.Error as e:
             logger.error(f"Error clearing all expenses: {e}")
+            self.conn.rollback()
             return False
             
-    def clear_all_budgets(self):
-        logger.warning("Attempting to clear all budgets by dropping and recreating the 'budgets' table.")
+    def clear_all_budgets(self, chat_id):
+        logger.warning(f"Attempting to clear all budgets of chat {chat_id}.")
         try:
-            self.cursor.execute("DROP TABLE IF EXISTS budgets")
-            logger.info("'budgets' table dropped.")
-            # Recreate the table
-            self.cursor.execute('''
-                CREATE TABLE budgets (
-                    category TEXT PRIMARY KEY,
-                    amount REAL
-                )''')
+            budgets = self.cursor.execute("SELECT category, amount FROM budgets WHERE chat_id = ?", (chat_id,))
+            self.record(chat_id, "clear budgets", {category: [amount, None] for category, amount in budgets.fetchall()})
+            self.cursor.execute("DELETE FROM budgets WHERE chat_id = ?", (chat_id,))
             self.conn.commit()
-            logger.info("'budgets' table recreated successfully after clearing.")
+            logger.info(f"Cleared the budgets of chat {chat_id}.")
             return True
         except sqlite3.Error as e:
             logger.error(f"Error clearing all budgets: {e}")
+            self.conn.rollback()
+            return False
+
+    # The journal. Every write above appends an entry in its own transaction; undo and redo
+    # revert one entry per step through the head and redo stack of the chat, and restore
+    # rebuilds a point in time from the latest snapshot before it.
+
+    def journal_state(self, chat_id):
+        '''(head, redo_depth, since_snapshot) of a chat'''
+        state = self.cursor.execute("SELECT head, redo_depth, since_snapshot FROM journal_state WHERE chat_id = ?",
+                                    (chat_id,)).fetchone()
+        return state or (None, 0, 0)
+
+    def get_data_version(self, chat_id):
+        '''The seq of the newest journal entry of a chat. Every change of its expenses or budgets moves it
+        forward and it's kept in the database, so it tells if something cached outside of it is current'''
+        try:
+            self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM journal WHERE chat_id = ?", (chat_id,))
+            return self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting the data version of chat {chat_id}: {e}")
+            return None
+
+    def _set_journal_state(self, chat_id, head, redo_depth, since_snapshot):
+        self.cursor.execute(
+            """INSERT INTO journal_state (chat_id, head, redo_depth, since_snapshot) VALUES (?, ?, ?, ?)
+               ON CONFLICT (chat_id) DO UPDATE SET head = excluded.head, redo_depth = excluded.redo_depth,
+               since_snapshot = excluded.since_snapshot""", (chat_id, head, redo_depth, since_snapshot))
+
+    def _append(self, chat_id, parent, action, budgets, since_snapshot):
+        '''Appends an entry, after a snapshot if the chat is due one, returns its seq and the new since_snapshot'''
+        if since_snapshot >= SNAPSHOT_INTERVAL:
+            # a snapshot copies the whole chat, taking one every max(interval, size) entries keeps its cost
+            # per entry constant however big the chat is
+            size = self.cursor.execute("SELECT COALESCE(SUM(count), 0) FROM monthly_totals WHERE chat_id = ?",
+                                       (chat_id,)).fetchone()[0]
+            if since_snapshot >= size:
+                self.snapshot(chat_id)
+                self.compact_journal(chat_id)
+                since_snapshot = 0
+        self.cursor.execute(
+            "INSERT INTO journal (chat_id, parent, action, budgets, created) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, parent, action, json.dumps(budgets) if budgets else None,
+             datetime.now().isoformat(sep=" ", timespec="seconds")))
+        return self.cursor.lastrowid, since_snapshot + 1
+
+    def record(self, chat_id, action, budgets=None):
+        '''Journals a new change of a chat and returns its seq, the caller keeps its rows and commits.
+
+        The entry becomes the head and nothing undone before can be redone anymore.
+        '''
+        head, redo_depth, since_snapshot = self.journal_state(chat_id)
+        seq, since_snapshot = self._append(chat_id, head, action, budgets, since_snapshot)
+        if redo_depth:
+            self.cursor.execute("DELETE FROM journal_redo WHERE chat_id = ?", (chat_id,))
+        self._set_journal_state(chat_id, seq, 0, since_snapshot)
+        return seq
+
+    def keep_rows(self, seq, added, source, parameters=()):
+        '''Copies the expenses selected by source ("FROM expenses WHERE ...") to the rows of an entry'''
+        self.cursor.execute(
+            f"INSERT INTO journal_rows (seq, added, id, item, amount, category, date) "
+            f"SELECT ?, ?, id, item, amount, category, date {source}", (seq, added, *parameters))
+
+    def snapshot(self, chat_id, seq=None):
+        '''Copies the expenses and budgets of a chat as they are after its entry seq, the newest by default'''
+        if seq is None:
+            seq = self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM journal WHERE chat_id = ?",
+                                      (chat_id,)).fetchone()[0]
+        budgets = self.cursor.execute("SELECT category, amount FROM budgets WHERE chat_id = ?", (chat_id,)).fetchall()
+        self.cursor.execute("INSERT INTO journal_snapshots (chat_id, seq, budgets, created) VALUES (?, ?, ?, ?)",
+                            (chat_id, seq, json.dumps(dict(budgets)),
+                             datetime.now().isoformat(sep=" ", timespec="seconds")))
+        snapshot_id = self.cursor.lastrowid
+        self.cursor.execute(
+            f"""INSERT INTO snapshot_rows (snapshot_id, id, item, amount, category, date)
+               SELECT ?, id, item, amount, category, date FROM {self.all_expenses} WHERE chat_id = ?""",
+            (snapshot_id, chat_id))
+        logger.debug("Snapshot %s of chat %s at entry %s", snapshot_id, chat_id, seq)
+        return snapshot_id
+
+    def compact_journal(self, chat_id, before=None):
+        '''Drops the entries of a chat older than before, JOURNAL_DAYS ago by default, returns how many.
+
+        Entries are dropped up to the newest snapshot old enough, never past one that can still
+        be redone. The entry of that snapshot is kept, so the data version of the chat never goes
+        back, and it's the oldest moment a restore can reach. The caller commits.
+        '''
+        if before is None:
+            before = datetime.now() - timedelta(days=JOURNAL_DAYS)
+        limit = self.cursor.execute("SELECT MAX(seq) FROM journal WHERE chat_id = ? AND created < ?",
+                                    (chat_id, before.isoformat(sep=" ", timespec="seconds"))).fetchone()[0]
+        if limit is None:
+            return 0
+        redo = self.cursor.execute("SELECT MIN(seq) FROM journal_redo WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+        if redo is not None:
+            limit = min(limit, redo)
+        base = self.cursor.execute("SELECT MAX(seq) FROM journal_snapshots WHERE chat_id = ? AND seq <= ?",
+                                   (chat_id, limit)).fetchone()[0]
+        if not base:
+            return 0
+
+        self.cursor.execute(
+            "DELETE FROM journal_rows WHERE seq IN (SELECT seq FROM journal WHERE chat_id = ? AND seq < ?)",
+            (chat_id, base))
+        self.cursor.execute("DELETE FROM journal WHERE chat_id = ? AND seq < ?", (chat_id, base))
+        dropped = self.cursor.rowcount
+        self.cursor.execute(
+            "DELETE FROM snapshot_rows WHERE snapshot_id IN (SELECT id FROM journal_snapshots WHERE chat_id = ? AND seq < ?)",
+            (chat_id, base))
+        self.cursor.execute("DELETE FROM journal_snapshots WHERE chat_id = ? AND seq < ?", (chat_id, base))
+        if dropped:
+            logger.info(f"Dropped {dropped} journal entries of chat {chat_id} older than {before}")
+        return dropped
+
+    def journal_floor(self, chat_id):
+        '''When the oldest entry compact_journal left of a chat was made, None if nothing was dropped'''
+        oldest = self.cursor.execute("SELECT seq, created FROM journal WHERE chat_id = ? ORDER BY seq LIMIT 1",
+                                     (chat_id,)).fetchone()
+        # otherwise the oldest snapshot is at 0 or SNAPSHOT_INTERVAL entries after the first one
+        if oldest and self.cursor.execute("SELECT 1 FROM journal_snapshots WHERE chat_id = ? AND seq = ?",
+                                          (chat_id, oldest[0])).fetchone():
+            return datetime.fromisoformat(oldest[1])
+        return None
+
+    def _range_rows(self, chat_id, seq, added_from, added_to):
+        '''The expenses the bulk load of entry seq added, from the table or from the entries that removed them'''
+        # expenses never change, what a later entry removed is what the load added
+        return self.cursor.execute(
+            f"""SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ? AND id BETWEEN ? AND ?
+                UNION SELECT id, item, amount, category, date FROM journal_rows
+                WHERE seq > ? AND added = 0 AND id BETWEEN ? AND ?""",
+            (chat_id, added_from, added_to, seq, added_from, added_to)).fetchall()
+
+    def _revert(self, chat_id, source, seq):
+        '''Applies the opposite of entry source as the changes of entry seq, returns the budgets of seq'''
+        added_from, added_to = self.cursor.execute("SELECT added_from, added_to FROM journal WHERE seq = ?",
+                                                   (source,)).fetchone()
+        if added_from is not None:
+            # a bulk load is copied when it's first reverted. Only the head is, so whatever it added is
+            # back in the table by now
+            self.keep_rows(source, 1, f"FROM {self.all_expenses} WHERE chat_id = ? AND id BETWEEN ? AND ?",
+                           (chat_id, added_from, added_to))
+            self.cursor.execute("UPDATE journal SET added_from = NULL, added_to = NULL WHERE seq = ?", (source,))
+        # what source added is removed, what it removed comes back under the same ids. It comes back to the
+        # live table even if it had been archived, the next archival moves it again
+        self.cursor.execute(
+            """INSERT INTO journal_rows (seq, added, id, item, amount, category, date)
+               SELECT ?, 1 - added, id, item, amount, category, date FROM journal_rows WHERE seq = ?""",
+            (seq, source))
+        self.cursor.execute("DELETE FROM expenses WHERE id IN (SELECT id FROM journal_rows WHERE seq = ? AND added = 1)",
+                            (source,))
+        self._remove_archived(chat_id, source, 1)
+        with self.outbox_paused():
+            self.cursor.execute(
+                """INSERT INTO expenses (id, chat_id, item, amount, category, date)
+                   SELECT id, ?, item, amount, category, date FROM journal_rows WHERE seq = ? AND added = 0""",
+                (chat_id, source))
+        budgets = self.cursor.execute("SELECT budgets FROM journal WHERE seq = ?", (source,)).fetchone()[0]
+        budgets = json.loads(budgets) if budgets else {}
+        for category, (before, _) in budgets.items():
+            self.put_budget(chat_id, category, before)
+        reverted = {category: [after, before] for category, (before, after) in budgets.items()}
+        if reverted:
+            self.cursor.execute("UPDATE journal SET budgets = ? WHERE seq = ?", (json.dumps(reverted), seq))
+
+    def undo(self, chat_id, steps=1):
+        '''Reverts the last steps changes of a chat, returns the actions undone, newest first.
+
+        Every step reads the head entry, appends its opposite and moves the head to its
+        parent, so it costs the same however long the journal is.
+        '''
+        undone = []
+        try:
+            for _ in range(steps):
+                head, redo_depth, since_snapshot = self.journal_state(chat_id)
+                if head is None:
+                    # expenses saved before the journal have no entries, the newest one is taken back like
+                    # delete_last_expense does, as an entry redo can revert
+                    last = self.cursor.execute("SELECT id FROM expenses WHERE chat_id = ? ORDER BY id DESC LIMIT 1",
+                                               (chat_id,)).fetchone()
+                    if last is None:
+                        break
+                    parent, action = None, "add"
+                    seq, since_snapshot = self._append(chat_id, None, "undo add", None, since_snapshot)
+                    self.keep_rows(seq, 0, "FROM expenses WHERE id = ?", last)
+                    self.cursor.execute("DELETE FROM expenses WHERE id = ?", last)
+                else:
+                    entry = self.cursor.execute("SELECT parent, action FROM journal WHERE seq = ?", (head,)).fetchone()
+                    if entry is None:
+                        break # dropped by compact_journal
+                    parent, action = entry
+                    seq, since_snapshot = self._append(chat_id, None, f"undo {action}", None, since_snapshot)
+                    self._revert(chat_id, head, seq)
+                self.cursor.execute("INSERT INTO journal_redo (chat_id, depth, seq) VALUES (?, ?, ?)",
+                                    (chat_id, redo_depth + 1, seq))
+                self._set_journal_state(chat_id, parent, redo_depth + 1, since_snapshot)
+                undone.append(action)
+            self.conn.commit()
+            logger.debug("Undid %s of chat %s", undone, chat_id)
+            return undone
+        except sqlite3.Error as e:
+            logger.error(f"Error undoing the changes of chat {chat_id}: {e}")
+            self.conn.rollback()
+            return []
+
+    def redo(self, chat_id, steps=1):
+        '''Applies again the last steps changes undone in a chat, returns their actions'''
+        redone = []
+        try:
+            for _ in range(steps):
+                head, redo_depth, since_snapshot = self.journal_state(chat_id)
+                if not redo_depth:
+                    break
+                undo_seq, action = self.cursor.execute(
+                    """SELECT r.seq, j.action FROM journal_redo r JOIN journal j ON j.seq = r.seq
+                       WHERE r.chat_id = ? AND r.depth = ?""", (chat_id, redo_depth)).fetchone()
+                action = action.removeprefix("undo ")
+                # the redone change is a new entry on top of the head, which undo can revert again
+                seq, since_snapshot = self._append(chat_id, head, action, None, since_snapshot)
+                self._revert(chat_id, undo_seq, seq)
+                self.cursor.execute("DELETE FROM journal_redo WHERE chat_id = ? AND depth = ?", (chat_id, redo_depth))
+                self._set_journal_state(chat_id, seq, redo_depth - 1, since_snapshot)
+                redone.append(action)
+            self.conn.commit()
+            logger.debug("Redid %s of chat %s", redone, chat_id)
+            return redone
+        except sqlite3.Error as e:
+            logger.error(f"Error redoing the changes of chat {chat_id}: {e}")
+            self.conn.rollback()
+            return []
+
+    def state_at(self, chat_id, seq):
+        '''({id: (item, amount, category, date)}, {category: amount}) of a chat after its entry seq.
+
+        Starts from the newest snapshot at or before seq and replays the entries after it.
+        '''
+        snapshot = self.cursor.execute(
+            "SELECT id, seq, budgets FROM journal_snapshots WHERE chat_id = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+            (chat_id, seq)).fetchone()
+        expenses, budgets, start = {}, {}, 0
+        if snapshot:
+            snapshot_id, start, budgets = snapshot
+            budgets = json.loads(budgets)
+            rows = self.cursor.execute(
+                "SELECT id, item, amount, category, date FROM snapshot_rows WHERE snapshot_id = ?", (snapshot_id,))
+            expenses = {row[0]: row[1:] for row in rows.fetchall()}
+
+        rows = self.cursor.execute(
+            """SELECT r.seq, r.added, r.id, r.item, r.amount, r.category, r.date
+               FROM journal j JOIN journal_rows r ON r.seq = j.seq
+               WHERE j.chat_id = ? AND j.seq > ? AND j.seq <= ? ORDER BY r.seq, r.added""", (chat_id, start, seq))
+        changes = {}
+        for row in rows.fetchall():
+            changes.setdefault(row[0], []).append(row[1:])
+        entries = self.cursor.execute(
+            "SELECT seq, budgets, added_from, added_to FROM journal WHERE chat_id = ? AND seq > ? AND seq <= ? "
+            "ORDER BY seq", (chat_id, start, seq)).fetchall()
+        for entry_seq, entry_budgets, added_from, added_to in entries:
+            if added_from is not None:
+                for id, *expense in self._range_rows(chat_id, entry_seq, added_from, added_to):
+                    expenses[id] = tuple(expense)
+            # the removed rows come first, as an entry can remove and add back the same id
+            for added, id, *expense in changes.get(entry_seq, ()):
+                if added:
+                    expenses[id] = tuple(expense)
+                else:
+                    expenses.pop(id, None)
+            for category, (_, after) in (json.loads(entry_budgets) if entry_budgets else {}).items():
+                if after is None:
+                    budgets.pop(category, None)
+                else:
+                    budgets[category] = after
+        return expenses, budgets
+
+    def restore_expenses(self, chat_id, moment):
+        '''Brings the expenses and budgets of a chat back to how they were at moment, a datetime.
+
+        The restore is a journal entry of its own, so it can be undone. Returns the
+        number of expenses removed and brought back, None on errors and for moments
+        older than the journal kept (see compact_journal).
+        '''
+        try:
+            floor = self.journal_floor(chat_id)
+            if floor is not None and moment < floor:
+                logger.info(f"Chat {chat_id} can't be restored to {moment}, its journal starts at {floor}")
+                return None
+            seq = self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM journal WHERE chat_id = ? AND created <= ?",
+                                      (chat_id, moment.isoformat(sep=" ", timespec="seconds"))).fetchone()[0]
+            expenses, budgets = self.state_at(chat_id, seq)
+
+            current = {row[0]: row[1:] for row in self.cursor.execute(
+                f"SELECT {EXPENSE_COLUMNS} FROM {self.all_expenses} WHERE chat_id = ?", (chat_id,)).fetchall()}
+            removed = [(id, *current[id]) for id in current.keys() - expenses.keys()]
+            added = [(id, *expenses[id]) for id in expenses.keys() - current.keys()]
+            current_budgets = dict(self.cursor.execute("SELECT category, amount FROM budgets WHERE chat_id = ?",
+                                                       (chat_id,)).fetchall())
+            changed = {category: [current_budgets.get(category), budgets.get(category)]
+                       for category in current_budgets.keys() | budgets.keys()
+                       if current_budgets.get(category) != budgets.get(category)}
+
+            entry = self.record(chat_id, "restore", changed)
+            self.cursor.executemany(
+                "INSERT INTO journal_rows (seq, added, id, item, amount, category, date) VALUES (?, 0, ?, ?, ?, ?, ?)",
+                ((entry, *expense) for expense in removed))
+            self.cursor.executemany("DELETE FROM expenses WHERE id = ?", ((expense[0],) for expense in removed))
+            self._remove_archived(chat_id, entry, 0)
+            with self.outbox_paused():
+                self.cursor.executemany(
+                    "INSERT INTO expenses (id, chat_id, item, amount, category, date) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((id, chat_id, *expense) for id, *expense in added))
+            self.cursor.executemany(
+                "INSERT INTO journal_rows (seq, added, id, item, amount, category, date) VALUES (?, 1, ?, ?, ?, ?, ?)",
+                ((entry, *expense) for expense in added))
+            for category, (_, after) in changed.items():
+                self.put_budget(chat_id, category, after)
+            self.conn.commit()
+            logger.info(f"Restored chat {chat_id} to {moment}: {len(removed)} expenses removed, {len(added)} back")
+            return len(removed), len(added)
+        except sqlite3.Error as e:
+            logger.error(f"Error restoring chat {chat_id} to {moment}: {e}")
+            self.conn.rollback()
+            return None
+
+    def get_outbox(self, limit=100):
+        '''The oldest expenses waiting for google sheets, [(outbox id, (chat_id, item, amount, category, date))].
+
+        The row is None for expenses deleted before they were sent.
+        '''
+        try:
+            self.cursor.execute(
+                """SELECT o.id, e.chat_id, e.item, e.amount, e.category, e.date FROM sheet_outbox o
+                   LEFT JOIN expenses e ON e.id = o.expense_id ORDER BY o.id LIMIT ?""", (limit,))
+            return [(row[0], row[1:] if row[1] is not None else None) for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading the sheet outbox: {e}")
+            return []
+
+    def ack_outbox(self, ids):
+        '''Removes the expenses already sent to google sheets from the outbox'''
+        try:
+            self.cursor.executemany("DELETE FROM sheet_outbox WHERE id = ?", ((id,) for id in ids))
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error clearing the sheet outbox: {e}")
+            self.conn.rollback()
             return False
 
     def close(self):
         if self.conn:
-            logger.info(f"Closing database connection to {self.db_name}")
+            logger.debug("Closing database connection to %s", self.db_name)
             self.conn.close()
             self.conn = None # Set to None to prevent further use
         else:
-            logger.info("Database connection already closed or was never opened.")
+            logger.debug("Database connection already closed or was never opened.")
 
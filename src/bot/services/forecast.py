@@ -0,0 +1,207 @@
+import asyncio
+import calendar
+import logging
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from .databaseManager import period_bounds
+from .messageFormatter import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# writes that can change any expense of their chat, the chat's month is loaded again after them
+RELOADING_WRITES = {'clear_all_expenses', 'import_expenses', 'random_spents', 'undo', 'redo', 'restore_expenses'}
+
+
+class Month_Totals():
+    '''What a chat spent in every category on every day of a month, a (categories, days) array.
+
+    Built from Database_Manager.get_daily_totals and the chat's budgets, then kept
+    up to date with add and set_budget as the expenses arrive, without going back
+    to the database. budgets is NaN for the categories without one.
+    '''
+
+    def __init__(self, year, month, rows=(), budgets=()):
+        self.year = year
+        self.month = month
+        self.days = calendar.monthrange(year, month)[1]
+        budgets = dict(budgets)
+        # the categories spent in this month and the ones with a budget
+        self.categories = list(dict.fromkeys([*(category for _, category, _ in rows), *budgets]))
+        self._index = {category: row for row, category in enumerate(self.categories)}
+        self.daily = np.zeros((len(self.categories), self.days))
+        self.budgets = np.full(len(self.categories), np.nan)
+
+        if rows:
+            days, categories, totals = zip(*rows)
+            # a row per day and category, so every cell is set once
+            self.daily[[self._index[category] for category in categories], [int(day[8:]) - 1 for day in days]] = totals
+        for category, amount in budgets.items():
+            self.budgets[self._index[category]] = amount
+
+    def _row(self, category):
+        row = self._index.get(category)
+        if row is None:
+            row = self._index[category] = len(self.categories)
+            self.categories.append(category)
+            self.daily = np.vstack([self.daily, np.zeros(self.days)])
+            self.budgets = np.append(self.budgets, np.nan)
+        return row
+
+    def holds(self, day):
+        '''If an ISO date falls in this month'''
+        return day[:7] == f"{self.year:04d}-{self.month:02d}"
+
+    def add(self, category, day, amount):
+        '''Adds amount (negative for a deleted expense) to a category on an ISO date of this month'''
+        row = self._row(category) # it may grow the arrays, so before indexing them
+        self.daily[row, int(day[8:10]) - 1] += amount
+
+    def set_budget(self, category, amount):
+        '''Sets the budget of a category, None removes it'''
+        row = self._row(category)
+        self.budgets[row] = np.nan if amount is None else amount
+
+    def project(self, day):
+        '''Spending by the end of the month and budget exhaustion of every category, in one vectorized pass.
+
+        day is the day of the month it is, what was spent on it counts. Every
+        category is projected at its average daily spend so far. Returns
+        (category, spent, projected, budget, exhausted) tuples, most projected
+        first: budget is None without one and exhausted the day of the month the
+        budget ran or will run out, None if it lasts the month.
+        '''
+        cumulative = np.cumsum(self.daily[:, :day], axis=1)
+        spent = cumulative[:, -1]
+        rate = spent / day
+        projected = spent + rate * (self.days - day)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # a NaN budget is never reached
+            over = cumulative >= self.budgets[:, None]
+            # the day the running total reached the budget, or the day it will at the current rate
+            ran_out = over.argmax(axis=1) + 1
+            will_run_out = day + np.ceil((self.budgets - spent) / rate)
+        exhausted = np.where(over.any(axis=1), ran_out, np.where(will_run_out <= self.days, will_run_out, 0))
+
+        forecasts = zip(self.categories, spent.tolist(), projected.tolist(),
+                        [None if np.isnan(budget) else budget for budget in self.budgets.tolist()],
+                        [int(day) or None for day in exhausted.tolist()])
+        return sorted(forecasts, key=lambda forecast: (-forecast[2], forecast[0]))
+
+
+class Forecaster():
+    '''Month_Totals of the current month of every chat, kept in an LRU of size chats.
+
+    A cached month follows the writes of its chat in place: added and deleted
+    expenses and budget changes update its arrays, and only the writes that can
+    change any expense (clears, imports, the journal) make it load again. A month
+    loaded while a write of its chat came in isn't kept, it may have missed it.
+    '''
+
+    def __init__(self, db_manager, size=1024):
+        self.model = db_manager
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._months = OrderedDict() # chat_id: Month_Totals
+        self._versions = {} # chat_id: writes seen
+        self._generation = 0 # writes that could change every chat
+        db_manager.add_listener(self.on_write)
+
+    def version(self, chat_id):
+        return self._generation, self._versions.get(chat_id, 0)
+
+    async def month(self, chat_id, year, month):
+        totals = self._months.get(chat_id)
+        if totals is not None and (totals.year, totals.month) == (year, month):
+            self.hits += 1
+            self._months.move_to_end(chat_id)
+            return totals
+
+        self.misses += 1
+        version = self.version(chat_id)
+        rows, budgets = await asyncio.gather(self.model.get_daily_totals(chat_id, *period_bounds(year, month)),
+                                             self.model.get_budgets(chat_id))
+        totals = Month_Totals(year, month, rows, budgets or ())
+        if version == self.version(chat_id):
+            self._months[chat_id] = totals
+            self._months.move_to_end(chat_id)
+            while len(self._months) > self.size:
+                self._months.popitem(last=False)
+        return totals
+
+    async def forecast(self, chat_id, today=None):
+        '''Month_Totals.project of a chat for today'''
+        today = today or date.today()
+        totals = await self.month(chat_id, today.year, today.month)
+        return totals.project(today.day)
+
+    def _changed(self, chat_id):
+        '''Counts a write of a chat, returns its cached month if there is one'''
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        return self._months.get(chat_id)
+
+    def _add(self, chat_id, expenses):
+        totals = self._changed(chat_id)
+        if totals is None:
+            return
+        for category, day, amount in expenses:
+            if totals.holds(day):
+                totals.add(category, day, amount)
+
+    def on_write(self, name, args, result):
+        '''Listener for Async_Database_Manager.add_listener'''
+        if name == 'add_expense':
+            expense_date = args[4] if len(args) > 4 and args[4] else date.today()
+            self._add(args[0], [(args[3], expense_date.isoformat(), args[2])] if result else [])
+        elif name == 'add_expenses':
+            self._add(args[0], [(category, day, amount) for _, amount, category, day in args[1]] if result else [])
+        elif name == 'insert_expenses':
+            chats = {}
+            for chat_id, _, amount, category, day in args[0]:
+                chats.setdefault(chat_id, []).append((category, day, amount))
+            for chat_id, expenses in chats.items():
+                self._add(chat_id, expenses if result else [])
+        elif name == 'delete_last_expense':
+            self._add(args[0], [(result[3], result[4], -result[2])] if result else [])
+        elif name == 'set_budget':
+            totals = self._changed(args[0])
+            if totals is not None and result:
+                totals.set_budget(args[1], args[2])
+        elif name == 'clear_all_budgets':
+            totals = self._changed(args[0])
+            if totals is not None and result:
+                totals.budgets[:] = np.nan
+        elif name in RELOADING_WRITES:
+            self._changed(args[0])
+            self._months.pop(args[0], None)
+        else:
+            self._generation += 1
+            self._months.clear()
+
+
+def render_forecast(forecasts, today):
+    '''Text of /forecast from the tuples of Month_Totals.project'''
+    days = calendar.monthrange(today.year, today.month)[1]
+    text = f"🔮  Forecast for {today.strftime('%B %Y')}  🔮\nDay {today.day} of {days}"
+    if not forecasts:
+        return text + "\n\nNo expenses or budgets this month yet"
+
+    for category, spent, projected, budget, exhausted in forecasts:
+        text += f"\n\n 📝 {category.capitalize()}  ${spent:,.2f} so far, ${projected:,.2f} by the end of the month"
+        if budget is None:
+            continue
+        if exhausted is not None and exhausted <= today.day:
+            text += f"\n \t\t🚫 The ${budget:,.2f} budget ran out on {exhausted:02d}/{today.month:02d}"
+        elif exhausted is not None:
+            text += f"\n \t\t⚠️ The ${budget:,.2f} budget runs out around {exhausted:02d}/{today.month:02d}"
+        else:
+            text += f"\n \t\t✅ The ${budget:,.2f} budget lasts the month"
+
+    spent = sum(forecast[1] for forecast in forecasts)
+    projected = sum(forecast[2] for forecast in forecasts)
+    text += f"\n\n💰 Total ${spent:,.2f} so far, ${projected:,.2f} by the end of the month"
+    return text[:MESSAGE_LIMIT]
@@ -1,24 +1,30 @@
-import gspread
+import logging
+
+logger = logging.getLogger(__name__)
 
-from .expense import Expense
-from datetime import date
-from dataclasses import dataclass
 
-@dataclass
 class WorkSheet():
-    __gc = gspread.service_account("/home/franb/projects/moneyMate/.config/gspread/service_account.json")
-    __workSheet = __gc.open("All time spendings")
-    __size = 0
-    
-    def sheet_add(self, expense: Expense):
-        spent = [date.today().strftime("%d/%m/%Y %H:%M"), expense.item, expense.amount, expense.category]
-        
-        self.__workSheet.get_worksheet(0).append_row(spent)
-        self.__size =+ 1
-        
-        return
-    
-    def sheet_del(self):        
-        self.__workSheet.get_worksheet(0).delete_rows(self.__size)
-        
-        return
\ No newline at end of file
+    '''A worksheet of a google spreadsheet, opened on the first call instead of at import time.
+
+    append_rows makes a blocking network call, services.sheetsSync runs it off the
+    event loop. gspread is only imported when the sheet is opened.
+    '''
+
+    def __init__(self, credentials, spreadsheet, index=0):
+        self.credentials = credentials # path of the service account json
+        self.spreadsheet = spreadsheet
+        self.index = index
+        self._worksheet = None
+
+    def open(self):
+        if self._worksheet is None:
+            import gspread
+
+            client = gspread.service_account(self.credentials)
+            self._worksheet = client.open(self.spreadsheet).get_worksheet(self.index)
+            logger.info(f"Opened worksheet {self.index} of {self.spreadsheet}")
+        return self._worksheet
+
+    def append_rows(self, rows):
+        # USER_ENTERED so the dates and amounts are parsed by sheets like typed values
+        self.open().append_rows(rows, value_input_option="USER_ENTERED")
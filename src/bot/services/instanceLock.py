@@ -0,0 +1,54 @@
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError: # windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class Instance_Lock():
+    '''Lock file making sure a single bot process runs on a database.
+
+    The caches of Cached_Database_Manager and the order the updates of every chat
+    are handled in live in the memory of the process, a second bot on the same
+    database, like another worker behind the webhook's load balancer, would serve
+    stale budgets and totals and answer a chat's messages out of order. The
+    scripts writing to the database (importData, simulate, archiveData) take it
+    too, the bot's caches would never see their changes. The lock is held until
+    release or until the process ends, however it ends.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        '''Takes the lock, raises RuntimeError if another process holds it'''
+        file = open(self.path, "a")
+        try:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.close()
+            raise RuntimeError(f"The database locked by {self.path} is in use by another bot or script, "
+                               f"only one of them can run on it at a time")
+        self._file = file
+        logger.debug("Holding the lock %s", self.path)
+        return self
+
+    def release(self):
+        if self._file is not None:
+            # closing the file frees the lock
+            self._file.close()
+            self._file = None
+
+
+def database_lock(db_name):
+    '''The lock of a single file database, next to it'''
+    return Instance_Lock(os.path.splitext(os.path.abspath(db_name))[0] + ".lock")
@@ -0,0 +1,61 @@
+MESSAGE_LIMIT = 4096 # most characters telegram accepts in one message
+
+# longest item, category and title shown, so a page of 20 expenses always fits one message
+ITEM_LIMIT = 60
+CATEGORY_LIMIT = 30
+TITLE_LIMIT = 200
+
+
+def shorten(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class Expenses_Formatter():
+    '''Renders expense rows as readable lines with a running total.
+
+    Rows are fed in batches with add(), which returns the messages that are
+    already full, each one under the telegram limit. close() returns the rest
+    with the total at the end. Only the message being filled is kept in memory.
+    '''
+
+    def __init__(self, title, limit=MESSAGE_LIMIT):
+        self.limit = limit
+        self.total = 0
+        self.count = 0
+        self._message = f"💸  {shorten(title, TITLE_LIMIT)}  💸\n"
+
+    def add(self, rows):
+        messages = []
+        for row in rows:
+            _, item, amount, category, day = row[:5]
+            self.count += 1
+            self.total += amount
+            line = (f"\n📅 {day}  📦 {shorten(item, ITEM_LIMIT).capitalize()}  💰 ${amount:,.2f}  "
+                    f"📝 {shorten(category, CATEGORY_LIMIT).capitalize()}  (${self.total:,.2f})")
+            messages.extend(self._append(line))
+        return messages
+
+    def close(self, footer=None):
+        if footer is None:
+            footer = f"💰 Total ${self.total:,.2f} in {self.count} expenses" if self.count else "No expenses 🎉"
+        messages = self._append(f"\n\n{footer}")
+        messages.append(self._message)
+        self._message = ""
+        return messages
+
+    def _append(self, text):
+        text = text[:self.limit] # a single line never goes over a whole message
+        if len(self._message) + len(text) <= self.limit:
+            self._message += text
+            return []
+
+        full, self._message = self._message, text.lstrip("\n")
+        return [full]
+
+
+def format_expenses(batches, title, limit=MESSAGE_LIMIT):
+    '''Yields the messages for an iterable of row batches, like Database_Manager.iter_expenses_between'''
+    formatter = Expenses_Formatter(title, limit)
+    for rows in batches:
+        yield from formatter.add(rows)
+    yield from formatter.close()
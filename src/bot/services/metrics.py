@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the histogram buckets, from a cached sqlite lookup to a slow network call
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# longest statement kept as a label, the whitespace of the sql is collapsed first
+STATEMENT_LENGTH = 120
+
+
+class Histogram():
+    '''Counts of observations per bucket of BUCKETS, plus their sum and count'''
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1) # the last one is everything over BUCKETS[-1]
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        '''The upper bound of the bucket holding the q quantile, in seconds'''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics():
+    '''Latency histograms and error counts by kind ('handler' or 'sql') and name.
+
+    Observations come from the event loop and from the database threads, so every
+    change is made under a lock.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {} # (kind, name): Histogram
+
+    def _histogram(self, kind, name):
+        histogram = self._histograms.get((kind, name))
+        if histogram is None:
+            histogram = self._histograms[(kind, name)] = Histogram()
+        return histogram
+
+    def observe(self, kind, name, seconds):
+        with self._lock:
+            self._histogram(kind, name).observe(seconds)
+
+    def error(self, kind, name):
+        with self._lock:
+            self._histogram(kind, name).errors += 1
+
+    def get(self, kind, name):
+        return self._histograms.get((kind, name))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self, kind):
+        '''{name: (count, sum, p50, p99, errors)} of every histogram of a kind'''
+        with self._lock:
+            return {name: (histogram.count, histogram.sum, histogram.quantile(0.5), histogram.quantile(0.99),
+                           histogram.errors)
+                    for (histogram_kind, name), histogram in self._histograms.items() if histogram_kind == kind}
+
+    def prometheus(self):
+        '''Every histogram in the prometheus text exposition format'''
+        lines = []
+        with self._lock:
+            for kind, label, help_text in (("handler", "handler", "Time spent in each telegram handler"),
+                                           ("sql", "statement", "Time spent running each sql statement")):
+                histograms = sorted((name, histogram) for (histogram_kind, name), histogram
+                                    in self._histograms.items() if histogram_kind == kind)
+                metric = f"moneymate_{kind}_seconds"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for name, histogram in histograms:
+                    labels = f'{label}="{escape(name)}"'
+                    cumulative = 0
+                    for bound, count in zip((*BUCKETS, "+Inf"), histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+
+                errors = f"moneymate_{kind}_errors_total"
+                lines += [f"# HELP {errors} Failed calls of each {label}", f"# TYPE {errors} counter"]
+                for name, histogram in histograms:
+                    lines.append(f'{errors}{{{label}="{escape(name)}"}} {histogram.errors}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        '''Writes prometheus() to path, replacing the old file at once so a scraper never reads half of it'''
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.prometheus())
+        os.replace(temporary, path)
+
+
+# the registry shared by the handlers and every database connection
+METRICS = Metrics()
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def statement_name(sql):
+    return " ".join(sql.split())[:STATEMENT_LENGTH]
+
+
+def timed(name, callback, metrics=METRICS):
+    '''Wraps a telegram handler callback to record its latency and errors under name'''
+    @functools.wraps(callback)
+    async def handler(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            metrics.error("handler", name)
+            raise
+        finally:
+            metrics.observe("handler", name, time.perf_counter() - start)
+    return handler
+
+
+class Timed_Cursor(sqlite3.Cursor):
+    '''Cursor recording the latency and errors of every statement in METRICS.
+
+    A statement returning rows is timed until the rows are fetched, so the
+    figure includes reading them and not just preparing the query.
+    '''
+
+    _statement = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        self._flush()
+        return self._timed(sql, super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        self._flush()
+        return self._timed(sql, super().executemany, sql, parameters)
+
+    def executescript(self, script):
+        self._flush()
+        return self._timed(script, super().executescript, script)
+
+    def _timed(self, sql, run, *args):
+        self._statement = statement_name(sql)
+        start = time.perf_counter()
+        try:
+            run(*args)
+        except sqlite3.Error:
+            METRICS.error("sql", self._statement)
+            self._statement = None
+            raise
+        self._elapsed = time.perf_counter() - start
+        if self.description is None:
+            # nothing to fetch, the statement is done
+            self._flush()
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - start
+        self._flush()
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._flush()
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._elapsed += time.perf_counter() - start
+        if not rows:
+            self._flush()
+        return rows
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def _flush(self):
+        if self._statement is not None:
+            METRICS.observe("sql", self._statement, self._elapsed)
+            self._statement = None
+
+
+class Timed_Connection(sqlite3.Connection):
+    '''Connection handing out Timed_Cursor and timing commits, for sqlite3.connect(factory=...)'''
+
+    def cursor(self, factory=Timed_Cursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        except sqlite3.Error:
+            METRICS.error("sql", "COMMIT")
+            raise
+        METRICS.observe("sql", "COMMIT", time.perf_counter() - start)
+
+
+class Metrics_Exporter():
+    '''Background task writing the metrics to a prometheus text file every interval seconds'''
+
+    def __init__(self, path, interval=15, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.metrics.write_prometheus, self.path)
+            except OSError as e:
+                logger.warning(f"Couldn't write the metrics to {self.path}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # the last figures are kept on disk
+            await asyncio.to_thread(self.metrics.write_prometheus, self.path)
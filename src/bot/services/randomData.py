@@ -1,30 +1,73 @@
-import pandas as pd
+import logging
+from datetime import date, timedelta
+
 import numpy as np
 
-def random_spents():
-        # Parameters for generating random data
-        categories = ["groceries", "so", "essentials",
-                      "clothes", "entertainment", "transport", "going out"]
-        start_date = "2023-01-01"
-        end_date = "2025-12-31"
-        num_records = 1000
-
-        # Generate random data
-        np.random.seed(42)  # For reproducibility
-        random_dates = pd.to_datetime(np.random.choice(
-            pd.date_range(start_date, end_date), size=num_records))
-        random_categories = np.random.choice(categories, size=num_records)
-        random_amounts = np.random.randint(100, 80001, size=num_records)
-        ids = list(range(1000))
-
-        # Create DataFrame
-        df = pd.DataFrame({
-            "id": ids,
-            "item": "Product",
-            "amount": random_amounts,
-            "category": random_categories,
-            "date": random_dates,
-        })
-
-        # Sorting by date for better usability
-        df = df.sort_values(by="date").reset_index(drop=True)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100_000
+
+# category: (share of the expenses, median amount, spread of the log-normal amounts, items)
+CATEGORIES = {
+    "groceries": (0.30, 35, 0.6, ["Supermarket", "Vegetables", "Meat", "Bakery", "Milk"]),
+    "going out": (0.15, 40, 0.7, ["Dinner", "Bar", "Lunch", "Coffee", "Cinema"]),
+    "transport": (0.15, 8, 0.8, ["Bus", "Train", "Taxi", "Fuel", "Parking"]),
+    "essentials": (0.12, 20, 0.7, ["Pharmacy", "Cleaning", "Toiletries", "Haircut"]),
+    "entertainment": (0.10, 25, 0.9, ["Games", "Books", "Concert", "Streaming"]),
+    "clothes": (0.08, 60, 0.6, ["Shirt", "Shoes", "Jacket", "Jeans"]),
+    "so": (0.10, 30, 0.8, ["Flowers", "Gift", "Date night", "Trip"]),
+}
+
+# more spending on fridays and weekends, monday is 0
+WEEKDAY_WEIGHTS = np.array([0.9, 0.9, 0.95, 1.0, 1.2, 1.4, 1.2])
+
+
+def generate_expenses(rows, seed=42, start=date(2023, 1, 1), end=None, chunk_size=CHUNK_SIZE):
+    '''Yields chunks of random (item, amount, category, ISO date) rows in date order.
+
+    Every chunk is generated with vectorized numpy calls, only one chunk is in
+    memory at a time, and the same seed always gives the same rows.
+    '''
+    end = end or date.today()
+    rng = np.random.default_rng(seed)
+
+    names = np.array(list(CATEGORIES))
+    shares = np.array([category[0] for category in CATEGORIES.values()])
+    medians = np.log([category[1] for category in CATEGORIES.values()])
+    spreads = np.array([category[2] for category in CATEGORIES.values()])
+    # the items of every category flattened, a category's items start at its offset
+    items = np.array([item for category in CATEGORIES.values() for item in category[3]])
+    counts = np.array([len(category[3]) for category in CATEGORIES.values()])
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    days = (end - start).days + 1
+    day_names = np.array([(start + timedelta(days=day)).isoformat() for day in range(days)])
+    weights = WEEKDAY_WEIGHTS[(np.arange(days) + start.weekday()) % 7]
+    # how many expenses fall on each day, their running sum maps a row number to its day
+    per_day = np.cumsum(rng.multinomial(rows, weights / weights.sum()))
+
+    for first in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - first)
+        day = np.searchsorted(per_day, np.arange(first, first + size), side="right")
+        category = rng.choice(len(names), size=size, p=shares / shares.sum())
+        amount = np.round(rng.lognormal(medians[category], spreads[category]), 2)
+        item = offsets[category] + (rng.random(size) * counts[category]).astype(np.int64)
+
+        yield list(zip(items[item].tolist(), amount.tolist(), names[category].tolist(), day_names[day].tolist()))
+
+
+def random_spents(db_manager, chat_id, rows, seed=42, chunk_size=CHUNK_SIZE, progress=None):
+    '''Bulk loads rows random expenses of a chat through Database_Manager.bulk_load, returns how many were added'''
+    added = 0
+    # into a table smaller than the load it's faster to build the indexes once at the end
+    rebuild_indexes = db_manager.cursor.execute(
+        "SELECT COALESCE(MAX(id), 0) < ? FROM expenses", (rows,)).fetchone()[0]
+    # made up expenses have no place in the google sheet
+    with db_manager.bulk_load(chat_id, rebuild_indexes=bool(rebuild_indexes), outbox=False) as insert:
+        for chunk in generate_expenses(rows, seed=seed, chunk_size=chunk_size):
+            added += insert(chunk)
+            if progress:
+                progress(added)
+
+    logger.info(f"Simulated {added} expenses of chat {chat_id} with seed {seed}")
+    return added
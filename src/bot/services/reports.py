@@ -0,0 +1,144 @@
+import logging
+from collections import OrderedDict
+from datetime import date
+
+from .databaseManager import period_bounds
+from .messageFormatter import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class Report_Cache():
+    '''LRU of rendered reports keyed by (chat, period, data version of that period).
+
+    Every period of a chat has its own version, bumped when an expense of the chat
+    dated inside it is added or deleted, so a write only makes the reports of its
+    own day, month and year stale and an older report can never be served for a
+    newer version. Writes that can touch any period bump a generation of the chat
+    (or of every chat) instead, which is part of every version, so it covers the
+    periods not cached yet too.
+    '''
+
+    def __init__(self, size=128):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._reports = OrderedDict()
+        self._versions = {}
+        self._generations = {} # chat id -> generation of the chat
+        self._generation = 0 # generation of every chat
+
+    def version(self, chat_id, start, end):
+        return self._generation, self._generations.get(chat_id, 0), self._versions.get((chat_id, start, end), 0)
+
+    def get(self, chat_id, start, end, title):
+        key = (chat_id, start, end, title, self.version(chat_id, start, end))
+        report = self._reports.get(key)
+        if report is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._reports.move_to_end(key)
+        return report
+
+    def put(self, chat_id, start, end, title, version, report):
+        '''Stores a report computed when the period was at version, a report that raced a write is dropped'''
+        if version != self.version(chat_id, start, end):
+            return
+        key = (chat_id, start, end, title, version)
+        self._reports[key] = report
+        self._reports.move_to_end(key)
+        while len(self._reports) > self.size:
+            self._reports.popitem(last=False)
+
+    def invalidate(self, chat_id, day):
+        '''Drops the reports of a chat for the day, month and year an ISO date belongs to'''
+        day = date.fromisoformat(day)
+        periods = {(chat_id, *period_bounds(day.year)), (chat_id, *period_bounds(day.year, day.month)),
+                   (chat_id, *period_bounds(day.year, day.month, day.day))}
+        for period in periods:
+            self._versions[period] = self._versions.get(period, 0) + 1
+        for key in [key for key in self._reports if key[:3] in periods]:
+            del self._reports[key]
+
+    def clear(self, chat_id=None):
+        '''Drops every report of a chat, or of all chats, and the ones being computed'''
+        if chat_id is None:
+            self._generation += 1
+        else:
+            self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+        for key in [key for key in self._reports if chat_id is None or key[0] == chat_id]:
+            del self._reports[key]
+
+    def on_write(self, name, args, result):
+        '''Listener for Async_Database_Manager.add_listener'''
+        if name == 'add_expense':
+            expense_date = args[4] if len(args) > 4 and args[4] else date.today()
+            self.invalidate(args[0], expense_date.isoformat())
+        elif name == 'add_expenses':
+            for day in {row[3] for row in args[1]}:
+                self.invalidate(args[0], day)
+        elif name == 'insert_expenses':
+            for chat_id, day in {(row[0], row[4]) for row in args[0]}:
+                self.invalidate(chat_id, day)
+        elif name == 'delete_last_expense':
+            if result:
+                self.invalidate(args[0], result[4])
+        elif name in ('set_budget', 'clear_all_budgets'):
+            pass
+        elif name in ('clear_all_expenses', 'import_expenses', 'random_spents', 'undo', 'redo', 'restore_expenses'):
+            # clears, imports, simulations and the journal can touch any period of their chat
+            self.clear(args[0])
+        else:
+            self.clear()
+
+
+class Reports():
+    '''The /total report of a period, built from a single aggregated query and cached'''
+
+    def __init__(self, db_manager, cache_size=128):
+        self.model = db_manager
+        self.cache = Report_Cache(cache_size)
+        db_manager.add_listener(self.cache.on_write)
+
+    async def total(self, chat_id, start, end, title):
+        report = self.cache.get(chat_id, start, end, title)
+        if report is not None:
+            return report
+
+        version = self.cache.version(chat_id, start, end)
+        # a year has too many days to list, it's split by month instead
+        bucket = "month" if (date.fromisoformat(end) - date.fromisoformat(start)).days > 31 else "day"
+        rows = await self.model.get_period_totals(chat_id, start, end, bucket)
+        report = render_total(rows, title)
+        self.cache.put(chat_id, start, end, title, version, report)
+        return report
+
+
+def render_total(rows, title):
+    '''Text of a report from the rows of Database_Manager.get_period_totals'''
+    total, count = 0, 0
+    categories, buckets, bucket = [], [], "day"
+    for kind, key, amount, expenses in rows:
+        if kind == 'total':
+            total, count = amount, expenses
+        elif kind == 'category':
+            categories.append((key, amount))
+        else:
+            buckets.append((key, amount))
+            bucket = kind
+
+    text = f"📊  Total {title}  📊\n\n💰 ${total:,.2f} in {count} expenses"
+    if not count:
+        return text
+
+    text += "\n\nBy category:"
+    for category, amount in sorted(categories, key=lambda category: category[1], reverse=True):
+        share = amount / total if total else 0
+        text += f"\n 📝 {category.capitalize()}  ${amount:,.2f}  ({share:.0%})"
+
+    text += f"\n\nBy {bucket}:"
+    for key, amount in buckets:
+        text += f"\n 📅 {key}  ${amount:,.2f}"
+
+    return text[:MESSAGE_LIMIT]
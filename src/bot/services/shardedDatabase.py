@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import logging
+import os
+from collections import OrderedDict
+
+from .asyncDatabase import Async_Database_Manager, READ_METHODS, WRITE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# insert_expenses takes rows of any chats, and neither the sheet outbox nor the archival are kept
+# per chat, so they can't be routed to a single shard
+SHARDED_METHODS = (READ_METHODS | WRITE_METHODS) - {'insert_expenses', 'get_outbox', 'ack_outbox',
+                                                    'archive_closed_years'}
+
+
+class Sharded_Database_Manager:
+    '''Async_Database_Manager split over many sqlite files, one per chat or per bucket of chats.
+
+    Every shard has its own writer thread and write lock, so chats on different
+    shards never wait for each other. Shards are opened on their first use and at
+    most max_open are kept, the least recently used idle one is closed when a new
+    one is needed. Methods take the chat id first, like Database_Manager, and are
+    routed to the shard of that chat.
+
+    With shards=None every chat gets its own file, otherwise chats are spread
+    over that many files by chat_id % shards.
+    '''
+
+    def __init__(self, directory, shards=None, max_open=32, **options):
+        if max_open < 1:
+            raise ValueError("At least one shard has to be open")
+        if shards is not None and shards < 1:
+            raise ValueError("At least one shard is needed")
+
+        self.directory = directory
+        self.shards = shards
+        self.max_open = max_open
+        self.options = options # passed to every Async_Database_Manager
+        self.opened = 0
+        self.evicted = 0
+        self._open = OrderedDict() # shard name: Async_Database_Manager, least recently used first
+        self._busy = {} # shard name: calls running on it, busy shards are never closed
+        self._opening = {} # shard name: task opening it
+        self._closing = {} # shard name: task closing it
+        self._listeners = []
+        os.makedirs(directory, exist_ok=True)
+
+    def shard_name(self, chat_id):
+        if self.shards is None:
+            return f"chat_{chat_id}"
+        return f"shard_{chat_id % self.shards:04d}"
+
+    def shard_path(self, chat_id):
+        return os.path.join(self.directory, f"{self.shard_name(chat_id)}.db")
+
+    def __getattr__(self, name):
+        if name in SHARDED_METHODS:
+            return functools.partial(self._call, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    async def _call(self, name, chat_id, *args, **kwargs):
+        shard_name, shard = await self._acquire(chat_id)
+        try:
+            return await getattr(shard, name)(chat_id, *args, **kwargs)
+        finally:
+            self._release(shard_name)
+
+    async def stream(self, name, chat_id, *args, **kwargs):
+        '''Async_Database_Manager.stream on the shard of the chat'''
+        shard_name, shard = await self._acquire(chat_id)
+        try:
+            async for batch in shard.stream(name, chat_id, *args, **kwargs):
+                yield batch
+        finally:
+            self._release(shard_name)
+
+    async def run_in_writer(self, function, chat_id, *args):
+        '''Runs function(database_manager, chat_id, *args) on the writer thread of the chat's shard'''
+        shard_name, shard = await self._acquire(chat_id)
+        try:
+            return await shard.run_in_writer(function, chat_id, *args)
+        finally:
+            self._release(shard_name)
+
+    def add_listener(self, listener):
+        '''Like Async_Database_Manager.add_listener, for the writes of every shard'''
+        self._listeners.append(listener)
+        for shard in self._open.values():
+            shard.add_listener(listener)
+
+    async def _acquire(self, chat_id):
+        name = self.shard_name(chat_id)
+        # a shard can be closed again while its opener waits, if every other one is busy
+        while (shard := self._open.get(name)) is None:
+            if name not in self._opening:
+                self._opening[name] = asyncio.ensure_future(self._open_shard(name, self.shard_path(chat_id)))
+            await self._opening[name]
+
+        self._open.move_to_end(name)
+        self._busy[name] = self._busy.get(name, 0) + 1
+        self._evict()
+        return name, shard
+
+    def _release(self, name):
+        self._busy[name] -= 1
+        if not self._busy[name]:
+            del self._busy[name]
+        self._evict()
+
+    async def _open_shard(self, name, path):
+        try:
+            # a shard being closed is finished first, so its queued writes come before the new ones
+            if name in self._closing:
+                await self._closing[name]
+            loop = asyncio.get_running_loop()
+            # connecting and creating the tables blocks, so it's done off the event loop
+            shard = await loop.run_in_executor(None, functools.partial(Async_Database_Manager, path, **self.options))
+            for listener in self._listeners:
+                shard.add_listener(listener)
+            self._open[name] = shard
+            self.opened += 1
+            logger.debug(f"Opened shard {name}, {len(self._open)} open")
+        finally:
+            del self._opening[name]
+
+    def _evict(self):
+        '''Closes the least recently used idle shards while more than max_open are open'''
+        while len(self._open) > self.max_open:
+            name = next((name for name in self._open if name not in self._busy), None)
+            if name is None:
+                return # every shard is in use, they are closed once released
+            shard = self._open.pop(name)
+            self.evicted += 1
+            task = asyncio.ensure_future(shard.close())
+            self._closing[name] = task
+            task.add_done_callback(functools.partial(self._closed, name))
+            logger.debug(f"Closing shard {name}, {len(self._open)} open")
+
+    def _closed(self, name, task):
+        if self._closing.get(name) is task:
+            del self._closing[name]
+
+    async def close(self):
+        if self._opening:
+            await asyncio.gather(*self._opening.values(), return_exceptions=True)
+        shards, self._open = list(self._open.values()), OrderedDict()
+        await asyncio.gather(*(shard.close() for shard in shards), *self._closing.values())
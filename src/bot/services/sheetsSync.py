@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# writes that queue expenses in the outbox, the drainer is woken up after them
+QUEUEING_WRITES = {'add_expense', 'add_expenses', 'insert_expenses', 'import_expenses'}
+
+
+def sheet_row(expense):
+    '''The spreadsheet row of a (chat_id, item, amount, category, ISO date) outbox row'''
+    chat_id, item, amount, category, day = expense
+    return [date.fromisoformat(day).strftime("%d/%m/%Y"), item, amount, category, chat_id]
+
+
+class Sheets_Sync():
+    '''Background task sending the expenses of the sheet outbox to a google sheet.
+
+    Expenses are queued by the database in the transaction that saves them, the
+    task sends them in batches of batch_size with one append_rows call each and
+    only then removes them from the outbox, so they survive restarts and failed
+    calls. A batch can be sent twice if the bot stops between the two steps.
+    Failures are retried after interval seconds, doubled on every failure in a
+    row up to max_backoff. client is anything with a blocking append_rows(rows),
+    like services.googleSheets.WorkSheet.
+    '''
+
+    def __init__(self, db_manager, client, batch_size=100, interval=5, max_backoff=300):
+        self.model = db_manager
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failures = 0 # failed attempts in a row
+        self._wake = asyncio.Event()
+        self._task = None
+        db_manager.add_listener(self.on_write)
+
+    def on_write(self, name, args, result):
+        '''Listener for Async_Database_Manager.add_listener'''
+        if name in QUEUEING_WRITES and result:
+            self._wake.set()
+
+    async def drain(self):
+        '''Sends everything in the outbox, returns how many expenses were sent'''
+        sent = 0
+        while batch := await self.model.get_outbox(self.batch_size):
+            # expenses deleted before they were sent are only removed from the outbox
+            rows = [sheet_row(expense) for _, expense in batch if expense is not None]
+            if rows:
+                await asyncio.to_thread(self.client.append_rows, rows)
+            if not await self.model.ack_outbox([id for id, _ in batch]):
+                raise RuntimeError("The sent expenses couldn't be removed from the outbox")
+            sent += len(rows)
+            self.sent += len(rows)
+        return sent
+
+    def delay(self):
+        '''Seconds to wait before the next attempt'''
+        if not self.failures:
+            return self.interval
+        return min(self.max_backoff, self.interval * 2 ** self.failures)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            try:
+                sent = await self.drain()
+                self.failures = 0
+                if sent:
+                    logger.debug("Sent %s expenses to google sheets", sent)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Google sheets sync failed ({self.failures} in a row), retrying in {self.delay()}s: {e}")
+                await asyncio.sleep(self.delay())
+                continue
+
+            try:
+                # a new expense wakes the task up early, the interval is the fallback
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
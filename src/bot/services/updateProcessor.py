@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from collections import deque
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    '''The chat an update belongs to, None for the updates without one, like inline queries'''
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else None
+
+
+class Chat_Update_Processor(BaseUpdateProcessor):
+    '''Handles the updates of different chats at once and the updates of a chat one by one, in the order they came.
+
+    Every chat with pending updates has a lane, a queue of the turns of its
+    updates: an update waits until the ones before it in its chat are done, so
+    an /undo never overtakes the expense it undoes, while the other chats go on.
+    At most workers handlers run at once, an update only takes one when its
+    turn comes, so the updates waiting in a busy chat never hold up the others.
+
+    process_update returns as soon as the update is accepted, and the
+    application awaits it before taking the next update (max_concurrent_updates
+    is 1 for that), it never waits. An update of a chat that already has
+    chat_queue_size pending is dropped instead, and the chat is told once, so a
+    flooding chat only slows down itself. The webhook asks full() first and
+    answers 503, telegram sends the update again later. Updates without a chat
+    only wait for a worker. join waits for the accepted updates, it has to be
+    awaited before the bot shuts down.
+    '''
+
+    def __init__(self, workers=8, chat_queue_size=16):
+        # the application hands over its next update once the previous one is accepted
+        super().__init__(1)
+        self.workers = workers
+        self.chat_queue_size = chat_queue_size
+        self._running = asyncio.Semaphore(workers)
+        self._lanes = {} # chat id -> deque of the futures of its pending updates, the first one is running
+        self._told = set() # chats told their updates are dropped, until their lane empties
+        self._tasks = set() # the accepted updates and the replies to the flooding chats
+        self.dropped = 0
+
+    def pending(self, update):
+        '''Updates of the chat of update accepted and not done yet'''
+        lane = self._lanes.get(chat_key(update))
+        return len(lane) if lane else 0
+
+    def full(self, update):
+        return chat_key(update) is not None and self.pending(update) >= self.chat_queue_size
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        turn = None
+        if self.full(update):
+            coroutine.close()
+            self.dropped += 1
+            logger.warning(f"Dropped an update of chat {key}, {self.chat_queue_size} are already waiting")
+            if key not in self._told:
+                self._told.add(key)
+                self._start(self.refuse(update))
+            return
+        if key is not None:
+            lane = self._lanes.setdefault(key, deque())
+            turn = asyncio.get_running_loop().create_future()
+            if not lane:
+                turn.set_result(None)
+            lane.append(turn)
+        self._start(self.handle(key, turn, coroutine))
+
+    def _start(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def refuse(self, update):
+        '''Tells a flooding chat that its messages are being dropped'''
+        message = getattr(update, "effective_message", None)
+        if message is None:
+            return
+        try:
+            await message.reply_text("Too many messages at once, the latest ones were ignored. "
+                                     "Send them again once I've answered the others")
+        except Exception as e:
+            logger.warning(f"Couldn't tell chat {chat_key(update)} its messages were dropped: {e}")
+
+    async def handle(self, key, turn, coroutine):
+        '''Runs an accepted update when its turn comes and a worker is free'''
+        try:
+            if turn is not None:
+                await turn
+            async with self._running:
+                await coroutine
+        except Exception as e:
+            logger.error(f"Handling an update failed: {e}")
+        finally:
+            # never awaited if it was cancelled before running
+            coroutine.close()
+            if turn is not None:
+                lane = self._lanes[key]
+                first = lane[0] is turn
+                lane.remove(turn)
+                if not lane:
+                    del self._lanes[key]
+                    self._told.discard(key)
+                elif first and not lane[0].done():
+                    lane[0].set_result(None) # the next update of the chat
+
+    async def join(self):
+        '''Waits until every accepted update is handled'''
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        # main joins the updates before the application shuts down, nothing should be left by now
+        if self._tasks:
+            logger.warning(f"{len(self._tasks)} updates weren't processed before the shutdown")
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,191 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# biggest request body accepted, an update is a few kilobytes at most
+MAX_BODY = 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 503: "Service Unavailable"}
+
+
+class Webhook_Server():
+    '''HTTP endpoint telegram posts the updates to, handled by a bounded pool of workers.
+
+    An update is answered as soon as it's queued, so telegram sends the next one
+    without waiting for the handlers, and worker tasks take them from a queue
+    of queue_size updates. A full queue is answered with 503 and telegram sends
+    the update again later, that's the backpressure when the handlers fall
+    behind. full, like Chat_Update_Processor.full, can refuse an update the
+    same way when its chat is flooding the bot. Requests without the
+    secret_token header set with set_webhook are refused. process is awaited
+    with every Update, like Application.process_update, or
+    application.update_queue.put to handle them like polled updates. A worker
+    waits for process, so when the application's queue is bounded and full
+    this queue fills up too and telegram is asked to retry. Queued updates are
+    processed before stop returns, but they are lost if the process dies first.
+    '''
+
+    def __init__(self, bot, process, host="0.0.0.0", port=8443, path="/telegram", secret_token=None,
+                 workers=4, queue_size=256, idle_timeout=60, full=None):
+        self.bot = bot
+        self.process = process
+        self.full = full
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.received = 0
+        self.rejected = 0 # updates answered with 503
+        self.queue = asyncio.Queue(queue_size)
+        self._server = None
+        self._tasks = []
+        self._connections = set()
+
+    async def start(self):
+        if self._server is None:
+            self._tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+            self._server = await asyncio.start_server(self.serve, self.host, self.port)
+            # port 0 picks a free port, the tests use it
+            self.port = self._server.sockets[0].getsockname()[1]
+            logger.info(f"Serving the webhook on {self.host}:{self.port}{self.path}")
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would hold wait_closed for idle_timeout
+            for writer in self._connections:
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+            # what was already answered is processed before leaving
+            await self.queue.join()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+
+    async def work(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.process(update)
+            except Exception as e:
+                logger.error(f"Processing the update {update.update_id} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def serve(self, reader, writer):
+        '''Answers the requests of one connection, telegram keeps them open between updates'''
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    break
+                if request is None:
+                    break
+                status = self.handle(*request)
+                keep_alive = request[1].get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: 0\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode())
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def read_request(self, reader):
+        '''((method, path), headers, body) of the next request, None when the connection is closed'''
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                raise ValueError("Too many headers")
+
+        body = None
+        length = headers.get("content-length")
+        if length is not None:
+            length = int(length)
+            if length > MAX_BODY:
+                raise ValueError("Request too big") # the connection is dropped, its body isn't read
+            body = await reader.readexactly(length)
+        return (method, target.split("?", 1)[0]), headers, body
+
+    def handle(self, request, headers, body):
+        '''Queues the update of a request, returns the status code of the answer'''
+        method, path = request
+        if path != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if self.secret_token is not None and not hmac.compare_digest(
+                headers.get("x-telegram-bot-api-secret-token", "").encode(), self.secret_token.encode()):
+            return 403
+        if body is None:
+            return 411
+        try:
+            data = json.loads(body)
+            # de_json fails on anything but an object and makes nothing of an empty one
+            update = Update.de_json(data, self.bot) if isinstance(data, dict) else None
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Ignored a webhook request that isn't an update: {e}")
+            return 400
+        if update is None:
+            logger.warning("Ignored a webhook request that isn't an update")
+            return 400
+        try:
+            if self.full is not None and self.full(update):
+                raise asyncio.QueueFull
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return 503
+        self.received += 1
+        return 200
+
+
+async def run_webhook(application, server, url, secret_token=None):
+    '''Runs the application like run_polling does, with the updates telegram posts to url served by server'''
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass # windows, ctrl+c raises KeyboardInterrupt instead
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
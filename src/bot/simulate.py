@@ -0,0 +1,48 @@
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+from services.databaseManager import Database_Manager
+from services.instanceLock import database_lock
+import services.randomData as simulation
+
+load_dotenv()
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    handlers=[logging.StreamHandler()] # To console
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a database with random expenses, to profile it at scale")
+    parser.add_argument("rows", type=int, help="how many expenses to add")
+    parser.add_argument("--seed", type=int, default=42, help="the same seed always gives the same expenses")
+    parser.add_argument("--database", default=os.getenv("database_name"), help="defaults to database_name in .env")
+    parser.add_argument("--chat-id", type=int, default=int(os.getenv("legacy_chat_id", "0")),
+                        help="telegram chat the expenses belong to, defaults to legacy_chat_id in .env or 0")
+    parser.add_argument("--chunk-size", type=int, default=simulation.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if not args.database:
+        parser.error("no database, set database_name in .env or use --database")
+
+    # the bot caches what it read, it has to be stopped while the database is changed under it
+    try:
+        lock = database_lock(args.database).acquire()
+    except RuntimeError as e:
+        raise SystemExit(f"{e}, stop the bot first")
+    model = Database_Manager(db_name=args.database, legacy_chat_id=args.chat_id)
+    try:
+        added = simulation.random_spents(
+            model, args.chat_id, args.rows, args.seed, args.chunk_size,
+            progress=lambda added: logger.info(f"{added:,} expenses simulated so far"))
+    finally:
+        model.close()
+        lock.release()
+
+    logger.info(f"Done, {added:,} expenses simulated into {args.database}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestAsyncDatabaseManager(unittest.IsolatedAsyncioTestCase):
+    """Tests for the awaitable facade over Database_Manager."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_writes_are_visible_to_readers(self):
+        """Test that an expense added by the writer is read back by a reader connection."""
+        self.assertTrue(await self.db.add_expense(CHAT, "coffee", 3, "food"))
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 3)
+        self.assertEqual(await self.db.get_categories(CHAT), ["food"])
+
+    async def test_readers_see_the_archive(self):
+        """Test that the reader connections attach the archive once the writer creates it."""
+        from datetime import date
+        await self.db.add_expense(CHAT, "rent", 500, "home", date(2023, 5, 1))
+        await self.db.get_all_expenses(CHAT) # the readers are used before the archive exists
+
+        self.assertEqual(await self.db.archive_closed_years(), 1)
+        self.assertEqual([row[1] for row in await self.db.get_expenses_by_year(CHAT, 2023)], ["rent"])
+        batches = [batch async for batch in self.db.stream('iter_expenses_between', CHAT, "2023-01-01", "2024-01-01")]
+        self.assertEqual(len(batches), 1)
+
+    async def test_writes_run_on_a_single_thread(self):
+        """Test that every write goes through the same writer thread."""
+        threads = set()
+        writer = self.db._writer
+        original = writer.add_expense
+
+        def add_expense(*args):
+            threads.add(threading.current_thread().name)
+            return original(*args)
+
+        writer.add_expense = add_expense
+        await asyncio.gather(*(self.db.add_expense(CHAT, "item", i, "misc") for i in range(10)))
+
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads.pop().startswith("db-writer"))
+        self.assertEqual(await self.db.get_total_spents(CHAT, "misc"), sum(range(10)))
+
+    async def test_event_loop_keeps_running_during_slow_write(self):
+        """Test that a blocking write doesn't stall other coroutines."""
+        writer = self.db._writer
+        original = writer.set_budget
+
+        def slow_set_budget(*args):
+            time.sleep(0.3)
+            return original(*args)
+
+        writer.set_budget = slow_set_budget
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        await self.db.set_budget(CHAT, "food", 100)
+        task.cancel()
+
+        self.assertGreater(ticks, 10)
+        self.assertEqual(await self.db.get_budget(CHAT, "food"), 100)
+
+    async def test_stream_reads_in_batches(self):
+        """Test that a streamed query yields fetchmany batches and gives the reader back."""
+        await self.db.add_expenses(CHAT, [(f"item {i}", 1, "misc", "2024-05-01") for i in range(5)])
+        batches = [batch async for batch in self.db.stream('iter_expenses_between', CHAT, "2024-05-01",
+                                                           "2024-06-01", batch_size=2)]
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(await self.db.get_total_spents(CHAT, "misc"), 5) # both readers are free again
+        self.assertEqual(await self.db.get_budget(CHAT, "misc"), None)
+
+    async def test_stream_doesnt_block_the_writer(self):
+        """Test that other chats can write between the batches of a stream without WAL."""
+        await self.db.add_expenses(CHAT, [(f"item {i}", 1, "misc", "2024-05-01") for i in range(5)])
+        batches = self.db.stream('iter_expenses_between', CHAT, "2024-05-01", "2024-06-01", batch_size=2)
+        self.assertEqual(len(await anext(batches)), 2)
+
+        self.assertTrue(await self.db.add_expense(2, "coffee", 3, "food"))
+        self.assertEqual([len(batch) async for batch in batches], [2, 1])
+
+    async def test_unknown_method(self):
+        """Test that only Database_Manager methods are exposed."""
+        with self.assertRaises(AttributeError):
+            self.db.drop_everything
+
+
+class TestGroupCommit(unittest.IsolatedAsyncioTestCase):
+    """Tests for batching concurrent expense inserts into one transaction."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2,
+                                         group_commit=True, commit_interval=0.01, commit_batch=50)
+        self.batches = []
+        writer = self.db._writer
+        original = writer.insert_expenses
+
+        def insert_expenses(rows):
+            self.batches.append(len(rows))
+            return original(rows)
+
+        writer.insert_expenses = insert_expenses
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_uses_wal(self):
+        """Test that group commit switches the database to WAL journaling."""
+        reader = self.db._readers.get()
+        mode = reader.cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        self.db._readers.put(reader)
+        self.assertEqual(mode, "wal")
+
+    async def test_concurrent_inserts_share_transactions(self):
+        """Test that concurrent inserts are flushed by size and by time, and all are durable."""
+        results = await asyncio.gather(*(self.db.add_expense(CHAT, "item", 1, "misc") for i in range(120)))
+
+        self.assertTrue(all(results))
+        self.assertEqual(self.batches, [50, 50, 20])
+        self.assertEqual(await self.db.get_total_spents(CHAT, "misc"), 120)
+
+    async def test_other_writes_wait_for_queued_inserts(self):
+        """Test that a write made after queued inserts runs after they are committed."""
+        adds = [asyncio.ensure_future(self.db.add_expense(CHAT, f"item {i}", i, "misc")) for i in range(3)]
+        await asyncio.sleep(0) # let the inserts get queued
+        await self.db.delete_last_expense(CHAT)
+        await asyncio.gather(*adds)
+
+        items = [row[1] for row in await self.db.get_all_expenses(CHAT)]
+        self.assertEqual(sorted(items), ["item 0", "item 1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.auxFunctions import get_spent, get_spents, parse_search
+from services.expense import Expense
+
+
+class TestGetSpent(unittest.TestCase):
+    """Tests for parsing a single expense."""
+
+    def test_comma_separated(self):
+        """Test the 'item, amount, category' format with a multi word item."""
+        self.assertEqual(get_spent("Lunch with friends, 25, Social".split()),
+                         Expense(item="Lunch with friends", amount=25, category="Social"))
+
+    def test_space_separated_with_command(self):
+        """Test the 'item amount category' format sent through /add."""
+        self.assertEqual(get_spent("/add Coffee 3.50 Food".split()),
+                         Expense(item="Coffee", amount=3.5, category="Food"))
+
+    def test_errors(self):
+        """Test the error codes for a missing part and a non numeric amount."""
+        self.assertEqual(get_spent("Snacks, 5".split()), 0)
+        self.assertEqual(get_spent("Gift, abc, Other".split()), 1)
+
+
+class TestGetSpents(unittest.TestCase):
+    """Tests for parsing a message with one expense per line."""
+
+    def test_receipt(self):
+        """Test that every line becomes an expense and blank lines are ignored."""
+        expenses, errors = get_spents("Milk, 2, groceries\n\nBread 1.5 groceries\nSoap, 3, home\n")
+        self.assertEqual(errors, [])
+        self.assertEqual([expense.item for expense in expenses], ["Milk", "Bread", "Soap"])
+        self.assertEqual(sum(expense.amount for expense in expenses), 6.5)
+
+    def test_reports_every_invalid_line(self):
+        """Test that all the invalid lines are found in one pass."""
+        expenses, errors = get_spents("Milk, 2, groceries\nBread\nSoap, x, home")
+        self.assertEqual(len(expenses), 1)
+        self.assertEqual(errors, [(2, 0), (3, 1)])
+
+
+
+class TestParseSearch(unittest.TestCase):
+    """Tests for parsing the arguments of /search."""
+
+    def test_words_category_and_period(self):
+        """Test that a #category and trailing date numbers become filters."""
+        self.assertEqual(parse_search(["coffee", "bar", "#going_out", "5", "2024"]),
+                         (["coffee", "bar"], "going out", "2024-05-01", "2024-06-01", "“coffee bar” in Going out in May 2024"))
+        self.assertEqual(parse_search(["coffee"]), (["coffee"], None, None, None, "“coffee”"))
+
+    def test_numbers_that_arent_a_period(self):
+        """Test that trailing numbers are only taken as a period when they read as one."""
+        self.assertEqual(parse_search(["iphone", "15"]), (["iphone", "15"], None, None, None, "“iphone 15”"))
+        self.assertEqual(parse_search(["tea", "40", "2024"]),
+                         (["tea", "40"], None, "2024-01-01", "2025-01-01", "“tea 40” in 2024"))
+
+    def test_errors(self):
+        """Test that a search needs words and at most one category."""
+        for args in ([], ["#food"], ["tea", "#food", "#home"], ["5", "2024"]):
+            with self.assertRaises(ValueError):
+                parse_search(args)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import csv
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.bulkExport import Expenses_Writer, export_expenses
+from services.bulkImport import import_expenses
+from services.databaseManager import Database_Manager
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestExportExpenses(unittest.TestCase):
+    """Tests for streaming the expenses of a chat to a file."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database_Manager(os.path.join(self.tmp.name, "money.db"))
+        self.db.add_expenses(CHAT, [(f"item {i}", i, "home", f"2024-05-{i % 28 + 1:02d}") for i in range(25)])
+        self.db.add_expense(CHAT, "rent", 500, "home", expense_date=date(2024, 6, 1))
+        self.db.add_expense(2, "tea", 2, "food", expense_date=date(2024, 5, 1))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_csv_in_batches_imports_back(self):
+        """Test that a period is written batch by batch and the csv can be imported again."""
+        path = os.path.join(self.tmp.name, "may.csv")
+        progress = []
+
+        exported = export_expenses(self.db, CHAT, path, "csv", "2024-05-01", "2024-06-01", batch_size=10,
+                                   progress=progress.append)
+
+        self.assertEqual(exported, 25)
+        self.assertEqual(progress, [10, 20, 25])
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(list(rows[0]), ["id", "item", "amount", "category", "date"])
+        self.assertEqual(len(rows), 25)
+
+        self.assertEqual(import_expenses(self.db, 3, path, "csv"), 25)
+        self.assertEqual(self.db.get_month_total(3, "home", 2024, 5), sum(range(25)))
+
+    def test_jsonl_of_all_time(self):
+        """Test that every expense of the chat, and only of the chat, is exported by default."""
+        path = os.path.join(self.tmp.name, "all.jsonl")
+        self.assertEqual(export_expenses(self.db, CHAT, path, "jsonl"), 26)
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[-1], {"id": 26, "item": "rent", "amount": 500.0, "category": "home",
+                                       "date": "2024-06-01"})
+
+    def test_unknown_format(self):
+        """Test that a format without a writer is refused."""
+        with self.assertRaises(ValueError):
+            Expenses_Writer(os.path.join(self.tmp.name, "x.xlsx"), "xlsx")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow isn't installed")
+    def test_parquet_row_groups(self):
+        """Test that a parquet export gets a row group per batch."""
+        import pyarrow.parquet
+
+        path = os.path.join(self.tmp.name, "all.parquet")
+        self.assertEqual(export_expenses(self.db, CHAT, path, "parquet", batch_size=10), 26)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        self.assertEqual(parquet.read().column("amount").to_pylist()[-1], 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
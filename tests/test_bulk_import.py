@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.bulkImport import guess_format, import_expenses
+from services.databaseManager import Database_Manager
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestImportExpenses(unittest.TestCase):
+    """Tests for streaming csv and json lines files into the expenses table."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database_Manager(os.path.join(self.tmp.name, "money.db"))
+        self.db.add_expense(CHAT, "rent", 500, "home", expense_date=date(2024, 5, 1))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_guess_format(self):
+        """Test the formats recognized from the file name."""
+        self.assertEqual(guess_format("May.CSV"), "csv")
+        self.assertEqual(guess_format("export.jsonl"), "jsonl")
+        self.assertIsNone(guess_format("receipt.pdf"))
+
+    def test_csv_in_chunks(self):
+        """Test that a csv is loaded chunk by chunk and the rollups include the new rows."""
+        rows = "".join(f"item {i},{i % 10},home,2024-05-{i % 28 + 1:02d}\n" for i in range(25))
+        path = self.write("import.csv", "item,amount,category,date\n" + rows)
+        progress = []
+
+        added = import_expenses(self.db, CHAT, path, "csv", chunk_size=10, progress=progress.append)
+
+        self.assertEqual(added, 25)
+        self.assertEqual(progress, [10, 20, 25])
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 500 + sum(i % 10 for i in range(25)))
+
+    def test_jsonl_keeps_triggers_and_indexes(self):
+        """Test a json lines import rebuilding the indexes, and that rollups stay maintained after it."""
+        lines = [{"item": "bus", "amount": 2.5, "category": "transport", "date": "2024-06-03T08:00:00"},
+                 {"item": "taxi", "amount": "10", "category": "transport"}]
+        path = self.write("import.jsonl", "\n".join(json.dumps(line) for line in lines) + "\n\n")
+
+        self.assertEqual(import_expenses(self.db, CHAT, path, "jsonl", rebuild_indexes=True), 2)
+        self.assertEqual(self.db.get_month_total(CHAT, "transport", 2024, 6), 2.5)
+
+        indexes = [row[1] for row in self.db.cursor.execute("PRAGMA index_list(expenses)")]
+        self.assertIn("idx_expenses_chat_date", indexes)
+        self.db.add_expense(CHAT, "train", 4, "transport", expense_date=date(2024, 6, 4))
+        self.assertEqual(self.db.get_month_total(CHAT, "transport", 2024, 6), 6.5)
+
+    def test_invalid_line_rolls_back_everything(self):
+        """Test that an error in a later chunk leaves the database as it was."""
+        rows = "".join(f"item {i},1,home,2024-05-02\n" for i in range(15)) + "broken,abc,home,2024-05-02\n"
+        path = self.write("import.csv", "item,amount,category,date\n" + rows)
+
+        with self.assertRaisesRegex(ValueError, "Line 17: amount must be a number"):
+            import_expenses(self.db, CHAT, path, "csv", chunk_size=10)
+
+        self.assertEqual(len(self.db.get_all_expenses(CHAT)), 1)
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 500)
+        self.db.add_expense(CHAT, "lamp", 40, "home", expense_date=date(2024, 5, 20))
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 540)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+from services.cachedDatabase import Cached_Database_Manager
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestCachedDatabaseManager(unittest.IsolatedAsyncioTestCase):
+    """Tests for the read-through cache of budgets, categories and totals."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        self.db = Cached_Database_Manager(self.model, size=8)
+        await self.db.set_budget(CHAT, "food", 100)
+        await self.db.add_expense(CHAT, "coffee", 3, "food", date(2024, 5, 1))
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_reads_are_served_from_memory(self):
+        """Test that repeated reads only query the database once."""
+        for _ in range(3):
+            self.assertEqual(await self.db.get_budget(CHAT, "food"), 100)
+            self.assertEqual(await self.db.get_categories(CHAT), ["food"])
+        self.assertEqual(self.db.stats()["get_budget"], (2, 1))
+        self.assertEqual(self.db.stats()["get_categories"], (2, 1))
+
+    async def test_writes_invalidate_what_they_change(self):
+        """Test that expenses invalidate totals but keep the budgets, and budgets the other way around."""
+        await self.db.get_budget(CHAT, "food")
+        self.assertEqual(await self.db.get_month_total(CHAT, "food", 2024, 5), 3)
+
+        await self.db.add_expense(CHAT, "cake", 4, "food", date(2024, 5, 2))
+        self.assertEqual(await self.db.get_month_total(CHAT, "food", 2024, 5), 7)
+        self.assertEqual(await self.db.get_budget(CHAT, "food"), 100)
+        self.assertEqual(self.db.hits["get_budget"], 1)
+
+        await self.db.set_budget(CHAT, "food", 50)
+        self.assertEqual(await self.db.get_budget(CHAT, "food"), 50)
+        self.assertEqual(await self.db.get_month_total(CHAT, "food", 2024, 5), 7)
+        self.assertEqual(self.db.hits["get_month_total"], 1)
+
+        await self.db.delete_last_expense(CHAT)
+        self.assertEqual(await self.db.get_budgets_status(CHAT, ["food"], 2024, 5), {"food": (50, 3)})
+
+    async def test_chats_are_invalidated_separately(self):
+        """Test that one chat's writes keep the other chats cached."""
+        await self.db.get_categories(CHAT)
+        await self.db.add_expense(2, "rent", 500, "home")
+        self.assertEqual(await self.db.get_categories(CHAT), ["food"])
+        self.assertEqual(await self.db.get_categories(2), ["home"])
+        self.assertEqual(self.db.stats()["get_categories"], (1, 2))
+
+    async def test_read_racing_a_write_is_not_cached(self):
+        """Test that an answer read while a write lands isn't kept for the new version."""
+        read = asyncio.ensure_future(self.db.get_budget(CHAT, "food"))
+        await asyncio.sleep(0) # the read is running on a reader thread
+        self.db.on_write('set_budget', (CHAT, "food", 70), True)
+        await read
+
+        await self.db.get_budget(CHAT, "food")
+        self.assertEqual(self.db.stats()["get_budget"], (0, 2))
+
+    async def test_size_is_bounded(self):
+        """Test that the least recently used answers are dropped."""
+        for month in range(1, 13):
+            await self.db.get_month_total(CHAT, "food", 2024, month)
+        self.assertEqual(len(self.db._entries), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+from services.charts import Charts, render_chart
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+def fake_render(rows, start, end, path):
+    # what the chart shows doesn't matter here, only which rows it was drawn from
+    with open(path, "w") as f:
+        f.write(repr(rows))
+
+
+@patch("services.charts.render_chart", side_effect=fake_render)
+class TestCharts(unittest.IsolatedAsyncioTestCase):
+    """Tests for the disk cache of the /chart pictures."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        self.charts = Charts(self.db, os.path.join(self.tmp.name, "charts"), size=2)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_a_repeated_chart_is_not_rendered_again(self, render):
+        """Test that the same period without changes is served from disk."""
+        await self.db.add_expenses(CHAT, [("coffee", 3, "food", "2024-05-02")])
+        first = await self.charts.chart(CHAT, "2024-05-01", "2024-06-01")
+        second = await self.charts.chart(CHAT, "2024-05-01", "2024-06-01")
+
+        self.assertEqual(first, second)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual((self.charts.hits, self.charts.misses), (1, 1))
+
+    async def test_a_change_renders_a_new_version(self, render):
+        """Test that a new expense moves the data version and the old picture is deleted."""
+        await self.db.add_expenses(CHAT, [("coffee", 3, "food", "2024-05-02")])
+        old, _ = await self.charts.chart(CHAT, "2024-05-01", "2024-06-01")
+        await self.db.add_expenses(CHAT, [("bus", 2, "transport", "2024-05-03")])
+        new, _ = await self.charts.chart(CHAT, "2024-05-01", "2024-06-01")
+
+        self.assertNotEqual(old, new)
+        self.assertFalse(os.path.exists(old))
+        with open(new) as f:
+            self.assertIn("transport", f.read())
+
+    async def test_a_year_is_drawn_by_month(self, render):
+        """Test that a period longer than a month is bucketed by month."""
+        await self.db.add_expenses(CHAT, [("coffee", 3, "food", "2024-05-02"), ("tea", 2, "food", "2024-06-02")])
+        await self.charts.chart(CHAT, "2024-01-01", "2025-01-01")
+
+        rows = render.call_args.args[0]
+        self.assertIn(("month", "2024-06", 2, 1), rows)
+
+    async def test_nothing_to_chart(self, render):
+        """Test that a period without expenses has no chart."""
+        self.assertIsNone(await self.charts.chart(CHAT, "2024-05-01", "2024-06-01"))
+        render.assert_not_called()
+
+    async def test_the_file_id_is_kept_with_the_chart(self, render):
+        """Test that a sent chart is reused by its file_id, and forgotten on request."""
+        await self.db.add_expenses(CHAT, [("coffee", 3, "food", "2024-05-02")])
+        path, file_id = await self.charts.chart(CHAT, "2024-05-01", "2024-06-01")
+        self.assertIsNone(file_id)
+
+        self.charts.sent(path, "file-1")
+        self.assertEqual(await self.charts.chart(CHAT, "2024-05-01", "2024-06-01"), (path, "file-1"))
+        self.charts.sent(path, None)
+        self.assertEqual(await self.charts.chart(CHAT, "2024-05-01", "2024-06-01"), (path, None))
+
+    async def test_least_recently_used_charts_are_deleted(self, render):
+        """Test that no more than size charts are kept, the oldest going first."""
+        await self.db.add_expenses(CHAT, [("coffee", 3, "food", f"2024-0{month}-02") for month in (1, 2, 3)])
+        january, _ = await self.charts.chart(CHAT, "2024-01-01", "2024-02-01")
+        february, _ = await self.charts.chart(CHAT, "2024-02-01", "2024-03-01")
+        os.utime(january, (1, 1))
+        os.utime(february, (2, 2))
+        march, _ = await self.charts.chart(CHAT, "2024-03-01", "2024-04-01")
+
+        self.assertFalse(os.path.exists(january))
+        self.assertTrue(os.path.exists(february))
+        self.assertTrue(os.path.exists(march))
+
+
+@unittest.skipUnless(importlib.util.find_spec("matplotlib"), "matplotlib isn't installed")
+class TestRenderChart(unittest.TestCase):
+    """Tests for drawing a chart."""
+
+    def test_draws_a_png(self):
+        """Test that the totals of a period are drawn as a png."""
+        rows = [("category", "food", 5, 2), ("day", "2024-05-02", 3, 1), ("day", "2024-05-03", 2, 1), ("total", None, 5, 2)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "chart.png")
+            render_chart(rows, "2024-05-01", "2024-06-01", path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
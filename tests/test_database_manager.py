@@ -0,0 +1,543 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+from unittest.mock import patch
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.databaseManager import Database_Manager, SCHEMA_VERSION, period_bounds
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmp.name, "money.db")
+        self.db = Database_Manager(self.db_name)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def query_plan(self, call, match):
+        '''The EXPLAIN QUERY PLAN details of the statement containing match that call() runs'''
+        with patch.object(self.db.cursor, "execute", wraps=self.db.cursor.execute) as execute:
+            call()
+        sql, parameters = next((run.args[0], run.args[1] if len(run.args) > 1 else ())
+                               for run in execute.call_args_list if match in run.args[0])
+        plan = self.db.conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        return " ".join(row[-1] for row in plan)
+
+
+class TestPeriodQueries(DatabaseTestCase):
+    """Tests for the date range queries."""
+
+    def setUp(self):
+        super().setUp()
+        for day in (date(2023, 12, 31), date(2024, 1, 1), date(2024, 2, 29), date(2024, 3, 1)):
+            self.db.add_expense(CHAT, "item", 10, "misc", expense_date=day)
+
+    def test_period_bounds(self):
+        """Test the half-open ranges, including year and leap day boundaries."""
+        self.assertEqual(period_bounds(2024), ("2024-01-01", "2025-01-01"))
+        self.assertEqual(period_bounds(2024, 12), ("2024-12-01", "2025-01-01"))
+        self.assertEqual(period_bounds(2024, 2, 29), ("2024-02-29", "2024-03-01"))
+
+    def test_range_queries(self):
+        """Test that each period only returns the expenses dated inside it."""
+        self.assertEqual([row[4] for row in self.db.get_expenses_by_year(CHAT, 2024)],
+                         ["2024-01-01", "2024-02-29", "2024-03-01"])
+        self.assertEqual([row[4] for row in self.db.get_expenses_by_month_year(CHAT, 2024, 2)], ["2024-02-29"])
+        self.assertEqual(len(self.db.get_expenses_by_day_month_year(CHAT, 2023, 12, 31)), 1)
+        self.assertEqual(self.db.get_expenses_by_month_year(CHAT, 2024, 4), [])
+
+    def test_today(self):
+        """Test that expenses added without a date are stored for today."""
+        self.db.add_expense(CHAT, "coffee", 3, "food")
+        self.assertEqual([row[1] for row in self.db.get_expenses_today(CHAT)], ["coffee"])
+
+    def test_queries_use_the_chat_date_index(self):
+        """Test that period queries are index range lookups instead of table scans."""
+        details = self.query_plan(lambda: self.db.get_expenses_by_month_year(CHAT, 2024, 2), "FROM expenses")
+        self.assertIn("idx_expenses_chat_date (chat_id=? AND date>? AND date<?)", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+    def test_undo_finds_the_last_expense_with_the_index(self):
+        """Test that the last expense of a chat is found without reading all of its expenses."""
+        details = self.query_plan(lambda: self.db.delete_last_expense(CHAT), "ORDER BY id DESC LIMIT 1")
+        self.assertIn("idx_expenses_chat (chat_id=?)", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+    def test_clear_keeps_the_index(self):
+        """Test that clearing the expenses keeps the chat and date index."""
+        self.db.clear_all_expenses(CHAT)
+        indexes = [row[1] for row in self.db.cursor.execute("PRAGMA index_list(expenses)")]
+        self.assertIn("idx_expenses_chat_date", indexes)
+
+
+class TestPagination(DatabaseTestCase):
+    """Tests for the keyset paginated period queries."""
+
+    def setUp(self):
+        super().setUp()
+        # several expenses on the same day, so the id breaks the ties
+        self.db.add_expenses(CHAT, [(f"item {i}", i, "misc", f"2024-05-{i // 3 + 1:02d}") for i in range(10)])
+        self.start, self.end = period_bounds(2024, 5)
+
+    def test_walk_forward_and_back(self):
+        """Test that following the cursors visits every row once, in both directions."""
+        first, has_previous, has_next = self.db.get_expenses_page(CHAT, self.start, self.end, limit=4)
+        self.assertEqual(([row[0] for row in first], has_previous, has_next), ([1, 2, 3, 4], False, True))
+
+        second, has_previous, has_next = self.db.get_expenses_page(CHAT, 
+            self.start, self.end, after=(first[-1][4], first[-1][0]), limit=4)
+        self.assertEqual(([row[0] for row in second], has_previous, has_next), ([5, 6, 7, 8], True, True))
+
+        third, _, has_next = self.db.get_expenses_page(CHAT, self.start, self.end, after=(second[-1][4], second[-1][0]), limit=4)
+        self.assertEqual(([row[0] for row in third], has_next), ([9, 10], False))
+
+        back, has_previous, has_next = self.db.get_expenses_page(CHAT, 
+            self.start, self.end, before=(third[0][4], third[0][0]), limit=4)
+        self.assertEqual(([row[0] for row in back], has_previous, has_next), ([5, 6, 7, 8], True, True))
+
+    def test_pages_are_index_lookups(self):
+        """Test that a deep page is an index range without sorting or offsets."""
+        details = self.query_plan(
+            lambda: self.db.get_expenses_page(CHAT, self.start, self.end, after=("2024-05-02", 5)), "(date, id) >")
+        self.assertIn("idx_expenses_chat_date", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+
+class TestRollups(DatabaseTestCase):
+    """Tests for the per category and month spending totals."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.add_expense(CHAT, "rent", 500, "home", expense_date=date(2024, 5, 1))
+        self.db.add_expense(CHAT, "lamp", 40, "home", expense_date=date(2024, 5, 20))
+        self.db.add_expense(CHAT, "chair", 60, "home", expense_date=date(2024, 6, 2))
+
+    def test_inserts_update_the_rollups(self):
+        """Test that each month keeps its own total."""
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 540)
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 6), 60)
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 7), 0)
+        self.assertEqual(self.db.get_total_spents(CHAT, "home"), 600)
+
+    def test_delete_updates_the_rollups(self):
+        """Test that undoing the last expense removes its month when it was the only one."""
+        self.db.delete_last_expense(CHAT)
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 6), 0)
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM monthly_totals").fetchone()[0], 1)
+
+    def test_clear_empties_the_rollups(self):
+        """Test that clearing the expenses resets the totals and keeps them maintained."""
+        self.db.clear_all_expenses(CHAT)
+        self.assertEqual(self.db.get_total_spents(CHAT, "home"), 0)
+        self.db.add_expense(CHAT, "rug", 30, "home", expense_date=date(2024, 5, 3))
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 30)
+
+    def test_month_total_is_a_primary_key_lookup(self):
+        """Test that the budget check doesn't aggregate over the expenses."""
+        details = self.query_plan(lambda: self.db.get_month_total(CHAT, "home", 2024, 5), "FROM monthly_totals")
+        self.assertIn("PRIMARY KEY", details)
+
+
+class TestMigrations(unittest.TestCase):
+    """Tests for upgrading databases created by older versions."""
+
+    def test_migrates_timestamp_dates(self):
+        """Test that the old TIMESTAMP schema gets normalized dates and the index."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "old.db")
+            conn = sqlite3.connect(db_name)
+            conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY, item TEXT, amount REAL, "
+                         "category TEXT, date TIMESTAMP)")
+            conn.execute("INSERT INTO expenses (item, amount, category, date) "
+                         "VALUES ('old', 5, 'misc', '2024-05-26 10:30:00')")
+            conn.commit()
+            conn.close()
+
+            db = Database_Manager(db_name, legacy_chat_id=CHAT)
+            self.assertEqual(db.cursor.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+            self.assertEqual(len(db.get_expenses_by_day_month_year(CHAT, 2024, 5, 26)), 1)
+            self.assertEqual(db.get_month_total(CHAT, "misc", 2024, 5), 5)
+            db.close()
+
+    def test_migrates_single_chat_database(self):
+        """Test that a version 2 database is handed to the legacy chat with its budgets and rollups."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "old.db")
+            conn = sqlite3.connect(db_name)
+            conn.executescript(
+                """CREATE TABLE expenses (id INTEGER PRIMARY KEY, item TEXT, amount REAL, category TEXT, date TEXT);
+                   CREATE INDEX idx_expenses_date ON expenses (date);
+                   CREATE TABLE budgets (category TEXT PRIMARY KEY, amount REAL);
+                   CREATE TABLE monthly_totals (category TEXT, month TEXT, total REAL NOT NULL,
+                       count INTEGER NOT NULL, PRIMARY KEY (category, month)) WITHOUT ROWID;
+                   INSERT INTO expenses (item, amount, category, date) VALUES ('rent', 500, 'home', '2024-05-01');
+                   INSERT INTO budgets VALUES ('home', 800);
+                   INSERT INTO monthly_totals VALUES ('home', '2024-05', 500, 1);
+                   PRAGMA user_version = 2;""")
+            conn.close()
+
+            db = Database_Manager(db_name, legacy_chat_id=CHAT)
+            self.assertEqual(db.get_month_total(CHAT, "home", 2024, 5), 500)
+            self.assertEqual(db.get_budget(CHAT, "home"), 800)
+            self.assertEqual(db.get_month_total(2, "home", 2024, 5), 0)
+            indexes = [row[1] for row in db.cursor.execute("PRAGMA index_list(expenses)")]
+            self.assertEqual(sorted(indexes), ["idx_expenses_chat", "idx_expenses_chat_date"])
+
+            db.add_expense(2, "rug", 30, "home", expense_date=date(2024, 5, 3))
+            self.assertEqual(db.get_month_total(2, "home", 2024, 5), 30)
+            db.close()
+
+    def test_migration_starts_the_journal(self):
+        """Test that a version 3 database gets never reused ids and a snapshot to replay from."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "old.db")
+            conn = sqlite3.connect(db_name)
+            conn.executescript(
+                """CREATE TABLE expenses (id INTEGER PRIMARY KEY, item TEXT, amount REAL, category TEXT, date TEXT,
+                       chat_id INTEGER NOT NULL);
+                   CREATE TABLE budgets (chat_id INTEGER NOT NULL, category TEXT, amount REAL,
+                       PRIMARY KEY (chat_id, category));
+                   INSERT INTO expenses VALUES (7, 'rent', 500, 'home', '2024-05-01', 1);
+                   INSERT INTO budgets VALUES (1, 'home', 800);
+                   PRAGMA user_version = 3;""")
+            conn.close()
+
+            db = Database_Manager(db_name)
+            sql = db.cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'expenses'").fetchone()[0]
+            self.assertIn("AUTOINCREMENT", sql)
+            self.assertEqual(db.state_at(CHAT, 0), ({7: ("rent", 500, "home", "2024-05-01")}, {"home": 800}))
+            self.assertEqual(db.search_expenses(CHAT, ["ren"]), ([(7, "rent", 500, "home", "2024-05-01")], False))
+
+            db.delete_last_expense(CHAT)
+            db.add_expense(CHAT, "rug", 30, "home", expense_date=date(2024, 5, 3))
+            self.assertEqual(db.get_all_expenses(CHAT)[0][0], 8)
+            db.close()
+
+
+class TestChatIsolation(DatabaseTestCase):
+    """Tests for keeping the expenses and budgets of every chat apart."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.add_expense(CHAT, "rent", 500, "home", expense_date=date(2024, 5, 1))
+        self.db.add_expense(2, "coffee", 3, "food", expense_date=date(2024, 5, 1))
+        self.db.set_budget(CHAT, "home", 800)
+        self.db.set_budget(2, "home", 50)
+
+    def test_reads_only_see_their_chat(self):
+        """Test that every query is scoped to the chat asked for."""
+        self.assertEqual([row[1] for row in self.db.get_expenses_by_month_year(CHAT, 2024, 5)], ["rent"])
+        self.assertEqual(self.db.get_categories(2), ["food"])
+        self.assertEqual(self.db.get_budgets(CHAT), [("home", 800)])
+        self.assertEqual(self.db.get_budgets_status(2, ["home", "food"], 2024, 5), {"home": (50, 0), "food": (None, 3)})
+        self.assertEqual(self.db.get_period_totals(2, *period_bounds(2024, 5))[-1], ("total", None, 3, 1))
+
+    def test_writes_only_touch_their_chat(self):
+        """Test that undo and clears leave the other chats alone."""
+        self.assertEqual(self.db.delete_last_expense(CHAT)[1], "rent")
+        self.db.clear_all_budgets(2)
+        self.assertEqual(self.db.get_all_expenses(CHAT), [])
+        self.assertEqual(self.db.get_total_spents(2, "food"), 3)
+        self.assertEqual(self.db.get_budget(CHAT, "home"), 800)
+
+        self.db.clear_all_expenses(2)
+        self.assertEqual(self.db.get_all_expenses(2), [])
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM monthly_totals").fetchone()[0], 0)
+
+
+class TestJournal(DatabaseTestCase):
+    """Tests for undo, redo and point in time restores."""
+
+    def add(self, item, amount=10, chat_id=CHAT):
+        self.db.add_expense(chat_id, item, amount, "misc", expense_date=date(2024, 5, 1))
+
+    def items(self, chat_id=CHAT):
+        return sorted(row[1] for row in self.db.get_all_expenses(chat_id))
+
+    def test_undo_and_redo_several_steps(self):
+        """Test that undo walks back through expenses and budgets and redo brings them back."""
+        self.add("rent")
+        self.add("coffee")
+        self.db.set_budget(CHAT, "misc", 100)
+        self.db.set_budget(CHAT, "misc", 200)
+
+        self.assertEqual(self.db.undo(CHAT, 3), ["budget", "budget", "add"])
+        self.assertEqual(self.items(), ["rent"])
+        self.assertIsNone(self.db.get_budget(CHAT, "misc"))
+        self.assertEqual(self.db.get_month_total(CHAT, "misc", 2024, 5), 10)
+
+        coffee = self.db.cursor.execute("SELECT id FROM journal_rows WHERE item = 'coffee'").fetchone()[0]
+        self.assertEqual(self.db.redo(CHAT, 2), ["add", "budget"])
+        self.assertIn((coffee, "coffee"), [row[:2] for row in self.db.get_all_expenses(CHAT)])
+        self.assertEqual(self.db.get_budget(CHAT, "misc"), 100)
+        self.assertEqual(self.db.get_month_total(CHAT, "misc", 2024, 5), 20)
+
+        self.assertEqual(self.db.undo(CHAT, 10), ["budget", "add", "add"])
+        self.assertEqual(self.db.undo(CHAT), [])
+        self.assertEqual(self.db.redo(CHAT, 10), ["add", "add", "budget", "budget"])
+        self.assertEqual(self.db.get_budget(CHAT, "misc"), 200)
+
+    def test_a_new_change_drops_the_redo_stack(self):
+        """Test that nothing undone can be redone after the chat changes something else."""
+        self.add("rent")
+        self.add("coffee")
+        self.db.undo(CHAT)
+        self.add("tea")
+        self.assertEqual(self.db.redo(CHAT), [])
+        self.assertEqual(self.db.undo(CHAT, 2), ["add", "add"])
+        self.assertEqual(self.items(), [])
+
+    def test_clears_can_be_undone(self):
+        """Test that a clear keeps the rows and budgets it removes."""
+        self.add("rent")
+        self.add("coffee")
+        self.db.set_budget(CHAT, "misc", 100)
+        before = self.db.get_all_expenses(CHAT)
+        self.db.clear_all_expenses(CHAT)
+        self.db.clear_all_budgets(CHAT)
+
+        self.assertEqual(self.db.undo(CHAT, 2), ["clear budgets", "clear"])
+        self.assertEqual(self.db.get_all_expenses(CHAT), before)
+        self.assertEqual(self.db.get_budget(CHAT, "misc"), 100)
+        self.assertEqual(self.db.get_month_total(CHAT, "misc", 2024, 5), 20)
+
+    def test_undo_is_per_chat(self):
+        """Test that every chat undoes only its own changes."""
+        self.add("rent")
+        self.add("coffee", chat_id=2)
+        self.db.insert_expenses([(CHAT, "tea", 2, "misc", "2024-05-02"), (2, "cake", 4, "misc", "2024-05-02")])
+
+        self.assertEqual(self.db.undo(CHAT), ["add"])
+        self.assertEqual(self.items(), ["rent"])
+        self.assertEqual(self.items(2), ["cake", "coffee"])
+
+    def test_restore_to_a_point_in_time(self):
+        """Test that a restore replays the journal up to a moment and can be undone."""
+        self.add("rent")
+        self.db.set_budget(CHAT, "misc", 100)
+        self.db.cursor.execute("UPDATE journal SET created = '2024-05-01 10:00:00'")
+        self.db.conn.commit()
+        self.add("coffee")
+        self.db.delete_last_expense(CHAT)
+        self.add("tea")
+        self.db.set_budget(CHAT, "misc", 300)
+        self.db.clear_all_expenses(CHAT)
+
+        self.assertEqual(self.db.restore_expenses(CHAT, datetime(2024, 5, 1, 12)), (0, 1))
+        self.assertEqual(self.items(), ["rent"])
+        self.assertEqual(self.db.get_budget(CHAT, "misc"), 100)
+
+        self.assertEqual(self.db.undo(CHAT), ["restore"])
+        self.assertEqual(self.items(), [])
+        self.assertEqual(self.db.get_budget(CHAT, "misc"), 300)
+
+        self.db.restore_expenses(CHAT, datetime(2020, 1, 1))
+        self.assertIsNone(self.db.get_budget(CHAT, "misc"))
+
+    def test_replays_start_from_the_latest_snapshot(self):
+        """Test that snapshots are taken as the journal grows and give the same state as a full replay."""
+        with patch("services.databaseManager.SNAPSHOT_INTERVAL", 3):
+            for i in range(10):
+                self.add(f"item {i}")
+            self.db.undo(CHAT, 4)
+            self.db.set_budget(CHAT, "misc", 50)
+
+        snapshots = self.db.cursor.execute("SELECT seq FROM journal_snapshots WHERE chat_id = ?", (CHAT,)).fetchall()
+        self.assertGreater(len(snapshots), 1)
+
+        last = self.db.cursor.execute("SELECT MAX(seq) FROM journal").fetchone()[0]
+        expenses, budgets = self.db.state_at(CHAT, last)
+        self.assertEqual(sorted(expense[0] for expense in expenses.values()), self.items())
+        self.assertEqual(budgets, {"misc": 50})
+
+        # the same state rebuilt without the snapshots
+        self.db.cursor.execute("DELETE FROM journal_snapshots")
+        self.assertEqual(self.db.state_at(CHAT, last), (expenses, budgets))
+
+    def test_bulk_loads_keep_an_id_range(self):
+        """Test that a bulk load isn't copied to the journal and can still be replayed, undone and redone."""
+        self.add("rent")
+        with self.db.bulk_load(CHAT) as insert:
+            insert([("tea", 2, "misc", "2024-05-02"), ("cake", 4, "misc", "2024-05-03")])
+        load = self.db.journal_state(CHAT)[0]
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM journal_rows WHERE seq = ?", (load,)).fetchone()[0], 0)
+
+        self.db.delete_last_expense(CHAT)
+        self.assertEqual(sorted(expense[0] for expense in self.db.state_at(CHAT, load)[0].values()),
+                         ["cake", "rent", "tea"])
+        self.assertEqual(self.db.undo(CHAT, 2), ["delete", "import"])
+        self.assertEqual(self.items(), ["rent"])
+        self.assertEqual(self.db.redo(CHAT, 2), ["import", "delete"])
+        self.assertEqual(self.items(), ["rent", "tea"])
+
+    def test_undo_reaches_expenses_saved_before_the_journal(self):
+        """Test that undo takes back the newest expense of a chat that has no journal yet."""
+        self.db.cursor.execute("INSERT INTO expenses (chat_id, item, amount, category, date) "
+                               "VALUES (1, 'rent', 500, 'home', '2024-05-01'), (1, 'rug', 30, 'home', '2024-05-02')")
+        self.db.conn.commit()
+
+        self.assertEqual(self.db.undo(CHAT), ["add"])
+        self.assertEqual(self.items(), ["rent"])
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2024, 5), 500)
+        self.assertEqual(self.db.redo(CHAT), ["add"])
+        self.assertEqual(self.items(), ["rent", "rug"])
+        self.assertEqual(self.db.undo(CHAT, 5), ["add", "add"])
+        self.assertEqual(self.items(), [])
+
+    def test_old_entries_are_dropped(self):
+        """Test that the journal older than JOURNAL_DAYS goes when a snapshot is taken, up to that snapshot."""
+        with patch("services.databaseManager.SNAPSHOT_INTERVAL", 3):
+            for i in range(4):
+                self.add(f"item {i}")
+            self.db.cursor.execute("UPDATE journal SET created = '2024-05-01 10:00:00'")
+            for amount in range(4):
+                self.db.set_budget(CHAT, "misc", amount)
+
+        self.assertIsNotNone(self.db.journal_floor(CHAT))
+        last = self.db.cursor.execute("SELECT MAX(seq) FROM journal").fetchone()[0]
+        self.assertEqual(sorted(expense[0] for expense in self.db.state_at(CHAT, last)[0].values()), self.items())
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM journal_snapshots").fetchone()[0], 2)
+
+        # the entry of the oldest snapshot left is the last one that can be undone
+        self.assertEqual(self.db.undo(CHAT, 10), ["budget"] * 4 + ["add"] * 2)
+        self.assertEqual(self.items(), ["item 0", "item 1"])
+        self.assertIsNone(self.db.restore_expenses(CHAT, datetime(2024, 5, 1, 9)))
+        self.assertEqual(self.db.restore_expenses(CHAT, datetime.now()), (0, 0))
+
+
+class TestArchive(DatabaseTestCase):
+    """Tests for moving closed years to the archive database."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.add_expense(CHAT, "rent", 500, "home", expense_date=date(2023, 5, 1))
+        self.db.add_expense(CHAT, "coffee", 3, "food", expense_date=date(2023, 5, 2))
+        self.db.add_expense(2, "tea", 2, "food", expense_date=date(2023, 7, 1))
+        self.db.add_expense(CHAT, "rug", 30, "home", expense_date=date(2024, 1, 10))
+        self.assertEqual(self.db.archive_closed_years("2024-01-01"), 3)
+
+    def live(self):
+        return self.db.cursor.execute("SELECT COUNT(*) FROM main.expenses").fetchone()[0]
+
+    def test_queries_read_both_tables(self):
+        """Test that the period queries and rollups see the archived years."""
+        self.assertEqual(self.live(), 1)
+        self.assertEqual([row[1] for row in self.db.get_expenses_by_year(CHAT, 2023)], ["rent", "coffee"])
+        self.assertEqual(len(self.db.get_all_expenses(CHAT)), 3)
+        self.assertEqual(self.db.get_expenses_page(CHAT, "2023-01-01", "2025-01-01", limit=2)[0][1][1], "coffee")
+        self.assertEqual(self.db.get_period_totals(CHAT, *period_bounds(2023))[-1], ("total", None, 503, 2))
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2023, 5), 500)
+        self.assertEqual(self.db.archive_closed_years("2024-01-01"), 0)
+
+        reader = Database_Manager(self.db_name, read_only=True)
+        self.assertEqual(len(reader.get_expenses_by_year(2, 2023)), 1)
+        reader.close()
+
+    def test_journal_reaches_the_archive(self):
+        """Test that clears, undo and restores move archived expenses like live ones."""
+        self.db.clear_all_expenses(CHAT)
+        self.assertEqual(self.db.get_all_expenses(CHAT), [])
+        self.assertEqual(self.db.get_total_spents(CHAT, "home"), 0)
+
+        self.db.undo(CHAT)
+        self.assertEqual(len(self.db.get_all_expenses(CHAT)), 3)
+        self.assertEqual(self.db.get_month_total(CHAT, "home", 2023, 5), 500)
+
+        self.db.archive_closed_years("2024-01-01")
+        self.db.restore_expenses(CHAT, datetime(2020, 1, 1))
+        self.assertEqual(self.db.get_all_expenses(CHAT), [])
+        self.assertEqual(self.db.cursor.execute(
+            "SELECT COUNT(*) FROM monthly_totals WHERE chat_id = ?", (CHAT,)).fetchone()[0], 0)
+        self.assertEqual(self.db.get_total_spents(2, "food"), 2)
+
+    def test_undoing_an_import_leaves_the_archive_alone(self):
+        """Test that an import after an archival only undoes its own rows, even below archived ids."""
+        with self.db.bulk_load(CHAT) as insert:
+            insert([("lamp", 40, "home", "2023-08-01"), ("chair", 60, "home", "2023-08-02")])
+        self.assertEqual(self.db.archive_closed_years("2024-01-01"), 2)
+        with self.db.bulk_load(CHAT) as insert:
+            insert([("desk", 90, "home", "2024-02-01")])
+
+        self.assertEqual(self.db.undo(CHAT), ["import"])
+        self.assertEqual(sorted(row[1] for row in self.db.get_all_expenses(CHAT)),
+                         ["chair", "coffee", "lamp", "rent", "rug"])
+        self.assertEqual(self.db.redo(CHAT), ["import"])
+        self.assertEqual(len(self.db.get_all_expenses(CHAT)), 6)
+
+
+class TestSearch(DatabaseTestCase):
+    """Tests for the full-text search of the items."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.add_expenses(CHAT, [("Coffee beans", 9, "Food", "2023-05-01"), ("coffee", 3, "food", "2024-05-02"),
+                                    ("Café latte", 4, "going out", "2024-05-03"), ("bus", 2, "transport", "2024-05-03")])
+        self.db.add_expense(-100, "coffee", 3, "food", expense_date=date(2024, 5, 1))
+
+    def items(self, *args, **kwargs):
+        return [row[1] for row in self.db.search_expenses(CHAT, *args, **kwargs)[0]]
+
+    def test_prefix_and_ranking(self):
+        """Test that words match as prefixes, without accents, best match first."""
+        self.assertEqual(self.items(["cof"]), ["coffee", "Coffee beans"])
+        self.assertEqual(self.items(["cafe"]), ["Café latte"])
+        self.assertEqual(self.items(["coffee", "bea"]), ["Coffee beans"])
+        self.assertEqual(self.items(["tea"]), [])
+        # what is typed is never read as fts5 syntax
+        self.assertEqual(self.items(['"cof', "OR", "bus"]), [])
+        self.assertEqual(self.items(["*"]), [])
+
+    def test_chats_and_filters(self):
+        """Test that a search only sees its chat, category and period."""
+        self.assertEqual([row[0] for row in self.db.search_expenses(-100, ["coffee"])[0]], [5])
+        self.assertEqual(self.items(["cof"], category="FOOD"), ["coffee", "Coffee beans"])
+        self.assertEqual(self.items(["c"], category="going out"), ["Café latte"])
+        self.assertEqual(self.items(["cof"], start="2024-01-01", end="2025-01-01"), ["coffee"])
+
+    def test_pages(self):
+        """Test the pagination of the matches."""
+        self.db.add_expenses(CHAT, [(f"coffee {i}", 1, "food", "2024-06-01") for i in range(5)])
+        first, has_next = self.db.search_expenses(CHAT, ["coffee"], limit=4)
+        self.assertTrue(has_next)
+        rest, has_next = self.db.search_expenses(CHAT, ["coffee"], offset=4, limit=4)
+        self.assertFalse(has_next)
+        self.assertEqual(len({row[0] for row in first + rest}), 7)
+
+    def test_index_follows_the_writes(self):
+        """Test that deletes, clears, the journal, bulk loads and the archive keep the index in sync."""
+        self.db.delete_last_expense(CHAT)
+        self.assertEqual(self.items(["bus"]), [])
+        self.db.undo(CHAT)
+        self.assertEqual(self.items(["bus"]), ["bus"])
+
+        with self.db.bulk_load(CHAT) as insert:
+            insert([("tea", 2, "food", "2024-06-01")])
+        self.assertEqual(self.items(["tea"]), ["tea"])
+
+        self.assertEqual(self.db.archive_closed_years("2024-01-01"), 1)
+        self.assertEqual(self.items(["beans"]), ["Coffee beans"])
+        self.db.clear_all_expenses(CHAT)
+        self.assertEqual(self.items(["c"]), [])
+        self.db.undo(CHAT)
+        self.assertEqual(self.items(["beans"]), ["Coffee beans"])
+        self.db.restore_expenses(CHAT, datetime(2020, 1, 1))
+        self.assertEqual(self.items(["c"]), [])
+        # only chat -100's coffee is left
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM expenses_search").fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
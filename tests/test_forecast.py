@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+from services.databaseManager import period_bounds
+from services.forecast import Forecaster, Month_Totals, render_forecast
+
+CHAT = 1 # chat the tests' expenses belong to
+TODAY = date(2024, 4, 10) # a 30 day month
+
+
+class TestMonthTotals(unittest.TestCase):
+    """Tests for the projection of a month's spending."""
+
+    def setUp(self):
+        rows = [("2024-04-01", "groceries", 40), ("2024-04-05", "groceries", 60),
+                ("2024-04-02", "transport", 10), ("2024-04-03", "home", 500)]
+        self.totals = Month_Totals(2024, 4, rows, [("groceries", 250), ("home", 400), ("clothes", 100)])
+
+    def test_projects_the_month_end(self):
+        """Test that every category is projected at its average daily spend so far."""
+        forecasts = {forecast[0]: forecast for forecast in self.totals.project(10)}
+        self.assertEqual(forecasts["groceries"][1:3], (100, 300))
+        self.assertEqual(forecasts["transport"][1:3], (10, 30))
+        self.assertEqual([forecast[0] for forecast in self.totals.project(10)],
+                         ["home", "groceries", "transport", "clothes"])
+
+    def test_budget_exhaustion(self):
+        """Test the day each budget ran out or will, and the budgets that last."""
+        forecasts = {forecast[0]: forecast[3:] for forecast in self.totals.project(10)}
+        self.assertEqual(forecasts["home"], (400, 3)) # ran out on the 3rd
+        self.assertEqual(forecasts["groceries"], (250, 25)) # 10 a day, 150 left
+        self.assertEqual(forecasts["clothes"], (100, None)) # nothing spent
+        self.assertEqual(forecasts["transport"], (None, None))
+
+    def test_only_days_so_far_count(self):
+        """Test that expenses dated later in the month aren't spent yet."""
+        self.assertEqual({forecast[0]: forecast[1] for forecast in self.totals.project(2)}["groceries"], 40)
+
+    def test_add_and_budgets(self):
+        """Test adding to a new category and changing budgets in place."""
+        self.totals.add("gifts", "2024-04-04", 20)
+        self.totals.add("groceries", "2024-04-05", -60)
+        self.totals.set_budget("gifts", 30)
+        self.totals.set_budget("home", None)
+        forecasts = {forecast[0]: forecast for forecast in self.totals.project(10)}
+        self.assertEqual(forecasts["gifts"], ("gifts", 20, 60, 30, 15))
+        self.assertEqual(forecasts["groceries"][1], 40)
+        self.assertEqual(forecasts["home"][3:], (None, None))
+
+    def test_render(self):
+        """Test the text of /forecast."""
+        text = render_forecast(self.totals.project(10), TODAY)
+        self.assertIn("Forecast for April 2024  🔮\nDay 10 of 30", text)
+        self.assertIn("Groceries  $100.00 so far, $300.00 by the end of the month\n \t\t⚠️ The $250.00 budget runs out around 25/04", text)
+        self.assertIn("🚫 The $400.00 budget ran out on 03/04", text)
+        self.assertIn("✅ The $100.00 budget lasts the month", text)
+        self.assertIn("No expenses or budgets this month yet", render_forecast([], TODAY))
+
+
+class TestForecaster(unittest.IsolatedAsyncioTestCase):
+    """Tests for the cached months and how they follow the writes."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        await self.db.add_expenses(CHAT, [("milk", 20, "groceries", "2024-04-01"), ("bus", 5, "transport", "2024-04-02"),
+                                          ("rent", 500, "home", "2024-03-01")])
+        await self.db.set_budget(CHAT, "groceries", 100)
+        self.forecaster = Forecaster(self.db)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def fresh(self):
+        '''The forecast read from the database, to compare with the cached one'''
+        return Month_Totals(2024, 4, await self.db.get_daily_totals(CHAT, *period_bounds(2024, 4)),
+                            await self.db.get_budgets(CHAT)).project(TODAY.day)
+
+    async def test_writes_update_the_cached_month(self):
+        """Test that adds, deletes and budgets change the cached arrays without reading again."""
+        await self.forecaster.forecast(CHAT, TODAY)
+        await self.db.add_expense(CHAT, "bread", 10, "groceries", date(2024, 4, 9))
+        await self.db.add_expenses(CHAT, [("shirt", 30, "clothes", "2024-04-03"), ("old", 99, "clothes", "2024-03-03")])
+        await self.db.add_expense(CHAT, "taxi", 7, "transport", date(2024, 4, 10))
+        await self.db.delete_last_expense(CHAT)
+        await self.db.set_budget(CHAT, "clothes", 50)
+
+        forecasts = await self.forecaster.forecast(CHAT, TODAY)
+        self.assertEqual((self.forecaster.hits, self.forecaster.misses), (1, 1))
+        self.assertEqual(forecasts, await self.fresh())
+        self.assertEqual({forecast[0]: forecast[1] for forecast in forecasts},
+                         {"groceries": 30, "clothes": 30, "transport": 5})
+
+    async def test_journal_reloads_the_month(self):
+        """Test that an undo makes the month load again."""
+        await self.forecaster.forecast(CHAT, TODAY)
+        await self.db.add_expense(CHAT, "bread", 10, "groceries", date(2024, 4, 9))
+        await self.db.undo(CHAT)
+        forecasts = await self.forecaster.forecast(CHAT, TODAY)
+        self.assertEqual(self.forecaster.misses, 2)
+        self.assertEqual(forecasts, await self.fresh())
+
+    async def test_a_new_month_loads_again(self):
+        """Test that the cached month isn't used for another one."""
+        await self.forecaster.forecast(CHAT, TODAY)
+        forecasts = await self.forecaster.forecast(CHAT, date(2024, 3, 31))
+        self.assertEqual(self.forecaster.misses, 2)
+        self.assertEqual(forecasts, [("home", 500, 500, None, None), ("groceries", 0, 0, 100, None)])
+
+    async def test_a_month_racing_a_write_isnt_kept(self):
+        """Test that a month loaded while an expense of its chat was added isn't cached."""
+        load = asyncio.ensure_future(self.forecaster.forecast(CHAT, TODAY))
+        await asyncio.sleep(0) # the load is waiting for the database
+        self.forecaster.on_write('add_expense', (CHAT, "bread", 10, "groceries", date(2024, 4, 9)), True)
+        await load
+        self.forecaster.on_write('add_expense', (CHAT, "bread", 10, "groceries", date(2024, 4, 9)), True)
+        await self.forecaster.forecast(CHAT, TODAY)
+        self.assertEqual(self.forecaster.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
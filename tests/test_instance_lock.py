@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.instanceLock import Instance_Lock, database_lock
+import archiveData
+import importData
+import simulate
+
+
+class TestInstanceLock(unittest.TestCase):
+    """Tests for running a single bot per database."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "money.lock")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_a_second_bot_is_refused(self):
+        """Test that the lock can't be taken twice until it's released."""
+        lock = Instance_Lock(self.path).acquire()
+        with self.assertRaises(RuntimeError):
+            Instance_Lock(self.path).acquire()
+
+        lock.release()
+        Instance_Lock(self.path).acquire().release()
+
+
+    def test_scripts_wont_write_under_the_bot(self):
+        """Test that the scripts writing to a database refuse to run while the bot holds its lock."""
+        db_name = os.path.join(self.tmp.name, "money.db")
+        lock = database_lock(db_name).acquire()
+        self.addCleanup(lock.release)
+        for script, args in ((importData, ["expenses.csv"]), (simulate, ["10"]), (archiveData, [])):
+            with self.subTest(script=script.__name__):
+                with patch.object(sys, "argv", [script.__name__, *args, "--database", db_name]):
+                    with self.assertRaises(SystemExit) as raised:
+                        script.main()
+                self.assertIn("stop the bot first", str(raised.exception))
+        self.assertFalse(os.path.exists(db_name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.messageFormatter import Expenses_Formatter, format_expenses
+
+
+def rows(count, start_id=1):
+    return [(i, f"item {i}", 1.5, "misc", "2024-05-01") for i in range(start_id, start_id + count)]
+
+
+class TestExpensesFormatter(unittest.TestCase):
+    """Tests for rendering expenses into telegram messages."""
+
+    def test_running_total(self):
+        """Test that every line shows the total so far and the last message the total."""
+        messages = list(format_expenses([rows(2), rows(1, start_id=3)], "Spent today"))
+        self.assertEqual(len(messages), 1)
+        self.assertIn("($4.50)", messages[0])
+        self.assertTrue(messages[0].endswith("Total $4.50 in 3 expenses"))
+
+    def test_splits_under_the_limit(self):
+        """Test that long listings are split into messages that fit the limit, losing no line."""
+        messages = list(format_expenses((rows(50, start_id=i) for i in range(1, 1000, 50)), "Spent in 2024", limit=500))
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(message) <= 500 for message in messages))
+        self.assertEqual(sum(message.count("📦") for message in messages), 1000)
+
+    def test_a_page_of_long_items_is_one_message(self):
+        """Test that a page of 20 expenses with very long items fits one message with its title."""
+        long_rows = [(i, "x" * 4000, 1.5, "c" * 500, "2024-05-01") for i in range(1, 21)]
+        formatter = Expenses_Formatter("Spent in May 2024")
+        self.assertEqual(formatter.add(long_rows), [])
+        messages = formatter.close()
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith("💸  Spent in May 2024"))
+        self.assertEqual(messages[0].count("📦"), 20)
+        self.assertIn("X" + "x" * 58 + "…", messages[0])
+
+    def test_messages_come_out_while_feeding(self):
+        """Test that full messages are returned before all the rows are read."""
+        formatter = Expenses_Formatter("Spent in 2024", limit=300)
+        self.assertTrue(formatter.add(rows(20)))
+
+    def test_no_expenses(self):
+        """Test the message for an empty period."""
+        self.assertEqual(list(format_expenses([], "Spent today")), ["💸  Spent today  💸\n\n\nNo expenses 🎉"])
+
+
+if __name__ == '__main__':
+    unittest.main()
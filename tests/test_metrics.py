@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.databaseManager import Database_Manager
+from services.metrics import METRICS, Histogram, Metrics, timed
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests for the latency histograms."""
+
+    def test_quantiles(self):
+        """Test that quantiles are the upper bound of the bucket they fall in."""
+        histogram = Histogram()
+        for seconds in [0.0002] * 98 + [0.03, 20]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.quantile(0.5), 0.00025)
+        self.assertEqual(histogram.quantile(0.99), 0.05)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+        self.assertEqual(histogram.count, 100)
+
+    def test_prometheus_format(self):
+        """Test the text exposition format, with cumulative buckets and escaped labels."""
+        metrics = Metrics()
+        metrics.observe("handler", "/add", 0.002)
+        metrics.observe("handler", "/add", 0.2)
+        metrics.error("sql", 'SELECT "x"')
+        text = metrics.prometheus()
+
+        self.assertIn("# TYPE moneymate_handler_seconds histogram", text)
+        self.assertIn('moneymate_handler_seconds_bucket{handler="/add",le="0.0025"} 1', text)
+        self.assertIn('moneymate_handler_seconds_bucket{handler="/add",le="+Inf"} 2', text)
+        self.assertIn('moneymate_handler_seconds_count{handler="/add"} 2', text)
+        self.assertIn('moneymate_sql_errors_total{statement="SELECT \\"x\\""} 1', text)
+
+    def test_write_prometheus(self):
+        """Test that the file is written whole."""
+        metrics = Metrics()
+        metrics.observe("handler", "/total", 0.01)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.prom")
+            metrics.write_prometheus(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), metrics.prometheus())
+            self.assertEqual(os.listdir(tmp), ["metrics.prom"])
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for timing the handlers and the sql statements."""
+
+    def setUp(self):
+        METRICS.reset()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database_Manager(os.path.join(self.tmp.name, "money.db"))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_statements_are_timed(self):
+        """Test that every statement and commit of Database_Manager is recorded once."""
+        METRICS.reset()
+        self.db.add_expense(CHAT, "coffee", 3, "food")
+        self.db.get_budget(CHAT, "food")
+        self.db.get_budget(CHAT, "food")
+
+        statements = METRICS.snapshot("sql")
+        self.assertEqual(statements["SELECT amount FROM budgets WHERE chat_id = ? AND category = ?"][0], 2)
+        self.assertEqual(statements["INSERT INTO expenses (chat_id, item, amount, category, date) VALUES (?, ?, ?, ?, ?)"][0], 1)
+        self.assertEqual(statements["COMMIT"][0], 1)
+
+    def test_streamed_batches_are_timed_each(self):
+        """Test that every batch of a streamed query is one observation."""
+        self.db.add_expenses(CHAT, [(f"item {i}", 1, "misc", "2024-05-01") for i in range(5)])
+        METRICS.reset()
+        batches = list(self.db.iter_expenses_between(CHAT, "2024-05-01", "2024-06-01", batch_size=2))
+
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sum(count for count, *_ in METRICS.snapshot("sql").values()), 3)
+
+    def test_errors_are_counted(self):
+        """Test that a failing statement is counted as an error."""
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.cursor.execute("SELECT * FROM missing")
+        self.assertEqual(METRICS.get("sql", "SELECT * FROM missing").errors, 1)
+
+    def test_handlers_are_timed(self):
+        """Test that wrapped handlers record their calls and errors."""
+        async def works(update, context):
+            return "done"
+
+        async def fails(update, context):
+            raise ValueError("boom")
+
+        self.assertEqual(asyncio.run(timed("/works", works)(None, None)), "done")
+        with self.assertRaises(ValueError):
+            asyncio.run(timed("/fails", fails)(None, None))
+
+        handlers = METRICS.snapshot("handler")
+        self.assertEqual(handlers["/works"][0], 1)
+        self.assertEqual(handlers["/fails"][4], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.databaseManager import Database_Manager
+from services.randomData import CATEGORIES, generate_expenses, random_spents
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestGenerateExpenses(unittest.TestCase):
+    """Tests for the vectorized random expenses generator."""
+
+    def test_chunks_and_seed(self):
+        """Test the chunk sizes and that a seed always gives the same rows."""
+        chunks = list(generate_expenses(2500, seed=7, chunk_size=1000))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        self.assertEqual(chunks, list(generate_expenses(2500, seed=7, chunk_size=1000)))
+        self.assertNotEqual(chunks[0], next(generate_expenses(2500, seed=8, chunk_size=1000)))
+
+    def test_rows_are_valid_and_in_date_order(self):
+        """Test the rows' categories, items, amounts and dates."""
+        rows = [row for chunk in generate_expenses(3000, start=date(2024, 1, 1), end=date(2024, 3, 31),
+                                                   chunk_size=700) for row in chunk]
+        dates = [row[3] for row in rows]
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreaterEqual(dates[0], "2024-01-01")
+        self.assertLessEqual(dates[-1], "2024-03-31")
+        for item, amount, category, _ in rows:
+            self.assertIn(item, CATEGORIES[category][3])
+            self.assertGreater(amount, 0)
+
+
+class TestRandomSpents(unittest.TestCase):
+    """Tests for bulk loading the simulated expenses."""
+
+    def test_loads_rows_and_rollups(self):
+        """Test that the simulated rows and their rollups end up in the database."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database_Manager(os.path.join(tmp, "money.db"))
+            self.assertEqual(random_spents(db, CHAT, 5000, chunk_size=2000), 5000)
+
+            rows, total = db.cursor.execute("SELECT COUNT(*), SUM(amount) FROM expenses").fetchone()
+            rollup = db.cursor.execute("SELECT SUM(total) FROM monthly_totals").fetchone()[0]
+            self.assertEqual(rows, 5000)
+            self.assertAlmostEqual(total, rollup, places=4)
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+from services.databaseManager import period_bounds
+from services.reports import Reports
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class TestReports(unittest.IsolatedAsyncioTestCase):
+    """Tests for the /total report engine and its cache."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        await self.db.add_expenses(CHAT, [("milk", 2, "groceries", "2024-05-01"), ("bread", 3, "groceries", "2024-05-01"),
+                                          ("bus", 5, "transport", "2024-05-02"), ("rent", 500, "home", "2024-06-01")])
+        self.reports = Reports(self.db)
+        self.may = period_bounds(2024, 5)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_totals_by_category_and_day(self):
+        """Test the report of a month."""
+        report = await self.reports.total(CHAT, *self.may, "in May 2024")
+        self.assertIn("$10.00 in 3 expenses", report)
+        self.assertIn("Groceries  $5.00  (50%)", report)
+        self.assertIn("2024-05-02  $5.00", report)
+
+    async def test_year_is_split_by_month(self):
+        """Test that a year report lists months instead of days."""
+        report = await self.reports.total(CHAT, *period_bounds(2024), "in 2024")
+        self.assertIn("By month:\n 📅 2024-05  $10.00\n 📅 2024-06  $500.00", report)
+
+    async def test_cached_until_the_period_changes(self):
+        """Test that reports are reused, and only writes inside their period invalidate them."""
+        await self.reports.total(CHAT, *self.may, "in May 2024")
+        await self.reports.total(CHAT, *self.may, "in May 2024")
+        self.assertEqual((self.reports.cache.hits, self.reports.cache.misses), (1, 1))
+
+        await self.db.add_expense(CHAT, "chair", 60, "home", date(2024, 6, 2)) # another month
+        await self.reports.total(CHAT, *self.may, "in May 2024")
+        self.assertEqual(self.reports.cache.hits, 2)
+
+        await self.db.add_expense(CHAT, "apples", 4, "groceries", date(2024, 5, 20))
+        report = await self.reports.total(CHAT, *self.may, "in May 2024")
+        self.assertEqual(self.reports.cache.misses, 2)
+        self.assertIn("$14.00 in 4 expenses", report)
+
+        await self.db.delete_last_expense(CHAT)
+        self.assertIn("$10.00 in 3 expenses", await self.reports.total(CHAT, *self.may, "in May 2024"))
+
+    async def test_other_chats_keep_their_reports(self):
+        """Test that a chat's writes only invalidate that chat's reports."""
+        self.assertIn("$0.00 in 0 expenses", await self.reports.total(2, *self.may, "in May 2024"))
+        await self.reports.total(CHAT, *self.may, "in May 2024")
+
+        await self.db.add_expense(2, "apples", 4, "groceries", date(2024, 5, 20))
+        self.assertIn("$10.00 in 3 expenses", await self.reports.total(CHAT, *self.may, "in May 2024"))
+        self.assertIn("$4.00 in 1 expenses", await self.reports.total(2, *self.may, "in May 2024"))
+        self.assertEqual((self.reports.cache.hits, self.reports.cache.misses), (1, 3))
+
+    async def test_report_racing_a_write_is_not_cached(self):
+        """Test that a report computed before a write isn't stored under the new version."""
+        version = self.reports.cache.version(CHAT, *self.may)
+        self.reports.cache.invalidate(CHAT, "2024-05-03")
+        self.reports.cache.put(CHAT, *self.may, "in May 2024", version, "stale")
+        self.assertIsNone(self.reports.cache.get(CHAT, *self.may, "in May 2024"))
+
+    async def test_report_racing_an_undo_is_not_cached(self):
+        """Test that a report of a period never cached, computed before an undo, isn't stored."""
+        version = self.reports.cache.version(CHAT, *self.may)
+        self.reports.cache.on_write('undo', (CHAT, 1), ["add"])
+        self.reports.cache.put(CHAT, *self.may, "in May 2024", version, "stale")
+        self.assertIsNone(self.reports.cache.get(CHAT, *self.may, "in May 2024"))
+
+        version = self.reports.cache.version(CHAT, *self.may)
+        self.reports.cache.on_write('unknown write', (), None)
+        self.reports.cache.put(CHAT, *self.may, "in May 2024", version, "stale")
+        self.assertIsNone(self.reports.cache.get(CHAT, *self.may, "in May 2024"))
+
+
+if __name__ == '__main__':
+    unittest.main()
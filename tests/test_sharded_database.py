@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import date
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.databaseManager import period_bounds
+from services.reports import Reports
+from services.shardedDatabase import Sharded_Database_Manager
+
+
+class ShardedTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Sharded_Database_Manager(self.tmp.name, max_open=2, readers=1)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+
+class TestShardedDatabaseManager(ShardedTestCase):
+    """Tests for keeping every chat in its own database file."""
+
+    async def test_chats_get_their_own_files(self):
+        """Test that each chat is written to its own shard and only sees its own expenses."""
+        await self.db.add_expense(1, "coffee", 3, "food")
+        await self.db.add_expense(2, "rent", 500, "home")
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["chat_1.db", "chat_2.db"])
+        self.assertEqual(await self.db.get_categories(1), ["food"])
+        self.assertEqual(await self.db.get_total_spents(2, "home"), 500)
+
+    async def test_hash_buckets(self):
+        """Test that with a number of shards chats share files by chat_id % shards."""
+        db = Sharded_Database_Manager(self.tmp.name, shards=4, readers=1)
+        await db.add_expense(1, "coffee", 3, "food")
+        await db.add_expense(5, "tea", 2, "food")
+        await db.add_expense(-3, "cake", 4, "food")
+
+        self.assertEqual(os.listdir(self.tmp.name), ["shard_0001.db"])
+        self.assertEqual(await db.get_total_spents(5, "food"), 2)
+        await db.close()
+
+    async def test_least_recently_used_shard_is_closed(self):
+        """Test that only max_open shards stay open and a closed one is reopened with its data."""
+        for chat_id in (1, 2, 3):
+            await self.db.add_expense(chat_id, "item", chat_id, "misc")
+
+        self.assertEqual(list(self.db._open), ["chat_2", "chat_3"])
+        self.assertEqual(self.db.evicted, 1)
+        self.assertEqual(await self.db.get_total_spents(1, "misc"), 1)
+        self.assertEqual(list(self.db._open), ["chat_3", "chat_1"])
+        self.assertEqual(self.db.opened, 4)
+
+    async def test_busy_shards_stay_open(self):
+        """Test that a shard streaming rows isn't closed under its reader."""
+        await self.db.add_expenses(1, [(f"item {i}", 1, "misc", "2024-05-01") for i in range(4)])
+        rows = 0
+        async for batch in self.db.stream('iter_expenses_between', 1, *period_bounds(2024, 5), batch_size=1):
+            for chat_id in (2, 3):
+                await self.db.get_categories(chat_id)
+            self.assertIn("chat_1", self.db._open)
+            rows += len(batch)
+
+        self.assertEqual(rows, 4)
+        await self.db.get_categories(4)
+        self.assertLessEqual(len(self.db._open), 2)
+
+    async def test_writes_of_different_shards_run_in_parallel(self):
+        """Test that a slow write on one chat doesn't hold up another chat."""
+        for chat_id in (1, 2):
+            await self.db.set_budget(chat_id, "food", 10)
+            writer = self.db._open[f"chat_{chat_id}"]._writer
+            original = writer.set_budget
+
+            def slow_set_budget(*args, original=original):
+                time.sleep(0.3)
+                return original(*args)
+
+            writer.set_budget = slow_set_budget
+
+        start = time.perf_counter()
+        await asyncio.gather(self.db.set_budget(1, "food", 20), self.db.set_budget(2, "food", 30))
+        self.assertLess(time.perf_counter() - start, 0.55)
+        self.assertEqual(await self.db.get_budget(2, "food"), 30)
+
+    async def test_listeners_follow_every_shard(self):
+        """Test that write listeners, like the report cache, see the writes of shards opened later."""
+        reports = Reports(self.db)
+        may = period_bounds(2024, 5)
+        self.assertIn("$0.00 in 0 expenses", await reports.total(3, *may, "in May 2024"))
+        await self.db.add_expense(3, "apples", 4, "groceries", date(2024, 5, 20))
+        self.assertIn("$4.00 in 1 expenses", await reports.total(3, *may, "in May 2024"))
+
+
+if __name__ == '__main__':
+    unittest.main()
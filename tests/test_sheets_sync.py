@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.asyncDatabase import Async_Database_Manager
+from services.databaseManager import Database_Manager
+from services.sheetsSync import Sheets_Sync
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+class Fake_Sheet():
+    '''Stands in for services.googleSheets.WorkSheet, failing the first `failures` calls'''
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def append_rows(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sheets is down")
+        self.batches.append(rows)
+
+
+class TestSheetsSync(unittest.IsolatedAsyncioTestCase):
+    """Tests for sending new expenses to google sheets through the outbox."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2, outbox=True)
+        self.sheet = Fake_Sheet()
+        self.sync = Sheets_Sync(self.db, self.sheet, batch_size=2, interval=0.01, max_backoff=0.05)
+
+    async def asyncTearDown(self):
+        await self.sync.stop()
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_expenses_are_queued_with_the_insert(self):
+        """Test that every saved expense is in the outbox, and only when the sync is on."""
+        await self.db.add_expense(CHAT, "coffee", 3, "food", date(2024, 5, 1))
+        await self.db.add_expenses(CHAT, [("milk", 2, "groceries", "2024-05-02")])
+        self.assertEqual([row for _, row in await self.db.get_outbox()],
+                         [(CHAT, "coffee", 3, "food", "2024-05-01"), (CHAT, "milk", 2, "groceries", "2024-05-02")])
+
+        plain = Async_Database_Manager(os.path.join(self.tmp.name, "plain.db"), readers=1)
+        await plain.add_expense(CHAT, "coffee", 3, "food")
+        self.assertEqual(await plain.get_outbox(), [])
+        await plain.close()
+
+    async def test_drain_sends_batches(self):
+        """Test that the outbox is sent in batches of append_rows and emptied."""
+        await self.db.add_expenses(CHAT, [(f"item {i}", i, "misc", "2024-05-01") for i in range(5)])
+        self.assertEqual(await self.sync.drain(), 5)
+
+        self.assertEqual([len(batch) for batch in self.sheet.batches], [2, 2, 1])
+        self.assertEqual(self.sheet.batches[0][0], ["01/05/2024", "item 0", 0, "misc", CHAT])
+        self.assertEqual(await self.db.get_outbox(), [])
+
+    async def test_failed_batches_stay_in_the_outbox(self):
+        """Test that a failed call keeps the expenses for the next attempt."""
+        self.sheet.failures = 1
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        with self.assertRaises(ConnectionError):
+            await self.sync.drain()
+        self.assertEqual(len(await self.db.get_outbox()), 1)
+
+        self.assertEqual(await self.sync.drain(), 1)
+        self.assertEqual(await self.db.get_outbox(), [])
+
+    async def test_deleted_expenses_are_skipped(self):
+        """Test that an expense undone before it was sent never reaches the sheet."""
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        await self.db.delete_last_expense(CHAT)
+        self.assertEqual(await self.sync.drain(), 0)
+        self.assertEqual((self.sheet.batches, await self.db.get_outbox()), ([], []))
+
+    async def test_bulk_loads_are_queued_at_the_end(self):
+        """Test that imported expenses are queued all at once, simulated ones aren't, and the trigger comes back."""
+        def load(db_manager, chat_id, outbox):
+            with db_manager.bulk_load(chat_id, outbox=outbox) as insert:
+                return insert([("milk", 2, "groceries", "2024-05-02"), ("bread", 3, "groceries", "2024-05-02")])
+
+        self.assertEqual(await self.db.run_in_writer(load, CHAT, True), 2)
+        self.assertEqual([row[1] for _, row in await self.db.get_outbox()], ["milk", "bread"])
+        self.assertEqual(await self.db.run_in_writer(load, CHAT, False), 2)
+        self.assertEqual(len(await self.db.get_outbox()), 2)
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        self.assertEqual(len(await self.db.get_outbox()), 3)
+
+    async def test_scripts_leave_the_sync_on(self):
+        """Test that a script opening the bot's database doesn't stop the queueing, and its imports are queued."""
+        script = Database_Manager(os.path.join(self.tmp.name, "money.db"))
+        with script.bulk_load(CHAT) as insert:
+            insert([("milk", 2, "groceries", "2024-05-02")])
+        script.close()
+
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        self.assertEqual([row[1] for _, row in await self.db.get_outbox()], ["milk", "coffee"])
+
+    async def test_journal_doesnt_send_expenses_again(self):
+        """Test that expenses undo, redo and restores bring back aren't queued a second time."""
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        self.assertEqual(await self.sync.drain(), 1)
+        await self.db.clear_all_expenses(CHAT)
+
+        await self.db.undo(CHAT)
+        await self.db.redo(CHAT)
+        await self.db.undo(CHAT)
+        await self.db.restore_expenses(CHAT, datetime(2020, 1, 1))
+        await self.db.undo(CHAT)
+        self.assertEqual(len(await self.db.get_all_expenses(CHAT)), 1)
+        self.assertEqual(await self.db.get_outbox(), [])
+        await self.db.add_expense(CHAT, "tea", 2, "food")
+        self.assertEqual([row[1] for _, row in await self.db.get_outbox()], ["tea"])
+
+    async def test_background_task_retries_with_backoff(self):
+        """Test that the task keeps retrying, backing off, until the sheet accepts the rows."""
+        self.sheet.failures = 3
+        self.sync.start()
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+
+        for _ in range(100):
+            if self.sync.sent:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(self.sync.sent, 1)
+        self.assertEqual(self.sync.failures, 0)
+        self.assertEqual(len(self.sheet.batches), 1)
+
+    def test_backoff_is_capped(self):
+        """Test that the delay doubles with every failure up to max_backoff."""
+        delays = []
+        for failures in range(5):
+            self.sync.failures = failures
+            delays.append(self.sync.delay())
+        self.assertEqual(delays, [0.01, 0.02, 0.04, 0.05, 0.05])
+
+
+if __name__ == '__main__':
+    unittest.main()
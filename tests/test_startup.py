@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+
+# milliseconds `import main` may take, python-telegram-bot alone is around 100-250ms
+IMPORT_BUDGET_MS = float(os.getenv("MONEYMATE_IMPORT_BUDGET_MS", "1000"))
+# only imported by the commands that use them
+LAZY_MODULES = ("numpy", "pandas", "gspread", "pyarrow", "matplotlib")
+
+
+def import_times(module):
+    '''{module: cumulative microseconds} from python -X importtime, in a fresh interpreter'''
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=src_path, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    """Tests keeping the bot's cold start fast."""
+
+    @classmethod
+    def setUpClass(cls):
+        # the best of a few runs, so a busy machine doesn't fail the test
+        runs = [import_times("main") for _ in range(3)]
+        cls.times = min(runs, key=lambda times: times["main"])
+
+    def test_import_time_budget(self):
+        """Test that importing the bot stays under the time budget."""
+        self.assertLess(self.times["main"] / 1000, IMPORT_BUDGET_MS,
+                        f"import main took {self.times['main'] / 1000:.0f}ms")
+
+    def test_heavy_modules_are_lazy(self):
+        """Test that data libraries aren't imported at startup."""
+        loaded = [module for module in LAZY_MODULES if module in self.times]
+        self.assertEqual(loaded, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
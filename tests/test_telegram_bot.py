@@ -0,0 +1,359 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from bot_logic.telegramBot import MoneyMate
+from services.asyncDatabase import Async_Database_Manager
+from services.charts import Charts
+from services.metrics import METRICS, timed
+
+CHAT = 1 # chat the tests' expenses belong to
+
+
+def make_update(text):
+    update = MagicMock()
+    update.effective_chat.id = CHAT
+    update.message = AsyncMock()
+    update.message.text = text
+    return update
+
+
+def make_context(*args):
+    context = MagicMock()
+    context.args = list(args)
+    return context
+
+
+class BotTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        self.money_mate = MoneyMate(self.db)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    def replies(self, update):
+        return [call.kwargs.get("text", call.args[0] if call.args else None)
+                for call in update.message.reply_text.call_args_list]
+
+
+class TestAddSpending(BotTestCase):
+    """Tests for adding expenses from a message."""
+
+    async def test_single_expense(self):
+        """Test that one line adds one expense and reports the missing budget."""
+        update = make_update("Coffee, 3.50, food")
+        await self.money_mate.add_spending(update, make_context())
+
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 3.5)
+        self.assertIn("Added successfully", self.replies(update)[0])
+
+    async def test_failed_expense_isnt_reported_as_added(self):
+        """Test that an expense the database couldn't save is reported as not saved."""
+        update = make_update("Coffee, 3.50, food")
+        with patch.object(self.db, "add_expense", AsyncMock(return_value=False)):
+            await self.money_mate.add_spending(update, make_context())
+
+        self.assertEqual(self.replies(update), ["🚫 The expense couldn't be saved, try again 🚫"])
+
+    async def test_receipt_is_added_in_one_reply(self):
+        """Test that a multi line message is saved in one go with a single summary."""
+        await self.db.set_budget(CHAT, "groceries", 100)
+        update = make_update("Milk, 2, groceries\nBread, 3, groceries\nSoap, 4, home")
+        await self.money_mate.add_spending(update, make_context())
+
+        replies = self.replies(update)
+        self.assertEqual(len(replies), 1)
+        self.assertIn("3 Spents", replies[0])
+        self.assertIn("Your remaining budget for groceries is $95.00", replies[0])
+        self.assertEqual(await self.db.get_total_spents(CHAT, "groceries"), 5)
+        self.assertEqual(await self.db.get_total_spents(CHAT, "home"), 4)
+
+    async def test_receipt_over_budget_adds_nothing(self):
+        """Test that a receipt going over any budget is rejected as a whole."""
+        await self.db.set_budget(CHAT, "groceries", 4)
+        update = make_update("Milk, 2, groceries\nBread, 3, groceries\nSoap, 4, home")
+        await self.money_mate.add_spending(update, make_context())
+
+        self.assertIn("over the budget for groceries", self.replies(update)[0])
+        self.assertEqual(await self.db.get_all_expenses(CHAT), [])
+
+    async def test_receipt_with_invalid_line_adds_nothing(self):
+        """Test that an invalid line is reported and nothing is saved."""
+        update = make_update("Milk, 2, groceries\nBread, three, groceries")
+        await self.money_mate.add_spending(update, make_context())
+
+        self.assertIn("Line 2: amount must be a number", self.replies(update)[0])
+        self.assertEqual(await self.db.get_all_expenses(CHAT), [])
+
+
+class TestSpent(BotTestCase):
+    """Tests for listing the expenses of a period."""
+
+    async def test_month(self):
+        """Test that /spent with a month lists its expenses with the total."""
+        await self.db.add_expenses(CHAT, [("milk", 2, "groceries", "2024-05-01"), ("bread", 3, "groceries", "2024-05-02"),
+                                          ("rent", 500, "home", "2024-06-01")])
+        update = make_update("/spent 5 2024")
+        await self.money_mate.spent(update, make_context("5", "2024"))
+
+        replies = self.replies(update)
+        self.assertEqual(len(replies), 1)
+        self.assertIn("Spent in May 2024", replies[0])
+        self.assertIn("$5.00 in the 2 expenses of this page", replies[0])
+
+    async def test_pages(self):
+        """Test that long periods are paginated and the next button shows the following page."""
+        await self.db.add_expenses(CHAT, [(f"item {i}", 1, "misc", "2024-05-01") for i in range(30)])
+        update = make_update("/spent 5 2024")
+        await self.money_mate.spent(update, make_context("5", "2024"))
+
+        reply = update.message.reply_text.call_args.kwargs
+        self.assertEqual(reply["text"].count("📦"), 20)
+        [[next_button]] = reply["reply_markup"].inline_keyboard
+        self.assertEqual(next_button.callback_data, "spent:20240501:20240601:n:20240501:20")
+
+        update = MagicMock()
+        update.effective_chat.id = CHAT
+        update.callback_query = AsyncMock()
+        update.callback_query.data = next_button.callback_data
+        await self.money_mate.spent_page(update, make_context())
+
+        page = update.callback_query.edit_message_text.call_args.kwargs
+        self.assertIn("Spent in May 2024", page["text"])
+        self.assertEqual(page["text"].count("📦"), 10)
+        [[previous_button]] = page["reply_markup"].inline_keyboard
+        self.assertEqual(previous_button.callback_data, "spent:20240501:20240601:p:20240501:21")
+
+    async def test_invalid_arguments(self):
+        """Test that invalid dates are reported."""
+        update = make_update("/spent may")
+        await self.money_mate.spent(update, make_context("may"))
+        self.assertEqual(self.replies(update), ["All arguments must be numbers"])
+
+
+class TestSearch(BotTestCase):
+    """Tests for /search and its pages."""
+
+    async def test_search_pages(self):
+        """Test that the matches are paginated and the next button reads the search back from the /search message."""
+        await self.db.add_expenses(CHAT, [(f"coffee {i}", 1, "food", "2024-05-01") for i in range(25)] +
+                                         [("tea", 2, "food", "2024-05-01")])
+        update = make_update("/search cof #food 5 2024")
+        await self.money_mate.search(update, make_context("cof", "#food", "5", "2024"))
+
+        reply = update.message.reply_text.call_args.kwargs
+        self.assertTrue(reply["do_quote"])
+        self.assertIn("Search “cof” in Food in May 2024", reply["text"])
+        self.assertEqual(reply["text"].count("📦"), 20)
+        [[next_button]] = reply["reply_markup"].inline_keyboard
+        self.assertEqual(next_button.callback_data, "search:20")
+
+        update = MagicMock()
+        update.effective_chat.id = CHAT
+        update.callback_query = AsyncMock()
+        update.callback_query.data = next_button.callback_data
+        update.callback_query.message.reply_to_message.text = "/search cof #food 5 2024"
+        await self.money_mate.search_page(update, make_context())
+
+        page = update.callback_query.edit_message_text.call_args.kwargs
+        self.assertEqual(page["text"].count("📦"), 5)
+        self.assertIn("Matches 21-25", page["text"])
+        [[previous_button]] = page["reply_markup"].inline_keyboard
+        self.assertEqual(previous_button.callback_data, "search:0")
+
+    async def test_nothing_found(self):
+        """Test the replies without words or without matches."""
+        update = make_update("/search")
+        await self.money_mate.search(update, make_context())
+        await self.money_mate.search(update, make_context("tea"))
+        replies = self.replies(update)
+        self.assertEqual(replies[0], "Format: /search words [#category] [day] [month] [year]")
+        self.assertIn("Nothing found", replies[1])
+
+
+class TestImportFile(BotTestCase):
+    """Tests for importing an uploaded document."""
+
+    async def test_import_csv_document(self):
+        """Test that a csv sent with /import is downloaded and loaded."""
+        async def download_to_drive(path):
+            with open(path, "w") as f:
+                f.write("item,amount,category,date\nmilk,2,groceries,2024-05-01\nbread,3,groceries,2024-05-02\n")
+
+        update = make_update(None)
+        update.message.document.file_name = "receipts.csv"
+        update.message.document.get_file = AsyncMock(return_value=MagicMock(download_to_drive=download_to_drive))
+        status = AsyncMock()
+        update.message.reply_text.return_value = status
+
+        await self.money_mate.import_file(update, make_context())
+
+        status.edit_text.assert_called_with("✅ Imported 2 expenses")
+        self.assertEqual(await self.db.get_month_total(CHAT, "groceries", 2024, 5), 5)
+
+
+class TestExport(BotTestCase):
+    """Tests for /export."""
+
+    async def test_month_as_csv(self):
+        """Test that the expenses of a month are sent back as a csv document."""
+        await self.db.add_expenses(CHAT, [("milk", 2, "groceries", "2024-05-01"), ("bus", 3, "transport", "2024-06-01")])
+        sent = []
+
+        async def reply_document(document, filename):
+            sent.append((filename, document.read().decode()))
+
+        update = make_update("/export 5 2024")
+        update.message.reply_document = reply_document
+        await self.money_mate.export(update, make_context("5", "2024"))
+
+        self.assertEqual(sent, [("expenses_2024-05-01_2024-06-01.csv",
+                                 "id,item,amount,category,date\r\n1,milk,2.0,groceries,2024-05-01\r\n")])
+        update.message.reply_text.return_value.edit_text.assert_called_with("✅ Exported 1 expenses in May 2024")
+
+    async def test_nothing_to_export(self):
+        """Test that an empty period sends no document."""
+        update = make_update("/export jsonl")
+        await self.money_mate.export(update, make_context("jsonl"))
+        update.message.reply_document.assert_not_called()
+        update.message.reply_text.return_value.edit_text.assert_called_with("No expenses of all time to export")
+
+
+class TestUndo(BotTestCase):
+    """Tests for /undo, /redo and /restore."""
+
+    async def test_undo_and_redo_steps(self):
+        """Test that /undo 2 reverts two changes and /redo brings one back."""
+        await self.money_mate.add_spending(make_update("Coffee, 3, food"), make_context())
+        await self.money_mate.add_spending(make_update("Tea, 2, food"), make_context())
+
+        update = make_update("/undo 2")
+        await self.money_mate.undo(update, make_context("2"))
+        self.assertEqual(self.replies(update), ["↩️ Undone: add, add"])
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 0)
+
+        update = make_update("/redo")
+        await self.money_mate.redo(update, make_context())
+        self.assertEqual(self.replies(update), ["↪️ Redone: add"])
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 3)
+
+    async def test_nothing_to_undo(self):
+        """Test the replies of a chat without changes or with a bad number of steps."""
+        update = make_update("/undo")
+        await self.money_mate.undo(update, make_context())
+        await self.money_mate.undo(update, make_context("0"))
+        self.assertEqual(self.replies(update), ["Nothing to undo", "Format: /undo [steps], between 1 and 50"])
+
+    async def test_restore_needs_a_day(self):
+        """Test that /restore asks for a day, month and year."""
+        update = make_update("/restore 5 2024")
+        await self.money_mate.restore(update, make_context("5", "2024"))
+        self.assertEqual(self.replies(update), ["Format: day (1-31) month (1-12) year [HH:MM]"])
+
+
+class TestForecast(BotTestCase):
+    """Tests for /forecast."""
+
+    async def test_forecast_follows_new_expenses(self):
+        """Test that /forecast projects this month's budgets and sees the expenses added after it."""
+        await self.db.set_budget(CHAT, "food", 1000)
+        update = make_update("/forecast")
+        await self.money_mate.forecast(update, make_context())
+        await self.money_mate.add_spending(make_update("Coffee, 3, food"), make_context())
+        await self.money_mate.forecast(update, make_context())
+
+        first, second = self.replies(update)
+        self.assertIn("Food  $0.00 so far", first)
+        self.assertIn("Food  $3.00 so far", second)
+        self.assertIn("The $1,000.00 budget lasts the month", second)
+        self.assertEqual(self.money_mate.forecaster.misses, 1)
+
+
+def fake_render(rows, start, end, path):
+    with open(path, "wb") as f:
+        f.write(b"png")
+
+
+class TestChart(BotTestCase):
+    """Tests for /chart."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.money_mate.charts = Charts(self.db, os.path.join(self.tmp.name, "charts"))
+
+    @patch("services.charts.render_chart", side_effect=fake_render)
+    async def test_a_sent_chart_is_resent_by_its_file_id(self, render):
+        """Test that the first /chart uploads the picture and the next one only sends its file_id."""
+        await self.db.add_expense(CHAT, "coffee", 3, "food")
+        update = make_update("/chart")
+        update.message.reply_photo.return_value = MagicMock(photo=[MagicMock(file_id="small"), MagicMock(file_id="file-1")])
+        await self.money_mate.chart(update, make_context())
+        await self.money_mate.chart(update, make_context())
+
+        first, second = update.message.reply_photo.call_args_list
+        self.assertNotIsInstance(first.kwargs["photo"], str)
+        self.assertEqual(second.kwargs["photo"], "file-1")
+        self.assertIn("Spent in", second.kwargs["caption"])
+        self.assertEqual(render.call_count, 1)
+
+    async def test_nothing_to_chart(self):
+        """Test that a period without expenses is told instead of drawn."""
+        update = make_update("/chart 5 2024")
+        await self.money_mate.chart(update, make_context("5", "2024"))
+        self.assertEqual(self.replies(update), ["No expenses in May 2024 to chart"])
+
+
+class TestSimulate(BotTestCase):
+    """Tests for /simulate."""
+
+    async def test_other_chats_are_refused(self):
+        """Test that /simulate is an unknown command outside the admin chats."""
+        update = make_update("/simulate 10")
+        await self.money_mate.random_spents(update, make_context("10"))
+        self.assertEqual(self.replies(update), ["Sorry, I didn't understand that command."])
+        self.assertEqual(await self.db.get_categories(CHAT), [])
+
+    async def test_admins_are_limited(self):
+        """Test that even an admin can't tie up the writer with a huge simulation from the chat."""
+        self.money_mate.admins = {CHAT}
+        update = make_update("/simulate 50000000")
+        await self.money_mate.random_spents(update, make_context("50000000"))
+        self.assertIn("use simulate.py", self.replies(update)[0])
+
+
+class TestStats(BotTestCase):
+    """Tests for the /stats admin command."""
+
+    async def test_admins_see_the_latencies(self):
+        """Test that an admin chat gets the handler and sql figures."""
+        self.money_mate.admins = {CHAT}
+        # only this test's figures, not the schema statements of every database opened so far
+        METRICS.reset()
+        await timed("/add", self.money_mate.add_spending)(make_update("Coffee, 3.50, food"), make_context())
+        update = make_update("/stats")
+        await self.money_mate.stats(update, make_context())
+
+        reply = self.replies(update)[0]
+        self.assertIn("/add  1", reply)
+        self.assertIn("INSERT INTO expenses", reply)
+
+    async def test_other_chats_are_refused(self):
+        """Test that /stats is an unknown command outside the admin chats."""
+        update = make_update("/stats")
+        await self.money_mate.stats(update, make_context())
+        self.assertEqual(self.replies(update), ["Sorry, I didn't understand that command."])
+
+
+if __name__ == '__main__':
+    unittest.main()
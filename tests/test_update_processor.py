@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.updateProcessor import Chat_Update_Processor
+
+CHAT = 1 # chat the tests' updates belong to
+
+
+def make_update(chat_id=CHAT):
+    update = MagicMock()
+    if chat_id is None:
+        update.effective_chat = None
+    else:
+        update.effective_chat.id = chat_id
+    update.effective_message.reply_text = AsyncMock()
+    return update
+
+
+class TestChatUpdateProcessor(unittest.IsolatedAsyncioTestCase):
+    """Tests for handling the updates of different chats at once and of each chat in order."""
+
+    async def asyncSetUp(self):
+        self.processor = Chat_Update_Processor(workers=4, chat_queue_size=2)
+        self.log = []
+        self.running = set()
+        self.most_running = 0
+
+    async def handle(self, name, chat_id, release=None):
+        # what a handler does, noting when it runs and whether another one of its chat ran meanwhile
+        self.assertNotIn(chat_id, self.running)
+        self.running.add(chat_id)
+        self.most_running = max(self.most_running, len(self.running))
+        self.log.append(f"start {name}")
+        if release is not None:
+            await release.wait()
+        await asyncio.sleep(0)
+        self.log.append(f"end {name}")
+        self.running.discard(chat_id)
+
+    def submit(self, name, chat_id=CHAT, release=None):
+        update = make_update(chat_id)
+        return asyncio.ensure_future(
+            self.processor.process_update(update, self.handle(name, chat_id, release)))
+
+    async def test_a_chat_is_handled_in_order(self):
+        """Test that the updates of a chat run one at a time, in the order they came."""
+        self.processor = Chat_Update_Processor(workers=4, chat_queue_size=3)
+        await asyncio.gather(*[self.submit(name) for name in ("add", "add again", "undo")])
+        await self.processor.join()
+
+        self.assertEqual(self.log, ["start add", "end add", "start add again", "end add again", "start undo", "end undo"])
+        self.assertEqual(self.processor._lanes, {})
+
+    async def test_chats_are_handled_at_once(self):
+        """Test that a slow update of a chat doesn't hold up the other chats."""
+        release = asyncio.Event()
+        await self.submit("slow spent", release=release)
+        await self.submit("other chat", chat_id=2)
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        self.assertEqual(self.log, ["start slow spent", "start other chat", "end other chat"])
+        release.set()
+        await self.processor.join()
+
+    async def test_workers_bound_the_handlers_running(self):
+        """Test that no more than workers handlers run at once."""
+        release = asyncio.Event()
+        await asyncio.gather(*[self.submit(f"chat {chat_id}", chat_id=chat_id, release=release) for chat_id in range(10)])
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertEqual(len(self.running), 4)
+        release.set()
+        await self.processor.join()
+        self.assertEqual(self.most_running, 4)
+
+    async def test_a_flooding_chat_is_full(self):
+        """Test that a chat with chat_queue_size updates pending is reported full, and only that chat."""
+        release = asyncio.Event()
+        await asyncio.gather(*[self.submit(name, release=release) for name in ("first", "second")])
+
+        self.assertTrue(self.processor.full(make_update()))
+        self.assertFalse(self.processor.full(make_update(2)))
+        self.assertFalse(self.processor.full(make_update(None)))
+        release.set()
+        await self.processor.join()
+        self.assertFalse(self.processor.full(make_update()))
+
+    async def test_a_full_chat_drops_its_next_updates(self):
+        """Test that the updates of a full chat are dropped right away and the chat is told once."""
+        release = asyncio.Event()
+        await asyncio.gather(*[self.submit(name, release=release) for name in ("first", "second")])
+        third, fourth = make_update(), make_update()
+        await self.processor.process_update(third, self.handle("third", CHAT))
+        await self.processor.process_update(fourth, self.handle("fourth", CHAT))
+
+        release.set()
+        await self.processor.join()
+        self.assertEqual(self.log, ["start first", "end first", "start second", "end second"])
+        self.assertEqual(self.processor.dropped, 2)
+        third.effective_message.reply_text.assert_awaited_once()
+        fourth.effective_message.reply_text.assert_not_awaited()
+
+        # once the chat caught up its updates are taken again, and told again when it floods again
+        release = asyncio.Event()
+        await asyncio.gather(*[self.submit(name, release=release) for name in ("fifth", "sixth")])
+        seventh = make_update()
+        await self.processor.process_update(seventh, self.handle("seventh", CHAT))
+        release.set()
+        await self.processor.join()
+        seventh.effective_message.reply_text.assert_awaited_once()
+
+    async def test_a_full_chat_doesnt_hold_up_the_others(self):
+        """Test that an update of another chat is handled while a chat is full."""
+        release = asyncio.Event()
+        await asyncio.gather(*[self.submit(name, release=release) for name in ("first", "second")])
+        await self.processor.process_update(make_update(), self.handle("dropped", CHAT))
+        await self.submit("other", chat_id=2)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertIn("end other", self.log)
+
+        release.set()
+        await self.processor.join()
+        self.assertNotIn("start dropped", self.log)
+
+    async def test_shutdown_cancels_what_is_left(self):
+        """Test that the updates still pending at the shutdown are cancelled and their chat is cleared."""
+        release = asyncio.Event()
+        await asyncio.gather(self.submit("first", release=release), self.submit("second"))
+        await asyncio.sleep(0)
+        await self.processor.shutdown()
+
+        self.assertEqual(self.log, ["start first"])
+        self.assertEqual(self.processor._lanes, {})
+
+    async def test_updates_without_a_chat(self):
+        """Test that updates without a chat are handled without a lane."""
+        await self.submit("inline query", chat_id=None)
+        await self.processor.join()
+        self.assertEqual(self.log, ["start inline query", "end inline query"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from telegram import User
+from telegram.ext import ApplicationBuilder, ExtBot
+
+# the bot is run from src/bot, so its modules import each other from there
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'bot')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from bot_logic.telegramBot import MoneyMate
+from handlers import registerHandlers
+from services.asyncDatabase import Async_Database_Manager
+from services.updateProcessor import Chat_Update_Processor
+from services.webhook import Webhook_Server
+
+CHAT = 1 # chat the tests' expenses belong to
+SECRET = "webhook-secret"
+
+
+def recorded(update_id, text, chat_id=CHAT):
+    '''An update as telegram posts it for a text message'''
+    message = {"message_id": update_id, "date": 1717200000, "text": text,
+               "chat": {"id": chat_id, "type": "private", "first_name": "Ana"},
+               "from": {"id": chat_id, "is_bot": False, "first_name": "Ana"}}
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+async def get_me(bot, *args, **kwargs):
+    # the bot is initialized without asking telegram who it is
+    bot._bot_user = User(42, "Money Mate", True, username="money_mate_bot")
+    return bot._bot_user
+
+
+class TestWebhookServer(unittest.IsolatedAsyncioTestCase):
+    """Tests for serving the bot through the webhook, with recorded updates posted to it."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        patcher = patch.object(ExtBot, "get_me", get_me)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(ExtBot, "send_message", AsyncMock())
+        self.send_message = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.application = ApplicationBuilder().token("42:TEST").build()
+        registerHandlers(self.application, MoneyMate(self.db))
+        await self.application.initialize()
+        self.server = Webhook_Server(self.application.bot, self.application.process_update, host="127.0.0.1",
+                                     port=0, secret_token=SECRET, workers=2)
+        await self.server.start()
+        self.url = f"http://127.0.0.1:{self.server.port}/telegram"
+        self.client = httpx.AsyncClient(headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        await self.server.stop()
+        await self.application.shutdown()
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_posted_updates_are_handled(self):
+        """Test that recorded updates are answered right away and handled by the bot."""
+        updates = [recorded(1, "Coffee, 3, food"), recorded(2, "Bus, 2, transport"), recorded(3, "Tea, 1, food", chat_id=2)]
+        for update in updates:
+            response = await self.client.post(self.url, json=update)
+            self.assertEqual(response.status_code, 200)
+        await self.server.stop()
+
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 3)
+        self.assertEqual(await self.db.get_total_spents(CHAT, "transport"), 2)
+        self.assertEqual(await self.db.get_total_spents(2, "food"), 1)
+        chats = [call.kwargs["chat_id"] for call in self.send_message.call_args_list]
+        self.assertEqual(sorted(set(chats)), [CHAT, 2])
+
+    async def test_commands_are_routed(self):
+        """Test that a command posted to the webhook reaches its handler."""
+        await self.client.post(self.url, json=recorded(1, "/categories"))
+        await self.server.stop()
+        self.send_message.assert_awaited()
+
+    async def test_requests_without_the_secret_are_refused(self):
+        """Test that a request missing the secret token is refused and not handled."""
+        async with httpx.AsyncClient() as client:
+            response = await client.post(self.url, json=recorded(1, "Coffee, 3, food"))
+        await self.server.stop()
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 0)
+
+    async def test_bad_requests(self):
+        """Test that anything but an update posted to the webhook path is refused."""
+        self.assertEqual((await self.client.post(self.url.replace("/telegram", "/other"), json=recorded(1, "x"))).status_code, 404)
+        self.assertEqual((await self.client.get(self.url)).status_code, 405)
+        self.assertEqual((await self.client.post(self.url, content=b"not json")).status_code, 400)
+        for body in (b"[1, 2]", b"5", b'"x"', b"null", b"{}"):
+            self.assertEqual((await self.client.post(self.url, content=body)).status_code, 400)
+        self.assertEqual(self.server.received, 0)
+
+
+class TestWebhookWithProcessor(unittest.IsolatedAsyncioTestCase):
+    """Tests for the webhook passing the updates to an application handling the chats at once, like main does."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Async_Database_Manager(os.path.join(self.tmp.name, "money.db"), readers=2)
+        for name, mock in (("get_me", get_me), ("send_message", AsyncMock())):
+            patcher = patch.object(ExtBot, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.processor = Chat_Update_Processor(workers=4, chat_queue_size=16)
+        self.application = (ApplicationBuilder().token("42:TEST").update_queue(asyncio.Queue(4))
+                            .concurrent_updates(self.processor).build())
+        registerHandlers(self.application, MoneyMate(self.db))
+        await self.application.initialize()
+        await self.application.start()
+        self.server = Webhook_Server(self.application.bot, self.application.update_queue.put, host="127.0.0.1",
+                                     port=0, workers=1, full=self.processor.full)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_undo_follows_the_expense_it_undoes(self):
+        """Test that the updates of a chat are handled in order among the other chats' updates."""
+        updates = [recorded(1, "Coffee, 3, food"), recorded(2, "Tea, 1, food", chat_id=2),
+                   recorded(3, "Bus, 2, transport"), recorded(4, "Milk, 2, food", chat_id=3), recorded(5, "/undo")]
+        async with httpx.AsyncClient() as client:
+            for update in updates:
+                response = await client.post(f"http://127.0.0.1:{self.server.port}/telegram", json=update)
+                self.assertEqual(response.status_code, 200)
+        await self.server.stop()
+        await self.application.stop()
+        await self.processor.join()
+        await self.application.shutdown()
+
+        self.assertEqual(await self.db.get_total_spents(CHAT, "food"), 3)
+        self.assertEqual(await self.db.get_total_spents(CHAT, "transport"), 0)
+        self.assertEqual(await self.db.get_total_spents(2, "food"), 1)
+        self.assertEqual(await self.db.get_total_spents(3, "food"), 2)
+
+
+class TestBackpressure(unittest.IsolatedAsyncioTestCase):
+    """Tests for the bounded queue of the webhook."""
+
+    async def test_a_full_queue_asks_telegram_to_retry(self):
+        """Test that updates over the queue size are answered with 503 and the queued ones are processed on stop."""
+        release = asyncio.Event()
+        processed = []
+
+        async def process(update):
+            await release.wait()
+            processed.append(update.update_id)
+
+        server = Webhook_Server(None, process, host="127.0.0.1", port=0, workers=1, queue_size=1)
+        await server.start()
+        url = f"http://127.0.0.1:{server.port}/telegram"
+        async with httpx.AsyncClient() as client:
+            statuses = []
+            for update_id in (1, 2, 3):
+                statuses.append((await client.post(url, json=recorded(update_id, "Coffee, 3, food"))).status_code)
+                await asyncio.sleep(0.01) # the worker takes the first update meanwhile
+        release.set()
+        await server.stop()
+
+        self.assertEqual(statuses, [200, 200, 503])
+        self.assertEqual(processed, [1, 2])
+        self.assertEqual(server.rejected, 1)
+
+    async def test_a_flooding_chat_is_refused(self):
+        """Test that an update of a chat reported full is answered with 503 while the other chats go on."""
+        processed = []
+
+        async def process(update):
+            processed.append(update.update_id)
+
+        server = Webhook_Server(None, process, host="127.0.0.1", port=0, full=lambda update: update.effective_chat.id == CHAT)
+        await server.start()
+        url = f"http://127.0.0.1:{server.port}/telegram"
+        async with httpx.AsyncClient() as client:
+            flooding = await client.post(url, json=recorded(1, "Coffee, 3, food"))
+            other = await client.post(url, json=recorded(2, "Coffee, 3, food", chat_id=2))
+        await server.stop()
+
+        self.assertEqual((flooding.status_code, other.status_code), (503, 200))
+        self.assertEqual(processed, [2])
+
+
+if __name__ == '__main__':
+    unittest.main()